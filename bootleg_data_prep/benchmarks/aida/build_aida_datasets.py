@@ -24,6 +24,7 @@ import shutil
 import copy
 
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
+from bootleg_data_prep.utils.classes.title_index import get_title_index
 from bootleg_data_prep.utils.constants import PREFIX_DELIM
 
 
@@ -89,11 +90,10 @@ def get_title_to_new_title(args):
 
 class QIDMapper:
 
-    def __init__(self, aida_to_wpid, wpid2qid, title2qid, title2new_title):
+    def __init__(self, aida_to_wpid, title_index, title2new_title):
 
         self.aida_to_wpid =  aida_to_wpid # maps AIDA title to Wikipedia page ID
-        self.wpid2qid = wpid2qid # maps wpid to QID
-        self.title2qid = title2qid # maps wikipedia page title to QID
+        self.title_index = title_index # maps wpid and wikipedia page title to QID
         self.title2new_title = title2new_title # maps [old] wikipedia page title to new title (frequently result of redirect)
 
     def get_qid_from_url(self, url):
@@ -102,18 +102,21 @@ class QIDMapper:
         # Get QID based on WPID
         if title in self.aida_to_wpid:
             wpid = self.aida_to_wpid[title]
-            if wpid in self.wpid2qid:
-                return self.wpid2qid[wpid]
+            qid = self.title_index.get_wpid_qid(wpid)
+            if qid != prep_utils.NO_QID:
+                return prep_utils.decode_qid(qid)
 
         # Get QID based on title
-        if title in self.title2qid:
-            return self.title2qid[title]
+        qid = self.title_index.get_title_qid(title)
+        if qid != prep_utils.NO_QID:
+            return prep_utils.decode_qid(qid)
 
         # Get redirected title
         if title in self.title2new_title:
             title = self.title2new_title[title]
-            if title in self.title2qid:
-                return self.title2qid[title]
+            qid = self.title_index.get_title_qid(title)
+            if qid != prep_utils.NO_QID:
+                return prep_utils.decode_qid(qid)
 
         return "None"
 
@@ -433,9 +436,9 @@ def main():
 
     aida_to_wpid = get_aida_title_to_wpid(args)
     title2new_title = get_title_to_new_title(args)
-    title_to_qid, qid_to_all_titles, wpid_to_qid, qid_to_title = prep_utils.load_qid_title_map(args.title_to_qid)
+    title_index = get_title_index(args.title_to_qid)
 
-    qm = QIDMapper(aida_to_wpid, wpid_to_qid, title_to_qid, title2new_title)
+    qm = QIDMapper(aida_to_wpid, title_index, title2new_title)
     load_and_dump_sentences(args, qm)
 
 if __name__ == '__main__':
@@ -13,6 +13,7 @@ sys.path.append(os.path.join(sys.path[0], "../"))
 import argparse
 from language import ENSURE_ASCII
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
+from bootleg_data_prep.utils.classes.title_index import get_title_index
 
 
 def parse_args():
@@ -44,10 +45,9 @@ def get_title_to_wpid(args):
 
 class QIDMapper:
 
-    def __init__(self, wpid2qid, title2qid, redirect_title2wpid):
+    def __init__(self, title_index, redirect_title2wpid):
         
-        self.wpid2qid = wpid2qid # maps wpid to QID
-        self.title2qid = title2qid # maps wikipedia page title to QID 
+        self.title_index = title_index # maps wpid and wikipedia page title to QID
         self.redirect_title2wpid = redirect_title2wpid # maps [old] wikipedia page title to WPID (frequently result of redirect)
 
 
@@ -55,18 +55,20 @@ class QIDMapper:
     def get_qid(self, title, wpid): 
 
         # Get QID based on title 
-        if title in self.title2qid:
-            return self.title2qid[title]
+        qid = self.title_index.get_title_qid(title)
+        if qid != prep_utils.NO_QID:
+            return prep_utils.decode_qid(qid)
         
         # Get redirected title 
         if title in self.redirect_title2wpid: 
-            wpid = self.redirect_title2wpid[title]
-            if wpid in self.wpid2qid:
-                return self.wpid2qid[title]
+            qid = self.title_index.get_wpid_qid(self.redirect_title2wpid[title])
+            if qid != prep_utils.NO_QID:
+                return prep_utils.decode_qid(qid)
 
         # Get based on WPID
-        if wpid in self.wpid2qid:
-            return self.wpid2qid[wpid]
+        qid = self.title_index.get_wpid_qid(wpid)
+        if qid != prep_utils.NO_QID:
+            return prep_utils.decode_qid(qid)
     
         return None 
         
@@ -108,8 +110,8 @@ def main():
     print(json.dumps(vars(args), indent=4))
 
     redirect_title2wpid = get_title_to_wpid(args)
-    title2qid, wpid2qid, _ = prep_utils.load_qid_title_map(args.title_to_qid, lower_case = False)
-    qm = QIDMapper(wpid2qid, title2qid, redirect_title2wpid)
+    title_index = get_title_index(args.title_to_qid)
+    qm = QIDMapper(title_index, redirect_title2wpid)
 
     cands = process_files(qm, args)
     out_dir = prep_utils.get_outdir(args.data_dir, args.out_dir)
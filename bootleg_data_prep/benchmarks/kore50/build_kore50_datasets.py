@@ -12,6 +12,7 @@ sys.path.append(os.path.join(sys.path[0], "../../../"))
 import argparse
 
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
+from bootleg_data_prep.utils.classes.title_index import get_title_index
 from language import ENSURE_ASCII
 
 SUB_DELIM = "~*~"
@@ -58,16 +59,17 @@ def get_aida_title_to_wpid(args):
 
 class QIDMapper:
 
-    def __init__(self, title2qid):
+    def __init__(self, title_index):
         
-        self.title2qid = title2qid # maps wikipedia page title to QID 
+        self.title_index = title_index # maps wikipedia page title to QID 
 
     def get_qid_from_url(self, url, langid):
         title = get_title_from_url(url, langid)
 
         # Get QID based on title 
-        if title in self.title2qid:
-            return self.title2qid[title]
+        qid = self.title_index.get_title_qid(title)
+        if qid != prep_utils.NO_QID:
+            return prep_utils.decode_qid(qid)
 
         print(f"No QID for {title}.")
         return "None"
@@ -196,9 +198,9 @@ def main():
     args = parse_args()
     print(json.dumps(vars(args), indent=4))
 
-    title2qid, _, _, _ = prep_utils.load_qid_title_map(args.title_to_qid)
+    title_index = get_title_index(args.title_to_qid)
 
-    qm = QIDMapper(title2qid)
+    qm = QIDMapper(title_index)
     load_and_dump_sentences(args, qm)
 
 
@@ -27,6 +27,7 @@ import requests
 import re 
 
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
+from bootleg_data_prep.utils.classes.title_index import get_title_index
 
 
 TITLE_MAP = {}
@@ -91,10 +92,9 @@ class Sentence:
 
 class QIDMapper:
 
-    def __init__(self, title2qid, wpid_to_qid, args):
+    def __init__(self, title_index, args):
         self.args = args
-        self.title2qid = title2qid # maps wikipedia page title to QID 
-        self.wpid_to_qid = wpid_to_qid # maps wikipedia page ID to QID
+        self.title_index = title_index # maps wikipedia page title and page ID to QID
 
         self.title_redirect = {}
         if os.path.exists(args.redirect_map):
@@ -104,12 +104,14 @@ class QIDMapper:
         title = get_title_from_url(url)
 
         # Get QID based on title 
-        if title in self.title2qid:
-            return self.title2qid[title]
+        qid = self.title_index.get_title_qid(title)
+        if qid != prep_utils.NO_QID:
+            return prep_utils.decode_qid(qid)
         else: 
             wpid = self.get_page_id(title)
-            if str(wpid) in self.wpid_to_qid:
-                return self.wpid_to_qid[str(wpid)]
+            qid = self.title_index.get_wpid_qid(wpid)
+            if qid != prep_utils.NO_QID:
+                return prep_utils.decode_qid(qid)
 
         print(f"No QID for {title} ({url})")
         return None
@@ -270,10 +272,8 @@ def main():
     args = parse_args()
     print(json.dumps(vars(args), indent=4))
     
-    title_to_qid, qid_to_all_titles, wpid_to_qid, qid_to_title = prep_utils.load_qid_title_map(args.title_to_qid)
-    # title_to_qid = {}
-    # wpid_to_qid = {}
-    qm = QIDMapper(title_to_qid, wpid_to_qid, args)
+    title_index = get_title_index(args.title_to_qid)
+    qm = QIDMapper(title_index, args)
     load_and_dump_sentences(args, qm)
     qm.dump()
 
@@ -18,6 +18,7 @@ from SPARQLWrapper import SPARQLWrapper, JSON
 
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
 from bootleg_data_prep.utils import utils
+from bootleg_data_prep.utils.classes.title_index import get_title_index
 
 NO_WIKI_ID = "-2"
 manual_mappings = {
@@ -44,7 +45,7 @@ def parse_args():
     args = parser.parse_args()
     return args
 
-def get_qid(url, title2qid, wpid2qid, sparql):
+def get_qid(url, title_index, sparql):
     if "/notInWiki/" in url:
         return NO_WIKI_ID
     if str(url) in manual_mappings:
@@ -60,9 +61,9 @@ def get_qid(url, title2qid, wpid2qid, sparql):
         pred = res['p']
         if obj['value'] == 'http://dbpedia.org/ontology/wikiPageID':
             wikiid = pred['value']
-            qid = wpid2qid.get(str(wikiid))
-            if qid is not None and qid != "-1":
-                possible_qid = qid
+            qid = title_index.get_wpid_qid(wikiid)
+            if qid != prep_utils.NO_QID:
+                possible_qid = prep_utils.decode_qid(qid)
             else:
                 print(f"WPID {wikiid} not found with url {url}")
         if obj['value'] == "http://dbpedia.org/ontology/wikiPageRedirects":
@@ -77,9 +78,9 @@ def get_qid(url, title2qid, wpid2qid, sparql):
                 pred = res['p']
                 if obj['value'] == 'http://dbpedia.org/ontology/wikiPageID':
                     wikiid = pred['value']
-                    qid = wpid2qid.get(wikiid)
-                    if qid is not None and qid != "-1":
-                        possible_qid = qid
+                    qid = title_index.get_wpid_qid(wikiid)
+                    if qid != prep_utils.NO_QID:
+                        possible_qid = prep_utils.decode_qid(qid)
                     else:
                         print(f"WPID (take2) {wikiid} not found with url {new_url}")
     if possible_qid != "-1":
@@ -87,10 +88,10 @@ def get_qid(url, title2qid, wpid2qid, sparql):
     # If that doesn't work, let's try query the title directly
     def success(head, body):
         for_map = f"{head} {' '.join(body)}".strip()
-        qid = title2qid.get(for_map)
-        if not qid or qid == "-1":
-            return False, qid
-        return True, qid
+        qid = title_index.get_title_qid(for_map)
+        if qid == prep_utils.NO_QID:
+            return False, None
+        return True, prep_utils.decode_qid(qid)
     print(f"Tying to match exact title {url}")
     # remove html characters
     title = url.rsplit("/")[-1]
@@ -199,7 +200,7 @@ def convert_dump_to_jsonl(args, parsed_dict, wiki_filter):
     return sentences
 
 
-def load_and_dump_sentences(args, title2qid, wpid2qid, sparql, g):
+def load_and_dump_sentences(args, title_index, sparql, g):
     parsed_dict = {}
     all_qids = set()
     for stmt in tqdm(g):
@@ -235,7 +236,7 @@ def load_and_dump_sentences(args, title2qid, wpid2qid, sparql, g):
             assert 'sentence' not in parsed_dict[key][sort_order], f"Current dict is {parsed_dict[key][sort_order]}"
             parsed_dict[key][sort_order]["sentence"] = sent
         elif part == "taIdentRef":
-            qid = get_qid(tail, title2qid, wpid2qid, sparql)
+            qid = get_qid(tail, title_index, sparql)
             assert 'qid' not in parsed_dict[key][sort_order], f"Current dict is {parsed_dict[key][sort_order]}"
             parsed_dict[key][sort_order]["qid"] = qid
             all_qids.add(qid)
@@ -262,9 +263,7 @@ def load_and_dump_sentences(args, title2qid, wpid2qid, sparql, g):
 def main():
     args = parse_args()
     print(json.dumps(vars(args), indent=4))
-    title2qid, _, wpid2qid, _ = prep_utils.load_qid_title_map(args.title_to_qid)
-    # title2qid = {}
-    # wpid2qid = {}
+    title_index = get_title_index(args.title_to_qid)
     # utils.ensure_dir(args.out_dir)
     # env1 = lmdb.open(args.title_to_qid_lmdb, map_size=107374182400, readonly=True)
     # txn_title = env1.begin()
@@ -277,7 +276,7 @@ def main():
 
     g = Graph()
     g.parse(args.dataset, format="nt")
-    load_and_dump_sentences(args, title2qid, wpid2qid, sparql, g)
+    load_and_dump_sentences(args, title_index, sparql, g)
     # env1.close()
     # env2.close()
 
@@ -289,16 +288,4 @@ if __name__ == '__main__':
 select ?s ?o ?p where {
 filter( regex(str(?x), "exam" ))
 }
-
-import lmdb
-import bootleg_data_prep.utils.data_prep_utils as prep_utils
-env = lmdb.open('wpid2qid_db', map_size=107374182400)
-txn = env.begin(write = True)
-_, wpid2qid, _ = prep_utils.load_qid_title_map('/lfs/raiders7/0/lorr1/title_to_all_ids.jsonl', lower_case = False)
-
-for wpid in wpid2qid:
-    qid = wpid2qid[wpid]
-    if qid == "-1" or qid == -1 or wpid == -1:
-        continue
-    txn.put(wpid.encode(), qid.encode())
 '''
\ No newline at end of file
@@ -28,6 +28,8 @@ from bootleg.symbols.entity_profile import EntityProfile
 from bootleg.symbols.type_symbols import TypeSymbols
 from bootleg.symbols.kg_symbols import KGSymbols
 
+from bootleg_data_prep.utils.qid_sorted_store import store_generator
+
 # Properties that are used for types
 # P31 = instance of
 # P279 = subclass of
@@ -39,8 +41,8 @@ def parse_args():
     parser.add_argument('--subfolder_name', type=str, default="filtered_data")
     parser.add_argument('--max_types', type=int, default=3)
     parser.add_argument('--max_relations', type=int, default=50)
-    parser.add_argument('--ent_desc', type=str, default="qid2desc.json")
-    parser.add_argument('--kg_triples', type=str, default='kg_triples.json')
+    parser.add_argument('--ent_desc', type=str, default="qid2desc", help='qid2desc store directory (or older qid2desc.json file)')
+    parser.add_argument('--kg_triples', type=str, default='kg_triples', help='kg triples store directory (or older kg_triples.json file)')
     parser.add_argument('--kg_vocab', type=str, default='utils/param_files/pid_names_en.json')
     parser.add_argument('--wd_vocab', type=str, default='wikidatatitle_to_typeid.json')
     parser.add_argument('--wd_types', type=str, default='wikidata_types.json')
@@ -52,8 +54,10 @@ def create_entity_profile(args, entity_symbols):
     print("Writing out descriptions")
     qid2desc_path = args.ent_desc
     if os.path.exists(qid2desc_path):
-        print("Found qid2desc.json. Creating entity symbols")
-        qid2desc = json.load(open(qid2desc_path))
+        print(f"Found {qid2desc_path}. Creating entity symbols")
+        # the descriptions are streamed, so only the ones of entity symbols QIDs are held in memory
+        all_qids = set(entity_symbols.get_all_qids())
+        qid2desc = {qid: desc for qid, desc in track(store_generator(qid2desc_path), description="Filt qid2desc") if qid in all_qids}
         entity_symbols = EntitySymbols(
             alias2qids=entity_symbols.get_alias2qids_dict(),
             qid2title=entity_symbols.get_qid2title_dict(),
@@ -63,14 +67,15 @@ def create_entity_profile(args, entity_symbols):
 
     # KG relations
     kg_vocab = json.load(open(args.kg_vocab))
-    all_relations = json.load(open(args.kg_triples))
-    qid2relations = {}
-    for head_qid in track(entity_symbols.get_all_qids(), total=len(entity_symbols.get_all_qids()), description="Filt qid2rels"):
-        qid2relations[head_qid] = {}
-        for rel in all_relations.get(head_qid, {}):
+    qid2relations = {q: {} for q in entity_symbols.get_all_qids()}
+    # the triples are streamed, so only the relations of entity symbols QIDs are held in memory
+    for head_qid, rels in track(store_generator(args.kg_triples), description="Filt qid2rels"):
+        if head_qid not in qid2relations:
+            continue
+        for rel in rels:
             if rel not in KG_PROPERTIES_TO_REMOVE:
                 rel_name = kg_vocab.get(rel, rel)
-                qid2relations[head_qid][rel_name] = all_relations[head_qid][rel][:args.max_relations]
+                qid2relations[head_qid][rel_name] = rels[rel][:args.max_relations]
     kg_symbols = KGSymbols(
         qid2relations=qid2relations,
         max_connections=args.max_relations
@@ -19,16 +19,16 @@ import ujson as json
 import copy
 import shutil
 import time
-from html import escape, unescape
 import jsonlines
 from collections import defaultdict
 import glob
 
 from tqdm import tqdm
 
-from bootleg_data_prep.language import get_lnrm, ENSURE_ASCII
+from bootleg_data_prep.language import get_lnrm, get_lnrms, ENSURE_ASCII
 from bootleg_data_prep.utils import utils
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
+from bootleg_data_prep.utils.classes.title_index import get_title_index
 
 def get_arg_parser():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -75,17 +75,16 @@ def subprocess(all_args):
         for page_obj in in_file:
             # aliases is a list of sentences with aliases, their gold wikipedia page title, the text, and spans
             for sentence in page_obj["aliases"]:
-                pairs = zip(sentence["aliases"], sentence["titles"])
-                for alias, title in pairs:
-                    # normalize alias
-                    alias = get_lnrm(alias, not args.not_strip, not args.not_lower)
+                # normalize aliases
+                aliases = get_lnrms(sentence["aliases"], not args.not_strip, not args.not_lower)
+                for alias, title in zip(aliases, sentence["titles"]):
                     if len(alias) > 0:
                         aliases_to_title[alias][title] += 1
     utils.dump_json_file(outfilename, aliases_to_title)
     return
 
 
-def filter_aliases_and_convert_to_qid(anchoraliases_to_title, title_to_qid, qid_to_all_titles, args):
+def filter_aliases_and_convert_to_qid(anchoraliases_to_title, title_index, args):
     """ 
         1. We walk through each anchor alias-title pair and keep the ones that appear a minimum of two times.
         2. We union these with the bold alias-title pairs where the bold aliases appear in the first few sentences of a Wikipedia page.
@@ -108,14 +107,11 @@ def filter_aliases_and_convert_to_qid(anchoraliases_to_title, title_to_qid, qid_
     for alias, title_dict in tqdm(anchoraliases_to_title.items()):
         for title_raw, count in title_dict.items():
             if count >= args.min_frequency:
-                title = title_raw
-                if title not in title_to_qid:
-                    title = unescape(title_raw)
-                if title not in title_to_qid:
-                    title = escape(title_raw)
-                if title in title_to_qid:
-                    filtered_aliasqid[alias][title_to_qid[title]] += 1
-                    filtered_qids[title_to_qid[title]] += 1
+                # tries the title as is, unescaped and escaped
+                title, qid = title_index.resolve(title_raw)
+                if qid != prep_utils.NO_QID:
+                    filtered_aliasqid[alias][qid] += 1
+                    filtered_qids[qid] += 1
                 # The ELSE happens when we link to an external non-wikipedia page, the wikipedia page doesn't have a QID (rare), or the title is a redirect
                 # eg https://en.wikipedia.org/wiki/Vidyodaya_University redirects to https://en.wikipedia.org/wiki/University_of_Sri_Jayewardenepura
                 else:
@@ -123,8 +119,8 @@ def filter_aliases_and_convert_to_qid(anchoraliases_to_title, title_to_qid, qid_
             else:
                 unpopular_removed[alias][title_raw] += count
     # we increment the count here to represent that each page links to itself; as we compute counts later, this is just for sorting
-    for qid in qid_to_all_titles:
-        for title in qid_to_all_titles[qid]:
+    for qid, titles in title_index.qid_titles():
+        for title in titles:
             alias = get_lnrm(title, not args.not_strip, not args.not_lower)
             if len(alias) > 0:
                 filtered_aliasqid[alias][qid] += 1
@@ -198,7 +194,8 @@ def main():
     utils.ensure_dir(args.data_dir)
 
     print(f"Loading data from {args.sentence_dir}...")
-    files = glob.glob(f"{args.sentence_dir}/*/wiki_*")
+    # process_extracted_wikipedia.py writes the sentence files directly into sentence_dir
+    files = glob.glob(f"{args.sentence_dir}/wiki_*") + glob.glob(f"{args.sentence_dir}/*/wiki_*")
     if args.test:
         files = files[:1]
 
@@ -213,8 +210,8 @@ def main():
     launch_subprocess(args, temp_outdir, files)
     print("Finished subprocesses.")
 
-    # load wikidata qid-to-title map
-    title_to_qid, qid_to_all_titles, _, _ = prep_utils.load_qid_title_map(args.title_to_qid)
+    # open the title-to-qid index (built once next to the title file). QIDs are integer ids and decoded when saved.
+    title_index = get_title_index(args.title_to_qid)
     # Aggregate alias-title counts from list and filter.
 
     list_of_anchoraliases_to_titles = [utils.load_json_file(f) for f in glob.glob(f"{temp_outdir}/*_anchoraliases.json")]
@@ -222,7 +219,7 @@ def main():
     anchoraliases_to_title = prep_utils.aggregate_list_of_nested_dictionaries(list_of_anchoraliases_to_titles)
     # filter aliases and convert to QID
     aliases_to_qid, all_qids, qid_unavailable, unpopular_removed = filter_aliases_and_convert_to_qid(
-        anchoraliases_to_title, title_to_qid, qid_to_all_titles, args
+        anchoraliases_to_title, title_index, args
     )
     for al in aliases_to_qid:
         assert len(al) > 0
@@ -235,7 +232,7 @@ def main():
                 for k in line:
                     wikidata_alias_to_qid[k] = line[k]
     for al in wikidata_alias_to_qid:
-        wikidata_alias_to_qid[al] = set(wikidata_alias_to_qid[al])
+        wikidata_alias_to_qid[al] = set(prep_utils.encode_qid(q) for q in wikidata_alias_to_qid[al])
 
     # Merge aliases and QIDs
     print(f"Found {len(wikidata_alias_to_qid)} wikidata aliases. Merging with wikidata aliases")
@@ -250,15 +247,15 @@ def main():
     vars(args)["out_anchor_aliases_to_title_file"] = out_file
 
     out_file = os.path.join(outdir, "alias_to_qid_filter.json")
-    utils.dump_json_file(out_file, aliases_to_qid_merged)
+    utils.dump_json_items(out_file, ((al, prep_utils.decode_qid_keys(qids)) for al, qids in aliases_to_qid_merged.items()))
     vars(args)["out_aliases_to_qid_filter_file"] = out_file
 
     out_file = os.path.join(outdir, "qids_added_wikidata.json")
-    utils.dump_json_file(out_file, new_qids_from_wikidata)
+    utils.dump_json_file(out_file, [prep_utils.decode_qid(q) for q in new_qids_from_wikidata])
     vars(args)["out_qids_added_wikidata_file"] = out_file
 
     out_file = os.path.join(outdir, "alias_to_qid_wikipedia.json")
-    utils.dump_json_file(out_file, aliases_to_qid)
+    utils.dump_json_items(out_file, ((al, prep_utils.decode_qid_keys(qids)) for al, qids in aliases_to_qid.items()))
     vars(args)["out_aliases_to_qid_wikipedia_file"] = out_file
 
     out_file = os.path.join(outdir, "alias_with_unknown_qid.json")
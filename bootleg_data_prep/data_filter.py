@@ -119,7 +119,7 @@ def subprocess_step1(all_args):
                 if eval(f'{args.sentence_filter_func}(args, aliases, qids, parent_qid, text, extras_global)'):
                     stats["filtered_func"] += 1
                     continue
-                all_qids.update(set(qids))
+                all_qids.update(prep_utils.encode_qid(q) for q in qids)
                 sentence["parent_qid"] = parent_qid
                 sentence["parent_title"] = title
                 out_file.write(json.dumps(sentence, ensure_ascii=ENSURE_ASCII) + '\n')
@@ -128,6 +128,7 @@ def subprocess_step1(all_args):
     return all_qids
 
 # Filter entities by qids in data and by max candidates
+# list_of_all_qids holds sets of integer ids from prep_utils.encode_qid; the returned qid2title and alias2qids use QID strings
 def filter_entity_symbols(args, list_of_all_qids, benchmark_qids, entity_symbols):
     stats = {"alias_not_in_all_qids": 0, "qids_not_in_all_qids": 0, "raw_qids": 0, "raw_aliases": 0}
     print("STARTING LENS TITLE", len(entity_symbols.get_qid2title_dict()), "ALIAS", len(entity_symbols.get_alias2qids_dict()))
@@ -142,12 +143,12 @@ def filter_entity_symbols(args, list_of_all_qids, benchmark_qids, entity_symbols
     else:
         all_qids = set()
         for qid_set in tqdm(list_of_all_qids):
-            all_qids = all_qids.union(qid_set)
+            all_qids.update(qid_set)
         for b_qid in list(benchmark_qids):
             if not entity_symbols.qid_exists(b_qid):
                 benchmark_qids.remove(b_qid)
                 print(f"Removing benchmark qid {b_qid}")
-        all_qids.update(benchmark_qids)
+        all_qids.update(prep_utils.encode_qid(q) for q in benchmark_qids)
         print(f"Total qids to keep {len(all_qids)} with {len(benchmark_qids)} benchmark qids")
         alias2qids = {}
         all_aliases = set()
@@ -160,13 +161,13 @@ def filter_entity_symbols(args, list_of_all_qids, benchmark_qids, entity_symbols
             stats["raw_aliases"] += 1
             qid_cand_list = list(sorted(entity_symbols.get_qid_count_cands(alias), key=lambda x: x[1], reverse=True))
             for qid, count in qid_cand_list:
-                if qid not in all_qids:
+                if prep_utils.encode_qid(qid) not in all_qids:
                     continue
                 # This alias needs to be added, as does all of its max_candidates candidates
                 all_aliases.add(alias)
                 alias2qids[alias] = qid_cand_list[:args.max_candidates]
                 for qid, count in alias2qids[alias]:
-                    all_qids_final.add(qid)
+                    all_qids_final.add(prep_utils.encode_qid(qid))
                 break
             if alias not in alias2qids:
                 stats["alias_not_in_all_qids"] += 1
@@ -174,6 +175,7 @@ def filter_entity_symbols(args, list_of_all_qids, benchmark_qids, entity_symbols
         stats["raw_qids"] = len(entity_symbols.get_all_qids())
         stats["qids_not_in_all_qids"] = len(entity_symbols.get_all_qids()) - len(all_qids_final)
         for qid in all_qids_final:
+            qid = prep_utils.decode_qid(qid)
             qid2title[qid] = entity_symbols.get_title(qid)
     # Get max candidates and max alias len
     max_candidates = 0
@@ -193,9 +195,9 @@ def launch_subprocess_step2(args, out_dir, out_dir_stats, entity_symbols, files)
     temp_folder = prep_utils.get_outdir(out_dir, "temp_dump")
     print(f"Saving entity_symbol files in {temp_folder}")
 
-    qid2title_f = os.path.join(temp_folder, "qid2title.json")
+    qids_f = os.path.join(temp_folder, "qids.json")
     alias2qids_f = os.path.join(temp_folder, "alias2qids.json")
-    utils.dump_json_file(qid2title_f, entity_symbols.get_qid2title_dict())
+    utils.dump_json_file(qids_f, list(entity_symbols.get_all_qids()))
     utils.dump_json_file(alias2qids_f, entity_symbols.get_alias2qids_dict())
 
     all_process_args = [tuple([i+1,
@@ -204,7 +206,7 @@ def launch_subprocess_step2(args, out_dir, out_dir_stats, entity_symbols, files)
                                files[i],
                                out_dir,
                                out_dir_stats,
-                               qid2title_f,
+                               qids_f,
                                alias2qids_f
                                ]) for i in range(len(files))]
     pool = multiprocessing.Pool(processes=args.processes_in_memory_load)  # this can be optimized better ... but the memory consumption at this stage is very high
@@ -217,10 +219,11 @@ def launch_subprocess_step2(args, out_dir, out_dir_stats, entity_symbols, files)
 
 
 def subprocess_step2(all_args):
-    i, total, args, in_filepath, out_dir, out_dir_stats, qid2title_f, alias2qids_f = all_args
+    i, total, args, in_filepath, out_dir, out_dir_stats, qids_f, alias2qids_f = all_args
 
-    qid2title = utils.load_json_file(qid2title_f)
-    alias2qids = utils.load_json_file(alias2qids_f)
+    # QIDs are kept as integer ids in memory (see prep_utils.encode_qid) and decoded when written out
+    all_qids = set(prep_utils.encode_qid(q) for q in utils.load_json_file(qids_f))
+    alias2qids = {alias: set(prep_utils.encode_qid(q) for q, _ in cands) for alias, cands in utils.load_json_file(alias2qids_f).items()}
     out_fname = prep_utils.get_outfname(in_filepath)
     out_file = open(os.path.join(out_dir, out_fname), "w", encoding='utf8')
     out_file_stats = os.path.join(out_dir_stats, out_fname)
@@ -247,15 +250,15 @@ def subprocess_step2(all_args):
             # # LAUREL
             sent_obj['unswap_aliases'] = sent_obj.get('unswap_aliases', sent_obj['aliases'])
             sent_obj['sources'] = sent_obj.get('sources', ['gold' for _ in range(len(sent_obj['aliases']))])
-            items = list(filter(lambda x: (not args.train_in_candidates) or (x[2] in [y[0] for y in alias2qids[x[0]]]),
+            items = list(filter(lambda x: (not args.train_in_candidates) or (prep_utils.encode_qid(x[2]) in alias2qids[x[0]]),
                                 zip(sent_obj['aliases'], sent_obj.get("unswap_aliases", sent_obj["aliases"]), sent_obj['qids'],
                                     sent_obj['char_spans'], sent_obj['gold'], sent_obj["sources"])))
             temp_len = len(items)
             for x in items:
-                if x[2] not in qid2title:
+                if prep_utils.encode_qid(x[2]) not in all_qids:
                     print("BAD", x)
                     print(json.dumps(sent_obj, indent=4, ensure_ascii=ENSURE_ASCII))
-            items = list(filter(lambda x: x[2] in qid2title, items))
+            items = list(filter(lambda x: prep_utils.encode_qid(x[2]) in all_qids, items))
             # there should be no difference between these
             assert temp_len - len(items) == 0
             if len(items) == 0:
@@ -276,12 +279,13 @@ def subprocess_step2(all_args):
                 statistics['total_preserved'] += len(qids)
                 # Update stats
                 for alias, qid, gold in zip(aliases, qids, golds):
-                    alias_qid[gold][alias][qid] += 1
+                    alias_qid[gold][alias][prep_utils.encode_qid(qid)] += 1
     assert statistics['total_mentions'] == (statistics['total_dropped'] + statistics['total_preserved'])
     out_file.close()
     print(f"Finished {i}/{total}. Data written to {os.path.join(out_dir, out_fname)}. Stats written to {os.path.join(out_dir_stats, out_fname)}")
     # save to tmp file in the out directory
-    utils.dump_json_file(out_file_stats, alias_qid)
+    utils.dump_json_file(out_file_stats, {gold: {alias: prep_utils.decode_qid_keys(qid_counts) for alias, qid_counts in a_qid.items()}
+                                          for gold, a_qid in alias_qid.items()})
     return statistics
 
 
@@ -299,14 +303,15 @@ def aggregate_statistics_step2(args, out_dir_stats):
         for gold, a_qid in counts.items():
             for k, v in a_qid.items():
                 for kk, vv, in v.items():
+                    kk = prep_utils.encode_qid(kk)
                     if gold is True:
                         alias_qid_without[k][kk] += vv
                     alias_qid_with[k][kk] += vv
 
         print(f"Processed {i+1}/{len(in_files)} files.")
 
-    utils.dump_json_file(out_file_with, alias_qid_with)
-    utils.dump_json_file(out_file_without, alias_qid_without)
+    utils.dump_json_items(out_file_with, ((alias, prep_utils.decode_qid_keys(qid_counts)) for alias, qid_counts in alias_qid_with.items()))
+    utils.dump_json_items(out_file_without, ((alias, prep_utils.decode_qid_keys(qid_counts)) for alias, qid_counts in alias_qid_without.items()))
     # Clean up temporary files
     print("Cleaning up temporary files...")
     for file in in_files:
@@ -1,4 +1,6 @@
 import os
+# language code of the processed_batches tables to read when they were extracted for several languages
+LANG_CODE = os.environ.get('BOOTLEG_PREP_LANG_CODE')
 lang_module = os.environ.get('BOOTLEG_PREP_LANG_MODULE')
 if lang_module == 'hebrew':
     from langs.hebrew import *
@@ -89,6 +89,7 @@ def main():
     out_file_without = os.path.join(stats_dir, "alias_qid_traindata_withoutaugment.json")
     train_qidcnt_file = os.path.join(out_dir, "qid2cnt.json")
     print(f"Will output to {out_file_with} and {out_file_without} and counts to {train_qidcnt_file}")
+    # QIDs are kept as integer ids in memory (see prep_utils.encode_qid) and decoded when written out
     alias_qid_with = collections.defaultdict(lambda: collections.defaultdict(int))
     alias_qid_without = collections.defaultdict(lambda: collections.defaultdict(int))
 
@@ -154,6 +155,7 @@ def main():
                 # update train stats
                 if (key == os.path.join(out_dir, "train")):
                     for alias, qid, gold in zip(line["aliases"], line["qids"], line["gold"]):
+                        qid = prep_utils.encode_qid(qid)
                         trainqid2cnt[qid] += 1
                         alias_qid_with[alias][qid] += 1
                         if gold:
@@ -173,9 +175,9 @@ def main():
                 line_idx += 1
                 out_f.write(json.dumps(line, sort_keys=True, ensure_ascii=ENSURE_ASCII) + "\n")
 
-    utils.dump_json_file(out_file_with, alias_qid_with)
-    utils.dump_json_file(out_file_without, alias_qid_without)
-    utils.dump_json_file(train_qidcnt_file, trainqid2cnt)
+    utils.dump_json_items(out_file_with, ((alias, prep_utils.decode_qid_keys(qid_counts)) for alias, qid_counts in alias_qid_with.items()))
+    utils.dump_json_items(out_file_without, ((alias, prep_utils.decode_qid_keys(qid_counts)) for alias, qid_counts in alias_qid_without.items()))
+    utils.dump_json_items(train_qidcnt_file, ((prep_utils.decode_qid(qid), count) for qid, count in trainqid2cnt.items()))
     print(f"Finished writing files in {time.time() - start} seconds. Removed {total_removed} non-gold aliases from dev and test and train.")
     # Closing files
     for key in tqdm(splits):
@@ -0,0 +1,88 @@
+'''
+This file
+
+1. Reads the anchor text of the sentence files written by process_extracted_wikipedia.py
+2. Normalizes it with the character by character reference lnrm, get_lnrm (cold and warm cache) and the batch get_lnrms
+3. Checks all of them agree and dumps the anchors/sec of each as JSON
+
+BOOTLEG_PREP_LANG_MODULE must be set as for the step scripts.
+
+to run:
+python3 -m bootleg_data_prep.perf.benchmark_lnrm --sentence_dir $BOOTLEG_PREP_WIKIPEDIA_DIR/sentences --out_file lnrm_benchmark.json
+'''
+
+import argparse
+import glob
+import time
+
+import jsonlines
+import ujson as json
+
+from bootleg_data_prep.language import LNRM_NORMALIZER, get_lnrm, get_lnrms
+from langs.normalizer import LnrmNormalizer, reference_lnrm
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentence_dir', type=str, required=True, help='Sentence files of process_extracted_wikipedia.py')
+    parser.add_argument('--out_file', type=str, default='lnrm_benchmark.json', help='Where to save the measurements')
+    parser.add_argument('--max_anchors', type=int, default=2000000)
+    parser.add_argument('--not_strip', action='store_true', help='If set, will not strip punctuation of aliases.')
+    parser.add_argument('--not_lower', action='store_true', help='If set, will not lower case all aliases.')
+    return parser
+
+
+def load_anchors(sentence_dir, max_anchors):
+    anchors = []
+    files = glob.glob(f"{sentence_dir}/wiki_*") + glob.glob(f"{sentence_dir}/*/wiki_*")
+    for file in sorted(files):
+        with jsonlines.open(file, 'r') as in_file:
+            for page_obj in in_file:
+                for sentence in page_obj["aliases"]:
+                    anchors.extend(sentence["aliases"])
+                    if len(anchors) >= max_anchors:
+                        return anchors[:max_anchors]
+    return anchors
+
+
+def time_run(name, func, anchors, results):
+    start = time.time()
+    lnrms = func(anchors)
+    secs = time.time() - start
+    results[name] = {"secs": secs, "anchors_per_sec": len(anchors) / max(secs, 1e-9)}
+    print(f"{name}: {secs:.3f}s ({results[name]['anchors_per_sec']:.0f} anchors/sec)")
+    return lnrms
+
+
+def main():
+    args = get_arg_parser().parse_args()
+    print(json.dumps(vars(args), indent=4))
+    anchors = load_anchors(args.sentence_dir, args.max_anchors)
+    strip, lower = not args.not_strip, not args.not_lower
+    form = LNRM_NORMALIZER.normalization_form
+    print(f"Loaded {len(anchors)} anchors ({len(set(anchors))} distinct). Normalization form {form}.")
+
+    results = {}
+    reference = time_run("reference", lambda a: [reference_lnrm(s, strip, lower, form) for s in a], anchors, results)
+    # a fresh normalizer so the cold run does not hit the module cache
+    cold = LnrmNormalizer(normalization_form=form)
+    checks = {
+        "get_lnrm_cold": time_run("get_lnrm_cold", lambda a: [cold.get_lnrm(s, strip, lower) for s in a], anchors, results),
+        "get_lnrm_warm": time_run("get_lnrm_warm", lambda a: [cold.get_lnrm(s, strip, lower) for s in a], anchors, results),
+        "get_lnrms": time_run("get_lnrms", lambda a: get_lnrms(a, strip, lower), anchors, results),
+        "module_get_lnrm": time_run("module_get_lnrm", lambda a: [get_lnrm(s, strip, lower) for s in a], anchors, results),
+    }
+    for name, lnrms in checks.items():
+        mismatches = sum(r != l for r, l in zip(reference, lnrms))
+        assert mismatches == 0, f"{name} differs from the reference lnrm on {mismatches} anchors"
+        results[name]["speedup"] = results["reference"]["secs"] / max(results[name]["secs"], 1e-9)
+        print(f"{name}: {results[name]['speedup']:.2f}x faster than reference")
+
+    with open(args.out_file, "w") as out_f:
+        json.dump({"num_anchors": len(anchors), "num_distinct": len(set(anchors)), "strip": strip, "lower": lower,
+                   "normalization_form": form, "runs": results}, out_f, indent=4)
+    print(f"Saved measurements to {args.out_file}.")
+
+
+if __name__ == '__main__':
+    main()
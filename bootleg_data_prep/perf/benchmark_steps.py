@@ -0,0 +1,185 @@
+'''
+This file
+
+1. Runs the pipeline steps on the output of generate_synthetic_data.py, in the same order and with the same arguments as scripts/all.bash
+2. Measures the wall time, records/sec and peak RSS (summed over the step's process tree) of every step
+3. Dumps the measurements as JSON so runs can be compared before a full production run
+
+Every step runs in its own process with the environment of this one, so BOOTLEG_PREP_LANG_MODULE and
+BOOTLEG_PREP_LANG_CODE must be set as for the step scripts. Step output and logs go to --work_dir.
+
+to run:
+python3 -m bootleg_data_prep.perf.generate_synthetic_data --out_dir synthetic --num_entities 100000
+python3 -m bootleg_data_prep.perf.benchmark_steps --synthetic_dir synthetic --work_dir synthetic_work --out_file step_benchmarks.json
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+import ujson as json
+
+from bootleg_data_prep.perf.generate_synthetic_data import MANIFEST_FILE
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+STEPS = ["preprocess_dump", "process_extracted_wikipedia", "get_title_to_ids", "create_aliases", "curate_aliases",
+         "remove_bad_aliases", "weak_label_data", "data_filter", "merge_shuff_split"]
+RSS_SAMPLE_SECS = 0.05
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic_dir', type=str, required=True, help='Output directory of generate_synthetic_data.py')
+    parser.add_argument('--work_dir', type=str, required=True, help='Where step outputs and logs are written')
+    parser.add_argument('--out_file', type=str, default='step_benchmarks.json', help='Where to save the measurements')
+    parser.add_argument('--steps', type=str, default=','.join(STEPS), help='Comma separated steps to run. Skipped steps must have been run before in work_dir.')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--no_weak_label', action='store_true', help='Skip weak_label_data and filter the alias filtered sentences directly')
+    return parser
+
+
+def get_step_command(step, args, manifest):
+    """ Returns the command line of a step and the number of input records it processes (with their unit) """
+    counts = manifest["counts"]
+    language = manifest["args"]["languages"].split(",")[0]
+    wikidata_dir = os.path.join(args.work_dir, "wikidata")
+    wikipedia_dir = os.path.join(args.work_dir, "wikipedia")
+    data_dir = os.path.join(wikipedia_dir, "data", "wiki_dump")
+    alias_file = os.path.join(wikipedia_dir, "augmented_alias_map_large.jsonl")
+    title_file = os.path.join(wikipedia_dir, "title_mappings", "title_to_all_ids.jsonl")
+    python = [sys.executable]
+    if step == "preprocess_dump":
+        return python + [os.path.join(CODE_DIR, "simple_wikidata_db", "preprocess_dump.py"),
+                         "--input_file", os.path.join(args.synthetic_dir, manifest["wikidata_file"]),
+                         "--out_dir", os.path.join(wikidata_dir, "processed_batches"),
+                         "--total_lines", str(counts["dump_lines"]), "--batch_size", "1000", "--parallel_read",
+                         "--num_processes", str(args.processes), "--language_id", language], counts["entities"], "entities"
+    if step == "process_extracted_wikipedia":
+        return python + ["-m", "bootleg_data_prep.process_extracted_wikipedia",
+                         "--wikiextractor_output", os.path.join(args.synthetic_dir, manifest["wikiextractor_dir"]),
+                         "--output_dir", wikipedia_dir, "--processes", str(args.processes)], counts["pages"], "pages"
+    if step == "get_title_to_ids":
+        return python + ["-m", "bootleg_data_prep.wikidata.get_title_to_ids", "--data", wikidata_dir,
+                         "--wikipedia_xml", os.path.join(args.synthetic_dir, manifest["wikipedia_xml_file"]),
+                         "--total_wikipedia_xml_lines", str(counts["xml_lines"]),
+                         "--wikipedia_pageids", os.path.join(wikipedia_dir, "pageids"),
+                         "--out_dir", os.path.join(wikipedia_dir, "title_mappings"), "--processes", str(args.processes)], counts["pages"] + counts["redirects"], "titles"
+    if step == "create_aliases":
+        return python + ["-m", "bootleg_data_prep.wikidata.create_aliases", "--data", wikidata_dir, "--out_file", alias_file,
+                         "--processes", str(args.processes)], counts["entities"], "entities"
+    if step == "curate_aliases":
+        return python + ["-m", "bootleg_data_prep.curate_aliases", "--min_frequency", "2",
+                         "--sentence_dir", os.path.join(wikipedia_dir, "sentences"), "--data_dir", data_dir,
+                         "--wd_aliases", alias_file, "--title_to_qid", title_file, "--processes", str(args.processes)], counts["pages"], "pages"
+    if step == "remove_bad_aliases":
+        return python + ["-m", "bootleg_data_prep.remove_bad_aliases",
+                         "--sentence_dir", os.path.join(wikipedia_dir, "sentences"), "--data_dir", data_dir,
+                         "--title_to_qid", title_file, "--benchmark_qids", "", "--processes", str(args.processes)], counts["pages"], "pages"
+    if step == "weak_label_data":
+        return python + ["-m", "bootleg_data_prep.weak_label_data", "--data_dir", data_dir,
+                         "--filtered_alias_subdir", "alias_filtered_sentences", "--out_subdir", "orig_wl",
+                         "--wd_aliases", alias_file, "--processes", str(args.processes)], counts["pages"], "pages"
+    if step == "data_filter":
+        return python + ["-m", "bootleg_data_prep.data_filter", "--processes", str(args.processes),
+                         "--processes_in_memory_load", str(args.processes), "--train_in_candidates",
+                         "--subfolder_name", "full_wiki", "--max_candidates", "30", "--sentence_filter_func", "false_filter",
+                         "--no_filter_entities_data", "--orig_dir", "alias_filtered_sentences" if args.no_weak_label else "orig_wl",
+                         "--data_dir", data_dir, "--filter_file", "", "--benchmark_qids", ""], counts["sentences"], "sentences"
+    if step == "merge_shuff_split":
+        return python + ["-m", "bootleg_data_prep.merge_shuff_split", "--data_dir", data_dir,
+                         "--subfolder_name", "full_wiki", "--split", "10"], counts["sentences"], "sentences"
+    raise ValueError(f"Unknown step {step}")
+
+def get_tree_rss(process):
+    """ Returns (total RSS of process and all its descendants, largest single RSS) in bytes """
+    total = 0
+    largest = 0
+    try:
+        processes = [process] + process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0, 0
+    for proc in processes:
+        try:
+            rss = proc.memory_info().rss
+        except psutil.NoSuchProcess:
+            continue
+        total += rss
+        largest = max(largest, rss)
+    return total, largest
+
+def run_step(cmd, log_file, env):
+    """ Runs cmd and returns (return code, wall seconds, peak tree RSS, peak single process RSS) """
+    peaks = [0, 0]
+    with open(log_file, "w", encoding="utf-8") as log_f:
+        start = time.time()
+        proc = subprocess.Popen(cmd, stdout=log_f, stderr=subprocess.STDOUT, env=env, cwd=CODE_DIR)
+        process = psutil.Process(proc.pid)
+        done = threading.Event()
+
+        def sample():
+            while not done.is_set():
+                total, largest = get_tree_rss(process)
+                peaks[0] = max(peaks[0], total)
+                peaks[1] = max(peaks[1], largest)
+                done.wait(RSS_SAMPLE_SECS)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        returncode = proc.wait()
+        wall_secs = time.time() - start
+        done.set()
+        sampler.join()
+    return returncode, wall_secs, peaks[0], peaks[1]
+
+def main():
+    gl_start = time.time()
+    args = get_arg_parser().parse_args()
+    # steps run from the code directory
+    args.synthetic_dir = os.path.abspath(args.synthetic_dir)
+    args.work_dir = os.path.abspath(args.work_dir)
+    print(json.dumps(vars(args), indent=4))
+    with open(os.path.join(args.synthetic_dir, MANIFEST_FILE), "r", encoding="utf-8") as in_f:
+        manifest = json.load(in_f)
+    log_dir = os.path.join(args.work_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([CODE_DIR] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    steps = [step for step in args.steps.split(",") if not (args.no_weak_label and step == "weak_label_data")]
+
+    results = []
+    for step in steps:
+        cmd, records, unit = get_step_command(step, args, manifest)
+        log_file = os.path.join(log_dir, f"{step}.log")
+        print(f"Running {step}. Logging to {log_file}")
+        returncode, wall_secs, peak_rss, peak_process_rss = run_step(cmd, log_file, env)
+        result = {
+            "step": step,
+            "returncode": returncode,
+            "records": records,
+            "record_unit": unit,
+            "wall_secs": round(wall_secs, 3),
+            "records_per_sec": round(records / wall_secs, 1) if wall_secs > 0 else None,
+            "peak_rss_mb": round(peak_rss / 1024**2, 1),
+            "peak_process_rss_mb": round(peak_process_rss / 1024**2, 1),
+        }
+        results.append(result)
+        print(f"{step}: {records} {unit} in {result['wall_secs']}s ({result['records_per_sec']} {unit}/sec), "
+              f"peak RSS {result['peak_rss_mb']}MB (largest process {result['peak_process_rss_mb']}MB)")
+        if returncode != 0:
+            # later steps read this step's output
+            print(f"{step} failed with return code {returncode}. See {log_file}. Stopping.")
+            break
+
+    with open(args.out_file, "w", encoding="utf-8") as out_f:
+        json.dump({"synthetic_data": manifest, "processes": args.processes, "steps": results}, out_f, indent=4)
+    print(f"Saved measurements to {args.out_file}. Finished in {time.time() - gl_start:.1f} seconds.")
+    if any(result["returncode"] != 0 for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+'''
+This file
+
+1. Generates a deterministic synthetic Wikidata dump (compact entity JSON lines with labels, aliases, claims, qualifiers and sitelinks)
+2. Generates matching Wikipedia pages in the WikiExtractor --json --links format (<a href> links to other pages)
+3. Generates a Wikipedia XML file with the page titles, redirects and timestamps read by get_title_to_ids.py
+4. Dumps a manifest with the generation arguments and record counts, used by benchmark_steps.py
+
+Entity popularity (how often an entity is linked or used as a claim value) follows a Zipf distribution, names are
+shared between entities so aliases are ambiguous, and some links go through redirects or to missing pages.
+
+to run:
+python3 -m bootleg_data_prep.perf.generate_synthetic_data --out_dir synthetic --num_entities 100000
+'''
+
+import argparse
+import bz2
+import itertools
+import os
+import random
+import time
+from urllib.parse import quote
+
+import ujson as json
+
+MANIFEST_FILE = "manifest.json"
+WIKIDATA_FILE = "latest-all.json"
+WIKIPEDIA_XML_FILE = "wiki-pages-articles.xml"
+WIKIEXTRACTOR_DIR = "wikiextractor_output"
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "sa", "tor", "vel", "an", "bri", "cor", "dun", "el", "fa", "gor", "hal", "is",
+             "jen", "kel", "lin", "mor", "nor", "or", "pel", "quin", "ros", "sil", "tam", "ul", "var", "wen", "yor", "zan"]
+INSTANCE_OF = "P31"
+SUBCLASS_OF = "P279"
+# properties of the claims besides instance of, by datatype
+ITEM_PROPERTIES = ["P17", "P27", "P131", "P106", "P21", "P361", "P527", "P50", "P175", "P54"]
+EXTERNAL_ID_PROPERTIES = ["P214", "P646", "P227", "P244"]
+TIME_PROPERTIES = ["P569", "P570", "P571", "P580"]
+QUANTITY_PROPERTIES = ["P1082", "P2044", "P2046"]
+MONOLINGUAL_PROPERTIES = ["P1448", "P1705"]
+QUALIFIER_PROPERTIES = ["P580", "P582", "P585"]
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out_dir', type=str, required=True, help='Where to write the synthetic dumps')
+    parser.add_argument('--num_entities', type=int, default=100000, help='Number of items in the Wikidata dump')
+    parser.add_argument('--num_properties', type=int, default=200, help='Number of properties in the Wikidata dump')
+    parser.add_argument('--languages', type=str, default='en', help='Comma separated languages with labels/aliases/sitelinks. Wikipedia pages are generated for the first one.')
+    parser.add_argument('--page_fraction', type=float, default=0.3, help='Fraction of items with a Wikipedia page')
+    parser.add_argument('--redirect_fraction', type=float, default=0.2, help='Fraction of pages with redirects')
+    parser.add_argument('--sentences_per_page', type=int, default=20, help='Average number of sentences per page')
+    parser.add_argument('--links_per_sentence', type=float, default=1.0, help='Average number of links per sentence')
+    parser.add_argument('--pages_per_file', type=int, default=1000, help='Pages per WikiExtractor output file')
+    parser.add_argument('--compress', action='store_true', help='Write the Wikidata dump as .bz2')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+def make_word(rng, min_syllables=1, max_syllables=3):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(min_syllables, max_syllables)))
+
+def make_name(rng):
+    return " ".join(make_word(rng).capitalize() for _ in range(rng.choice([1, 2, 2, 3])))
+
+def zipf_cum_weights(n, exponent=1.0):
+    return list(itertools.accumulate(1.0 / (rank + 1) ** exponent for rank in range(n)))
+
+def snak(property_id, datatype, value, value_type):
+    return {"snaktype": "value", "property": property_id, "datavalue": {"value": value, "type": value_type}, "datatype": datatype}
+
+def item_snak(property_id, qid):
+    return snak(property_id, "wikibase-item", {"entity-type": "item", "numeric-id": int(qid[1:]), "id": qid}, "wikibase-entityid")
+
+def time_snak(rng, property_id):
+    return snak(property_id, "time", {"time": f"+{rng.randint(1000, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00Z",
+                                      "timezone": 0, "before": 0, "after": 0, "precision": 11,
+                                      "calendarmodel": "http://www.wikidata.org/entity/Q1985727"}, "time")
+
+def make_claim(rng, qid, mainsnak, qualifier_prob):
+    claim = {"mainsnak": mainsnak, "type": "statement", "id": f"{qid}${rng.getrandbits(128):032X}", "rank": "normal"}
+    if rng.random() < qualifier_prob:
+        property_id = rng.choice(QUALIFIER_PROPERTIES)
+        qualifier = time_snak(rng, property_id)
+        qualifier["hash"] = f"{rng.getrandbits(160):040x}"
+        claim["qualifiers"] = {property_id: [qualifier]}
+        claim["qualifiers-order"] = [property_id]
+    claim["references"] = [{"hash": f"{rng.getrandbits(160):040x}",
+                            "snaks": {"P248": [item_snak("P248", "Q36578")]}, "snaks-order": ["P248"]}]
+    return claim
+
+class SyntheticWorld:
+    """ Names, titles and popularity of the synthetic entities, shared by the Wikidata and Wikipedia generators """
+
+    def __init__(self, args):
+        rng = random.Random(args.seed)
+        self.args = args
+        self.languages = args.languages.split(",")
+        self.num_types = max(10, args.num_entities // 100)
+        self.type_cum_weights = zipf_cum_weights(self.num_types)
+        # popularity rank -> QID, so popular entities are spread over the dump
+        self.qids_by_popularity = [f"Q{i + 1}" for i in range(args.num_entities)]
+        rng.shuffle(self.qids_by_popularity)
+        self.popularity_cum_weights = zipf_cum_weights(args.num_entities)
+        # a pool of names smaller than the number of entities makes aliases ambiguous
+        name_pool = [make_name(rng) for _ in range(max(10, args.num_entities // 3))]
+        self.labels = {}
+        self.aliases = {}
+        self.titles = {}
+        used_titles = set()
+        for i in range(args.num_entities):
+            qid = f"Q{i + 1}"
+            self.labels[qid] = rng.choice(name_pool)
+            self.aliases[qid] = [rng.choice(name_pool) for _ in range(rng.choice([0, 0, 1, 2, 3]))]
+            if rng.random() < args.page_fraction:
+                title = self.labels[qid]
+                if title in used_titles:
+                    title = f"{title} ({make_word(rng)})"
+                if title not in used_titles:
+                    used_titles.add(title)
+                    self.titles[qid] = title
+        self.redirects = {}
+        for qid, title in self.titles.items():
+            if rng.random() < args.redirect_fraction:
+                for name in [self.labels[qid]] + self.aliases[qid] + [title.lower()]:
+                    if name not in used_titles:
+                        used_titles.add(name)
+                        self.redirects[name] = title
+
+    def sample_qids(self, rng, k):
+        return rng.choices(self.qids_by_popularity, cum_weights=self.popularity_cum_weights, k=k)
+
+    def sample_types(self, rng, k):
+        return [f"Q{i + 1}" for i in rng.choices(range(self.num_types), cum_weights=self.type_cum_weights, k=k)]
+
+def make_entity(rng, world, qid, args):
+    entity = {"type": "item", "id": qid, "labels": {}, "descriptions": {}, "aliases": {}, "claims": {}, "sitelinks": {}}
+    for i, language in enumerate(world.languages):
+        if i > 0 and rng.random() < 0.5:
+            continue
+        entity["labels"][language] = {"language": language, "value": world.labels[qid]}
+        if rng.random() < 0.7:
+            entity["descriptions"][language] = {"language": language, "value": " ".join(make_word(rng) for _ in range(rng.randint(2, 6)))}
+        if len(world.aliases[qid]) > 0:
+            entity["aliases"][language] = [{"language": language, "value": alias} for alias in world.aliases[qid]]
+        if qid in world.titles:
+            entity["sitelinks"][f"{language}wiki"] = {"site": f"{language}wiki", "title": world.titles[qid], "badges": []}
+    claims = entity["claims"]
+    is_type = int(qid[1:]) <= world.num_types
+    for type_qid in world.sample_types(rng, rng.choice([1, 1, 1, 2])):
+        claims.setdefault(SUBCLASS_OF if is_type else INSTANCE_OF, []).append(make_claim(rng, qid, item_snak(SUBCLASS_OF if is_type else INSTANCE_OF, type_qid), 0.0))
+    for _ in range(rng.randint(0, 12)):
+        r = rng.random()
+        if r < 0.5:
+            property_id = rng.choice(ITEM_PROPERTIES)
+            mainsnak = item_snak(property_id, world.sample_qids(rng, 1)[0])
+        elif r < 0.7:
+            property_id = rng.choice(EXTERNAL_ID_PROPERTIES)
+            mainsnak = snak(property_id, "external-id", f"{rng.getrandbits(40):x}", "string")
+        elif r < 0.85:
+            property_id = rng.choice(TIME_PROPERTIES)
+            mainsnak = time_snak(rng, property_id)
+        elif r < 0.95:
+            property_id = rng.choice(QUANTITY_PROPERTIES)
+            mainsnak = snak(property_id, "quantity", {"amount": f"+{rng.randint(1, 10**7)}", "unit": "1"}, "quantity")
+        else:
+            property_id = rng.choice(MONOLINGUAL_PROPERTIES)
+            mainsnak = snak(property_id, "monolingualtext", {"text": world.labels[qid], "language": rng.choice(world.languages)}, "monolingualtext")
+        claims.setdefault(property_id, []).append(make_claim(rng, qid, mainsnak, 0.2))
+    entity["lastrevid"] = rng.randint(10**8, 2 * 10**9)
+    return entity
+
+def make_property(rng, world, pid):
+    labels = {language: {"language": language, "value": " ".join(make_word(rng) for _ in range(rng.randint(1, 3)))} for language in world.languages}
+    return {"type": "property", "datatype": "wikibase-item", "id": pid, "labels": labels, "descriptions": {},
+            "aliases": {}, "claims": {}, "lastrevid": rng.randint(10**8, 2 * 10**9)}
+
+def write_wikidata(world, args, counts):
+    rng = random.Random(args.seed + 1)
+    out_file = os.path.join(args.out_dir, WIKIDATA_FILE + (".bz2" if args.compress else ""))
+    open_func = bz2.open if args.compress else open
+    with open_func(out_file, "wt", encoding="utf-8") as out_f:
+        out_f.write("[\n")
+        lines = [("P", i + 1) for i in range(args.num_properties)] + [("Q", i + 1) for i in range(args.num_entities)]
+        for i, (prefix, num) in enumerate(lines):
+            entity = make_property(rng, world, f"P{num}") if prefix == "P" else make_entity(rng, world, f"Q{num}", args)
+            out_f.write(json.dumps(entity, ensure_ascii=False) + (",\n" if i < len(lines) - 1 else "\n"))
+        out_f.write("]\n")
+    counts["entities"] = args.num_entities + args.num_properties
+    counts["dump_lines"] = args.num_entities + args.num_properties + 2
+    return out_file
+
+def make_sentence(rng, world, args):
+    """ Returns (sentence html, number of links) """
+    words = [make_word(rng) for _ in range(rng.randint(6, 20))]
+    words[0] = words[0].capitalize()
+    num_links = min(len(words), round(rng.expovariate(1.0 / args.links_per_sentence)))
+    for pos, qid in zip(rng.sample(range(len(words)), num_links), world.sample_qids(rng, num_links)):
+        anchor = rng.choice([world.labels[qid]] + world.aliases[qid])
+        r = rng.random()
+        if qid not in world.titles or r < 0.02:
+            # a link to a page which doesn't exist
+            title = anchor
+        elif r < 0.1 and anchor in world.redirects:
+            title = anchor
+        else:
+            title = world.titles[qid]
+        words[pos] = f'<a href="{quote(title)}">{anchor}</a>'
+    return " ".join(words) + ".", num_links
+
+def write_wikipedia(world, args, counts):
+    rng = random.Random(args.seed + 2)
+    out_dir = os.path.join(args.out_dir, WIKIEXTRACTOR_DIR)
+    pages = sorted(world.titles.items(), key=lambda item: int(item[0][1:]))
+    page_ids = {}
+    counts["pages"] = counts["sentences"] = counts["links"] = 0
+    for file_idx in range(0, len(pages), args.pages_per_file):
+        file_num = file_idx // args.pages_per_file
+        subdir = os.path.join(out_dir, chr(ord("A") + file_num // 2600) + chr(ord("A") + (file_num // 100) % 26))
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"wiki_{file_num % 100:02d}"), "w", encoding="utf-8") as out_f:
+            for qid, title in pages[file_idx:file_idx + args.pages_per_file]:
+                page_id = str(len(page_ids) * 3 + 12)
+                page_ids[title] = page_id
+                sentences = []
+                for _ in range(rng.randint(1, max(1, 2 * args.sentences_per_page - 1))):
+                    sentence, num_links = make_sentence(rng, world, args)
+                    # about five sentences per paragraph
+                    sentences.append(sentence + ("\n" if rng.random() < 0.2 else " "))
+                    counts["links"] += num_links
+                counts["sentences"] += len(sentences)
+                text = "".join(sentences).strip()
+                out_f.write(json.dumps({"id": page_id, "revid": str(rng.randint(10**8, 10**9)), "url": f"https://{world.languages[0]}.wikipedia.org/wiki?curid={page_id}",
+                                        "title": title, "text": text}, ensure_ascii=False, escape_forward_slashes=False) + "\n")
+                counts["pages"] += 1
+    return page_ids
+
+def write_wikipedia_xml(world, page_ids, args, counts):
+    rng = random.Random(args.seed + 3)
+    out_file = os.path.join(args.out_dir, WIKIPEDIA_XML_FILE)
+    num_lines = 0
+    with open(out_file, "w", encoding="utf-8") as out_f:
+        out_f.write(f'<mediawiki xml:lang="{world.languages[0]}">\n')
+        num_lines += 1
+        next_id = 10**8
+        pages = [(title, None, page_ids[title]) for title in page_ids] + [(redirect, target, None) for redirect, target in world.redirects.items()]
+        for title, redirect_target, page_id in pages:
+            if page_id is None:
+                page_id = str(next_id)
+                next_id += 1
+            lines = ["  <page>", f"    <title>{title}</title>", "    <ns>0</ns>", f"    <id>{page_id}</id>"]
+            if redirect_target is not None:
+                lines.append(f'    <redirect title="{redirect_target}" />')
+            lines += ["    <revision>", f"      <id>{rng.randint(10**8, 10**9)}</id>",
+                      f"      <timestamp>20{rng.randint(10, 22)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z</timestamp>",
+                      "      <text bytes=\"0\" xml:space=\"preserve\" />", "    </revision>", "  </page>"]
+            out_f.write("\n".join(lines) + "\n")
+            num_lines += len(lines)
+        out_f.write("</mediawiki>\n")
+        num_lines += 1
+    counts["redirects"] = len(world.redirects)
+    counts["xml_lines"] = num_lines
+    return out_file
+
+def main():
+    start = time.time()
+    args = get_arg_parser().parse_args()
+    os.makedirs(args.out_dir, exist_ok=True)
+    world = SyntheticWorld(args)
+    counts = {}
+    wikidata_file = write_wikidata(world, args, counts)
+    print(f"Wrote {counts['entities']} entities to {wikidata_file}. {time.time() - start:.1f} seconds.")
+    page_ids = write_wikipedia(world, args, counts)
+    print(f"Wrote {counts['pages']} pages with {counts['sentences']} sentences and {counts['links']} links. {time.time() - start:.1f} seconds.")
+    xml_file = write_wikipedia_xml(world, page_ids, args, counts)
+    print(f"Wrote {counts['redirects']} redirects to {xml_file}. {time.time() - start:.1f} seconds.")
+    manifest = {"args": vars(args), "counts": counts, "wikidata_file": os.path.basename(wikidata_file),
+                "wikipedia_xml_file": WIKIPEDIA_XML_FILE, "wikiextractor_dir": WIKIEXTRACTOR_DIR}
+    with open(os.path.join(args.out_dir, MANIFEST_FILE), "w", encoding="utf-8") as out_f:
+        json.dump(manifest, out_f, indent=4)
+    print(f"Finished in {time.time() - start:.1f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
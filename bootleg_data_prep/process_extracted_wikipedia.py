@@ -15,7 +15,7 @@ from pathlib import Path
 import ray
 import ujson as json
 from tqdm.auto import tqdm
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
 from bootleg_data_prep.language import sent_offset_tokenize, ENSURE_ASCII
@@ -42,6 +42,99 @@ def parse_args(args):
     return args
 
 
+# WikiExtractor links are <a href="...">alias</a>. Attribute values are quoted, so a ">" inside one does not end the tag
+ANCHOR_RE = re.compile(r"""<a(?=[\s/>])((?:"[^"]*"|'[^']*'|[^>"'])*)>(.*?)</a>""", re.DOTALL)
+HREF_RE = re.compile(r"""(?:^|\s)href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+# tags nested in the alias are dropped from its text, as html.parser does
+INNER_TAG_RE = re.compile(r"</?[a-zA-Z][^>]*>|<!--.*?-->", re.DOTALL)
+
+
+def get_href(attrs: str) -> Optional[str]:
+    match = HREF_RE.search(attrs)
+    if match is None:
+        return None
+    return html.unescape(next(value for value in match.groups() if value is not None))
+
+
+def extract_mention_tags(raw_text: str) -> Tuple[str, Dict[Tuple[int, int], Dict[str, Any]]]:
+    """Extract mention information from page.
+
+    The <a></a> tags of the page are found in one pass over the text. The href points to the Wikipedia page and the
+    tag text is the alias. Returns the page text without the tags and the mentions by their character span in it.
+    """
+    # Replace multiple new lines with one
+    raw_text = re.sub(r'\n+', '\n', raw_text).strip()
+    # All page text without HTML links
+    page_text = []
+    page_len = 0
+    entity_data = {}
+    cur_pos = 0
+    for match in ANCHOR_RE.finditer(raw_text):
+        alias = match.group(2)
+        if "<" in alias:
+            alias = INNER_TAG_RE.sub("", alias)
+        # html.parser unescapes the tag text
+        if "&" in alias:
+            alias = html.unescape(alias)
+        page_text.append(raw_text[cur_pos:match.start()])
+        page_len += match.start() - cur_pos
+        page_text.append(alias)
+        page_len += len(alias)
+        cur_pos = match.end()
+
+        href = get_href(match.group(1))
+        if len(alias) > 0 and href is not None:
+            # # is section headers
+            title = html.unescape(unquote(href).split("#")[0].strip())
+            span = [page_len - len(alias), page_len]
+            entity_data[tuple(span)] = {
+                "alias": alias,
+                "title": title,
+                "char_span": span
+            }
+    page_text.append(raw_text[cur_pos:])
+    return "".join(page_text), entity_data
+
+
+def reference_extract_mention_tags(raw_text: str) -> Tuple[str, Dict[Tuple[int, int], Dict[str, Any]]]:
+    """BeautifulSoup version of extract_mention_tags, as this step used to parse pages. Kept to check extract_mention_tags.
+    Recovering the offset of every tag rescans the lines before it, which is quadratic on long pages."""
+    raw_text = re.sub(r'\n+', '\n', raw_text).strip()
+    try:
+        soup = BeautifulSoup(raw_text, features="html.parser")
+        # Find all mentions
+        tags = soup.find_all("a")
+    except TypeError:
+        print("ERROR TYPES...a few of these are okay.")
+        tags = []
+    end_tag = "/a>"
+    page_text = ""
+    entity_data = {}
+    cur_pos = 0
+    final_pos = len(raw_text)
+    # Keep track of lines for positioning
+    raw_text_lines = raw_text.splitlines()
+    for tag in tags:
+        tag_st = tag.sourcepos
+        for i in range(tag.sourceline-1):
+            # +1 for the single newline -> this is why we made sure there was only one
+            tag_st += len(raw_text_lines[i]) + 1
+        # bs4 ignores the brackets for sourcepos but we need them to extract the outside bracket text
+        tag_end = raw_text.find(end_tag, tag_st) + len(end_tag)
+        page_text += raw_text[cur_pos:tag_st] + tag.text
+        cur_pos = tag_end
+        if len(tag.text) > 0 and tag.get("href") is not None:
+            title = html.unescape(unquote(tag.get("href")).split("#")[0].strip())
+            span = [len(page_text)-len(tag.text), len(page_text)]
+            entity_data[tuple(span)] = {
+                "alias": tag.text,
+                "title": title,
+                "char_span": span
+            }
+    page_text += raw_text[cur_pos:final_pos]
+    return page_text, entity_data
+
+
 @ray.remote
 class ExtractProcess(object):
     def __init__(self):
@@ -86,67 +179,8 @@ class ExtractProcess(object):
         return sentence_all_data
 
     def process_mention_tags(self, raw_text: str) -> Tuple[str, Dict[Tuple[int, int], Dict[str, Any]]]:
-        """Extract mention information from page.
-
-        This step parses the HTML output and extracts <a></a> tags. The href points to the Wikipedia
-         page and the tag text is the alias.
-        """
-        # Replace multiple new lines with one
-        raw_text = re.sub(r'\n+', '\n', raw_text).strip()
-        try:
-            soup = BeautifulSoup(raw_text, features="html.parser")
-            # Find all mentions
-            tags = soup.find_all("a")
-        except TypeError:
-            print("ERROR TYPES...a few of these are okay.")
-            tags = []
-        end_tag = "/a>"
-        # All page text without HTML links
-        page_text = ""
-        entity_data = {}
-        cur_pos = 0
-        final_pos = len(raw_text)
-        # Keep track of lines for positioning
-        raw_text_lines = raw_text.splitlines()
-        for tag_idx, tag in enumerate(tags):
-            tag_st = tag.sourcepos
-            tag_st_ln = tag.sourceline
-            for i in range(tag_st_ln-1):
-                # +1 for the single newline -> this is why we made sure there was only one
-                tag_st += len(raw_text_lines[i]) + 1
-            # bs4 ignores the brackets for sourcepos but we need them to extract the outside bracket text
-            tag_end = raw_text.find(end_tag, tag_st) + len(end_tag)
-
-            # Add pre-tag text + mention
-            # print("Begining text:", raw_text.replace("\n", "*******")[:1000])
-            # print("Tag St", tag_st, "End St", tag_end, "St Line", tag.sourceline)
-            # print("Adding", raw_text[cur_pos:tag_st] + "******")
-            # print("Adding2", tag.text + "******")
-            page_text += raw_text[cur_pos:tag_st] + tag.text
-            cur_pos = tag_end
-
-            if len(tag.text) > 0 and tag.get("href") is not None:
-                # print("Cur PT", page_text.replace("\n", "********"))
-                alias = tag.text
-                # # is section headers
-                title = html.unescape(unquote(tag.get("href")).split("#")[0].strip())
-                span = [len(page_text)-len(tag.text), len(page_text)]
-                test_alias = page_text[span[0]:span[1]]
-                assert tuple(span) not in entity_data
-                entity_data[tuple(span)] = {
-                    "alias": alias,
-                    "title": title,
-                    "char_span": span
-                }
-                if alias != test_alias:
-                    print(raw_text)
-                    print(page_text)
-                    print(f"Al [{alias}] Test Al [{test_alias}] Span {span} Title [{title}]")
-                    import pdb; pdb.set_trace()
-        page_text += raw_text[cur_pos:final_pos]
-        # print(raw_text)
-        # print(page_text)
-        return page_text, entity_data
+        """Extract mention information from page (see extract_mention_tags)."""
+        return extract_mention_tags(raw_text)
 
     def subprocess(
         self, i: int, total: int, text_outputdir: Path, pageids_outputdir: Path, in_filepath: Path
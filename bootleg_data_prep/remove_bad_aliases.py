@@ -20,7 +20,6 @@ import shutil
 import sys
 import threading
 import time
-from html import escape, unescape
 from collections import defaultdict
 from multiprocessing import Queue, Process
 
@@ -33,6 +32,7 @@ import bootleg_data_prep.utils.utils as utils
 import bootleg_data_prep.utils.data_prep_utils as prep_utils
 from bootleg_data_prep.language import get_lnrm, ENSURE_ASCII
 from bootleg_data_prep.utils.classes.entity_symbols_prep import EntitySymbolsPrep
+from bootleg_data_prep.utils.classes.title_index import TitleIndex, get_title_index, get_title_index_dir
 
 debug_mode = False
 
@@ -60,11 +60,10 @@ def print_memory():
     print(f"{int(process.memory_info().rss)/1024**3} GB ({process.memory_percent()}) memory used process {process}")
 
 
-def launch_subprocess(args, outdir, temp_outdir, alias_qid_from_curate, title_to_qid, disambig_qids, files):
+def launch_subprocess(args, outdir, temp_outdir, alias_qid_from_curate, title_index_dir, disambig_qids, files):
     # dump jsons to pass
     print_memory()
     print(f"Memory of alias_qid_from_curate {sys.getsizeof(alias_qid_from_curate)/1024**3}")
-    print(f"Memory of title_to_qid {sys.getsizeof(title_to_qid)/1024**3}")
 
     process_count = max(1, args.processes)
     maxsize = 10 * process_count if not debug_mode else 1
@@ -75,7 +74,7 @@ def launch_subprocess(args, outdir, temp_outdir, alias_qid_from_curate, title_to
 
     if debug_mode:
         thread = threading.Thread(target=extract_process, args=(0, jobs_queue, len(files), args, outdir,
-                                                    temp_outdir, alias_qid_from_curate, title_to_qid,
+                                                    temp_outdir, alias_qid_from_curate, title_index_dir,
                                                     disambig_qids))
         thread.start()
         for file_num, file in enumerate(files):
@@ -90,7 +89,7 @@ def launch_subprocess(args, outdir, temp_outdir, alias_qid_from_curate, title_to
         for i in range(process_count):
             extractor = Process(target=extract_process,
                                 args=(i, jobs_queue, len(files), args, outdir,
-                                      temp_outdir, alias_qid_from_curate, title_to_qid,
+                                      temp_outdir, alias_qid_from_curate, title_index_dir,
                                       disambig_qids))
             extractor.daemon = True  # only live while parent process lives
             extractor.start()
@@ -109,13 +108,14 @@ def launch_subprocess(args, outdir, temp_outdir, alias_qid_from_curate, title_to
         for w in workers:
             w.join()
 
-def extract_process(j, jobs_queue, len_files, args, outdir, temp_outdir, alias_qid_from_curate, title_to_qid, disambig_qids):
+def extract_process(j, jobs_queue, len_files, args, outdir, temp_outdir, alias_qid_from_curate, title_index_dir, disambig_qids):
     print(f"Starting worker extractor {j}")
     global alias_qid_from_curate_gl
-    global title_to_qid_gl
+    global title_index_gl
     global disambig_qids_gl
     alias_qid_from_curate_gl = alias_qid_from_curate
-    title_to_qid_gl = title_to_qid
+    # every worker mmaps the same index files
+    title_index_gl = TitleIndex(load_dir=title_index_dir)
     disambig_qids_gl = set(disambig_qids)
     while True:
         job = jobs_queue.get()  # job is (id, in_filepath)
@@ -158,19 +158,15 @@ def subprocess(i, len_files, args, outdir, temp_outdir, in_filepath):
     num_lines = sum(1 for _ in open(in_filepath))
     with jsonlines.open(in_filepath, 'r') as in_file:
         for doc in tqdm(in_file, total=num_lines):
-            title_raw = doc['page_title']
-            title = title_raw
-            if title not in title_to_qid_gl:
-                title = unescape(title_raw)
-            if title not in title_to_qid_gl:
-                title = escape(title_raw)
+            # tries the title as is, unescaped and escaped
+            _, page_qid = title_index_gl.resolve(doc['page_title'])
             new_doc = {
-                'qid': title_to_qid_gl.get(title, "-1"),
+                'qid': prep_utils.decode_qid(page_qid),
                 'title': doc['page_title'], 
                 'sentences': []
             }
-            if new_doc['qid'] != "-1":
-                wiki_page_qids.add(new_doc['qid'])
+            if page_qid != prep_utils.NO_QID:
+                wiki_page_qids.add(page_qid)
             for sentence in doc['aliases']:
                 sent_idx_str = 'sent_idx'
                 if 'doc_sent_idx' in sentence:
@@ -185,12 +181,8 @@ def subprocess(i, len_files, args, outdir, temp_outdir, in_filepath):
                 num_chars = len(sentence['sentence'])
                 # Iterate through the aliases in the sentence and check that they match the critera
                 for alias, title_raw, span in zip(sentence['aliases'], sentence['titles'], sentence['char_spans']):
-                    title = title_raw
-                    if title not in title_to_qid_gl:
-                        title = unescape(title_raw)
-                    if title not in title_to_qid_gl:
-                        title = escape(title_raw)
-                    if title not in title_to_qid_gl:
+                    title, qid = title_index_gl.resolve(title_raw)
+                    if qid == prep_utils.NO_QID:
                         discarded_counts['no_qid'] += 1
                         discarded_values['no_qid'][alias][title] += 1
                         continue
@@ -207,12 +199,11 @@ def subprocess(i, len_files, args, outdir, temp_outdir, in_filepath):
                         discarded_counts['no_alias'] += 1
                         discarded_values['no_alias'][alias][title] += 1
                         continue
-                    qid = str(title_to_qid_gl[title])
                     if qid not in alias_qid_from_curate_gl[alias]:
                         discarded_counts['not_in_filter'] += 1
                         discarded_values['not_in_filter'][alias][title] += 1
                         continue
-                    if qid == "-1":
+                    if qid == prep_utils.NO_QID:
                         discarded_counts['qid_neg_one'] += 1
                         discarded_values['qid_neg_one'][alias][title] += 1
                         continue
@@ -224,7 +215,7 @@ def subprocess(i, len_files, args, outdir, temp_outdir, in_filepath):
                     entities_kept[qid] = 1
                     total_kept += 1
                     new_sent['aliases'].append(alias)
-                    new_sent['qids'].append(qid)
+                    new_sent['qids'].append(prep_utils.decode_qid(qid))
                     new_sent['char_spans'].append(span)
                     filtered_aliases_to_qid_count[alias][qid] += 1
                     filtered_qid_count[qid] += 1
@@ -238,14 +229,15 @@ def subprocess(i, len_files, args, outdir, temp_outdir, in_filepath):
           f"Aliases kept: {total_kept} ({(total_kept / (total_kept + sum_discarded_counts)) if total_kept + sum_discarded_counts else 0}%)\n"
           f"Discarded: {json.dumps(discarded_counts, indent=4)}."
     )
-    utils.dump_json_file(os.path.join(temp_outdir, f"filtered_aliases_to_qid_count_{i}.json"), filtered_aliases_to_qid_count)
-    utils.dump_json_file(os.path.join(temp_outdir, f"filtered_qid_count_{i}.json"), filtered_qid_count)
-    utils.dump_json_file(os.path.join(temp_outdir, f"wiki_page_qids_{i}.json"), list(wiki_page_qids))
+    utils.dump_json_items(os.path.join(temp_outdir, f"filtered_aliases_to_qid_count_{i}.json"),
+                          ((alias, prep_utils.decode_qid_keys(qid_counts)) for alias, qid_counts in filtered_aliases_to_qid_count.items()))
+    utils.dump_json_file(os.path.join(temp_outdir, f"filtered_qid_count_{i}.json"), prep_utils.decode_qid_keys(filtered_qid_count))
+    utils.dump_json_file(os.path.join(temp_outdir, f"wiki_page_qids_{i}.json"), [prep_utils.decode_qid(q) for q in wiki_page_qids])
     utils.dump_json_file(os.path.join(temp_outdir, f"discarded_counts_{i}.json"), discarded_counts)
     utils.dump_json_file(os.path.join(temp_outdir, f"discarded_values_{i}.json"), discarded_values)
     return
 
-def make_entity_symbol(alias2qid_from_curate, qid_counts, qid_to_title, benchmark_qids, disambig_qids, wiki_page_qids, args):
+def make_entity_symbol(alias2qid_from_curate, qid_counts, title_index, benchmark_qids, disambig_qids, wiki_page_qids, args):
     alias2qids_out = {}
     print(f"Length of linked qids {len(qid_counts)}. Length of benchmarks {len(benchmark_qids)}. Length of wikipedia {len(wiki_page_qids)}.")
     # This means all_qids will contain every wikipedia page and benchmark QID (if added) with disambiguation pages removed.
@@ -253,14 +245,14 @@ def make_entity_symbol(alias2qid_from_curate, qid_counts, qid_to_title, benchmar
     # not need to keep non Wikipedia QIDs in at this time.
     all_qids = set(qid_counts.keys()).union(benchmark_qids)
     all_qids = all_qids.union(wiki_page_qids)
-    if "-1" in all_qids:
+    if prep_utils.NO_QID in all_qids:
         print(f"Removing -1 from all_qids...this should probably not be in the set")
-        all_qids.remove("-1")
+        all_qids.remove(prep_utils.NO_QID)
     for qid in disambig_qids:
         if qid in all_qids:
             all_qids.remove(qid)
     print(f"There are {len(all_qids)} qids about to be filtered for the entity dump and {len(alias2qid_from_curate)} raw aliases")
-    qid2title_filt = {k:qid_to_title.get(k, k) for k in all_qids}
+    qid2title_filt = {prep_utils.decode_qid(k):title_index.get_title(k, prep_utils.decode_qid(k)) for k in all_qids}
     max_candidates = 0
     max_alias_len = 0
     for alias in tqdm(list(alias2qid_from_curate.keys())):
@@ -271,7 +263,7 @@ def make_entity_symbol(alias2qid_from_curate, qid_counts, qid_to_title, benchmar
             # print(f"Deleting alias {alias} because no QIDs in our data")
         else:
             # Give QIDs not seen count of 1
-            alias2qids_out[alias] = [[qid, qid_counts.get(qid, 1)] for qid in new_qids]
+            alias2qids_out[alias] = [[prep_utils.decode_qid(qid), qid_counts.get(qid, 1)] for qid in new_qids]
             max_candidates = max(max_candidates, len(new_qids))
             max_alias_len = max(max_alias_len, len(alias.split(" ")))
 
@@ -306,9 +298,13 @@ def main():
     in_file = os.path.join(load_dir, args.alias_filter)
     # nested dict of alias: qid: score
     alias_qid_from_curate = utils.load_json_file(in_file)
+    # QIDs are kept as integer ids in memory (see prep_utils.encode_qid) and decoded when written out
+    for alias in alias_qid_from_curate:
+        alias_qid_from_curate[alias] = prep_utils.encode_qid_keys(alias_qid_from_curate[alias])
     print(f"Loaded candidates for {len(alias_qid_from_curate)} aliases from {in_file}. {time.time() - start} seconds.")
 
-    title_to_qid, qid_to_all_titles, _, qid_to_title = prep_utils.load_qid_title_map(args.title_to_qid)
+    # built once next to the title file and opened by every worker
+    title_index = get_title_index(args.title_to_qid)
     print_memory()
     # launch subprocesses
     files = glob.glob(f"{args.sentence_dir}/wiki_*")
@@ -319,13 +315,13 @@ def main():
     disambig_qids = set()
     if os.path.exists(args.disambig_qids):
         with open(args.disambig_qids) as in_file:
-            disambig_qids = json.load(in_file)
+            disambig_qids = set(prep_utils.encode_qid(q) for q in json.load(in_file))
     if len(disambig_qids) == 0:
         print("*************************\n"*10)
         print("ZERO disambig qids have been loaded. Did you mean this?")
     print(f"Loaded {len(disambig_qids)} QIDS from {args.disambig_qids}")
 
-    launch_subprocess(args, outdir, temp_outdir, alias_qid_from_curate, title_to_qid, disambig_qids, files)
+    launch_subprocess(args, outdir, temp_outdir, alias_qid_from_curate, get_title_index_dir(args.title_to_qid), disambig_qids, files)
 
     # read in dumps
     aliases_to_qid_count_files = glob.glob(f"{temp_outdir}/filtered_aliases_to_qid_count_*")
@@ -359,7 +355,9 @@ def main():
         print("ZERO benchmark qids have been loaded. Did you mean this?")
     print(f"Loaded {len(benchmark_qids)} QIDS from {args.benchmark_qids}")
 
-    make_entity_symbol(alias_qid_from_curate, qid_counts, qid_to_title, set(benchmark_qids), disambig_qids, wiki_page_qids, args)
+    make_entity_symbol(alias_qid_from_curate, prep_utils.encode_qid_keys(qid_counts), title_index,
+                       set(prep_utils.encode_qid(q) for q in benchmark_qids), disambig_qids,
+                       set(prep_utils.encode_qid(q) for q in wiki_page_qids), args)
 
     # remove temp
     shutil.rmtree(temp_outdir)
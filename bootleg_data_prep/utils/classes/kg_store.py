@@ -0,0 +1,135 @@
+import os
+from typing import Iterable, List
+
+import marisa_trie
+import numpy as np
+
+from bootleg_data_prep.utils import utils
+
+NO_RELATION = -1
+
+
+class KGStore:
+    """ Knowledge graph over integer entity ids in CSR form.
+
+    The tails of head eid h are indices[indptr[h]:indptr[h+1]], sorted, with the relation ids of the edges in the same
+    positions of rel_ids. A head and tail pair with several relations has one edge per relation. Entity ids are the ids
+    of the QIDs in the vocabulary trie (see get_eids). All arrays are memory mapped when loaded from a directory.
+    """
+    def __init__(self, load_dir: str=None, vocabulary: marisa_trie.Trie=None, heads: np.ndarray=None, tails: np.ndarray=None,
+                 rel_ids: np.ndarray=None) -> None:
+        """ Loads the store from load_dir or builds it from a vocabulary (see build_vocabulary) and the head eid,
+        tail eid and relation id of every edge, with eids from vocabulary. """
+        if load_dir is not None:
+            self.load(load_dir)
+        else:
+            self._stoi: marisa_trie = vocabulary
+            heads = np.asarray(heads, dtype=np.int64)
+            tails = np.asarray(tails, dtype=np.int64)
+            rel_ids = np.asarray(rel_ids, dtype=np.int32)
+            order = np.lexsort((rel_ids, tails, heads))
+            num_entities = len(self._stoi)
+            self.indptr = np.zeros(num_entities + 1, dtype=np.int64)
+            np.cumsum(np.bincount(heads, minlength=num_entities), out=self.indptr[1:])
+            self.indices = tails[order]
+            self.rel_ids = rel_ids[order]
+
+    def dump(self, save_dir):
+        utils.ensure_dir(save_dir)
+        self._stoi.save(os.path.join(save_dir, 'vocabulary_trie.marisa'))
+        np.save(os.path.join(save_dir, 'indptr.npy'), self.indptr)
+        np.save(os.path.join(save_dir, 'indices.npy'), self.indices)
+        np.save(os.path.join(save_dir, 'rel_ids.npy'), self.rel_ids)
+
+    def load(self, load_dir):
+        self._stoi = marisa_trie.Trie().mmap(os.path.join(load_dir, 'vocabulary_trie.marisa'))
+        self.indptr = np.load(os.path.join(load_dir, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(load_dir, 'indices.npy'), mmap_mode='r')
+        self.rel_ids = np.load(os.path.join(load_dir, 'rel_ids.npy'), mmap_mode='r')
+
+    @property
+    def num_entities(self):
+        return len(self.indptr) - 1
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def get_eids(self, qids: Iterable[str]) -> np.ndarray:
+        """ Returns the eid of every QID, -1 for QIDs not in the store """
+        return np.array([self._stoi.get(qid, -1) for qid in qids], dtype=np.int64)
+
+    def get_qid(self, eid: int) -> str:
+        return self._stoi.restore_key(int(eid))
+
+    def neighbors(self, eids: Iterable[int]) -> List[np.ndarray]:
+        """ Returns the array of (unique) tail eids of every head eid """
+        return [np.unique(self.indices[self.indptr[eid]:self.indptr[eid + 1]]) if eid >= 0 else np.zeros(0, dtype=np.int64)
+                for eid in eids]
+
+    def find_edges(self, head_eids: np.ndarray, tail_eids: np.ndarray) -> np.ndarray:
+        """ Returns the position of the first edge of every (head, tail) pair, -1 for pairs without an edge.
+        All pairs are binary searched together in their head's sorted tails. """
+        heads = np.asarray(head_eids, dtype=np.int64)
+        tails = np.asarray(tail_eids, dtype=np.int64)
+        if self.num_edges == 0:
+            return np.full(len(heads), -1, dtype=np.int64)
+        valid = (heads >= 0) & (tails >= 0)
+        safe_heads = np.where(valid, heads, 0)
+        lo = np.where(valid, self.indptr[safe_heads], 0)
+        end = np.where(valid, self.indptr[safe_heads + 1], 0)
+        hi = end.copy()
+        while True:
+            active = lo < hi
+            if not active.any():
+                break
+            mid = (lo + hi) // 2
+            go_right = self.indices[np.minimum(mid, self.num_edges - 1)] < tails
+            lo = np.where(active & go_right, mid + 1, lo)
+            hi = np.where(active & ~go_right, mid, hi)
+        found = (lo < end) & (self.indices[np.minimum(lo, self.num_edges - 1)] == tails)
+        return np.where(found, lo, -1)
+
+    def relations(self, head_eids: np.ndarray, tail_eids: np.ndarray) -> np.ndarray:
+        """ Returns the (smallest) relation id of every head -> tail pair, NO_RELATION for pairs without one """
+        positions = self.find_edges(head_eids, tail_eids)
+        if self.num_edges == 0:
+            return positions
+        return np.where(positions >= 0, self.rel_ids[np.maximum(positions, 0)], NO_RELATION)
+
+    def all_relations(self, head_eid: int, tail_eid: int) -> set:
+        """ Returns the ids of all relations head -> tail """
+        if head_eid < 0 or tail_eid < 0:
+            return set()
+        st, end = self.indptr[head_eid], self.indptr[head_eid + 1]
+        tails = self.indices[st:end]
+        pos_st, pos_end = np.searchsorted(tails, tail_eid, side='left'), np.searchsorted(tails, tail_eid, side='right')
+        return set(self.rel_ids[st + pos_st:st + pos_end].tolist())
+
+    def pair_relations(self, eids: np.ndarray) -> np.ndarray:
+        """ Returns the len(eids) x len(eids) matrix of relation ids between all pairs of eids (e.g. all candidates
+        of a sentence). Entry [i, j] is the relation eids[i] -> eids[j], NO_RELATION if there is none. """
+        eids = np.asarray(eids, dtype=np.int64)
+        heads = np.repeat(eids, len(eids))
+        tails = np.tile(eids, len(eids))
+        return self.relations(heads, tails).reshape(len(eids), len(eids))
+
+
+def build_vocabulary(qids: Iterable[str]) -> marisa_trie.Trie:
+    """ Returns the trie mapping every QID to its eid in a KGStore """
+    return marisa_trie.Trie(qids)
+
+
+def convert_record_trie(trie_file: str, fmt: str, save_dir: str) -> None:
+    """ Converts contextual relations saved in the format before the KGStore, a marisa_trie.RecordTrie of fmt mapping
+    every "<head_qid>_<tail_qid>" key to one (relation id,) record per relation, into a KGStore dumped in save_dir """
+    trie = marisa_trie.RecordTrie(fmt).mmap(trie_file)
+    head_qids, tail_qids, rel_ids = [], [], []
+    for key, (rel_id,) in trie.iteritems():
+        head_qid, tail_qid = key.split("_")
+        head_qids.append(head_qid)
+        tail_qids.append(tail_qid)
+        rel_ids.append(rel_id)
+    vocabulary = build_vocabulary(set(head_qids) | set(tail_qids))
+    KGStore(vocabulary=vocabulary, heads=[vocabulary[qid] for qid in head_qids], tails=[vocabulary[qid] for qid in tail_qids],
+            rel_ids=rel_ids).dump(save_dir)
@@ -0,0 +1,216 @@
+import os
+import time
+from collections import defaultdict
+from functools import lru_cache
+from html import escape, unescape
+from typing import Iterator, Set, Tuple
+
+import jsonlines
+import marisa_trie
+import numpy as np
+
+from bootleg_data_prep.utils import utils
+from bootleg_data_prep.utils.data_prep_utils import NO_QID, encode_qid
+
+RESOLVE_CACHE_SIZE = 2 ** 18
+INDEX_FILES = ['titles.marisa', 'all_titles.marisa', 'wpids.marisa', 'qid_codes.npy', 'resolved_ids.npy', 'qids.npy', 'qid_title_ids.npy',
+               'all_titles_indptr.npy', 'all_title_ids.npy', 'wpid_qid_codes.npy']
+INDEX_ARRAYS = ['qid_codes', 'resolved_ids', 'qids', 'qid_title_ids', 'all_titles_indptr', 'all_title_ids', 'wpid_qid_codes']
+
+
+class TitleIndex:
+    """ Persisted title to QID and QID to title index over title_to_all_ids.jsonl (see get_title_to_ids.py).
+
+    It holds the same mappings as data_prep_utils.load_qid_title_map: wikipedia titles map to their QID, redirect titles
+    to the QID of their first row unless they are a wikipedia title, every QID to its wikipedia title and all its
+    titles, and every wikipedia page id to the QID of its last row. QIDs are integer ids from data_prep_utils.encode_qid.
+
+    The titles trie also has the HTML unescaped and escaped variants of every title, mapped to what callers find by
+    trying a title as is, unescaped and escaped, in that order (resolve). resolved_ids[k] is the title key id a key
+    resolves to (k itself for titles of the mappings) and qid_codes[k] its QID. QIDs are sorted in qids, with the key
+    id of their wikipedia title in qid_title_ids and the ids of all their titles (in the all_titles trie) in
+    all_title_ids[all_titles_indptr[i]:all_titles_indptr[i+1]]. wpid_qid_codes[k] is the QID of the page id with key id k
+    in the wpids trie. Tries and arrays are memory mapped when loaded, so
+    processes opening the same index share it through the page cache.
+    """
+    def __init__(self, load_dir: str=None, title_file: str=None) -> None:
+        """ Loads the index from load_dir or builds it from a title_to_all_ids.jsonl title_file """
+        if load_dir is not None:
+            self.load(load_dir)
+        else:
+            self.build(title_file)
+
+    def build(self, title_file):
+        title_to_qid = {}
+        qid_to_title = {}
+        qid_to_all_titles = defaultdict(set)
+        wpid_to_qid = {}
+        redirect_rows = []
+        with jsonlines.open(title_file, 'r') as in_file:
+            for items in in_file:
+                qid, title, wikidata_title, wikipedia_title, wpid = items['qid'], items['title'], items['wikidata_title'], items['wikipedia_title'], items['id']
+                if str(qid) == "-1":
+                    continue
+                qid = encode_qid(qid)
+                qid_to_all_titles[qid].update([wikidata_title, wikipedia_title, title])
+                # We want to keep the wikipedia titles
+                title_to_qid[wikipedia_title] = qid
+                qid_to_title[qid] = wikipedia_title
+                wpid_to_qid[str(wpid)] = qid
+                redirect_rows.append((title, qid))
+        # The title represents a redirect. We only want to add them if the redirect title does not already point to a QID from Wikipedia.
+        for title, qid in redirect_rows:
+            if title not in title_to_qid:
+                title_to_qid[title] = qid
+        del redirect_rows
+
+        variants = {}
+        for title in title_to_qid:
+            for variant in [unescape(title), escape(title)]:
+                if variant not in title_to_qid and variant not in variants:
+                    resolved = resolve_title(variant, title_to_qid)
+                    if resolved is not None:
+                        variants[variant] = resolved
+        self._title_trie = marisa_trie.Trie(list(title_to_qid) + list(variants))
+        self.qid_codes = np.full(len(self._title_trie), NO_QID, dtype=np.int64)
+        self.resolved_ids = np.zeros(len(self._title_trie), dtype=np.int64)
+        for title, qid in title_to_qid.items():
+            key_id = self._title_trie[title]
+            self.qid_codes[key_id] = qid
+            self.resolved_ids[key_id] = key_id
+        for variant, resolved in variants.items():
+            key_id = self._title_trie[variant]
+            self.qid_codes[key_id] = title_to_qid[resolved]
+            self.resolved_ids[key_id] = self._title_trie[resolved]
+
+        self.qids = np.array(sorted(qid_to_all_titles), dtype=np.int64)
+        self.qid_title_ids = np.array([self._title_trie[qid_to_title[qid]] for qid in self.qids], dtype=np.int64)
+        self._all_titles_trie = marisa_trie.Trie(set(t for titles in qid_to_all_titles.values() for t in titles))
+        self.all_titles_indptr = np.zeros(len(self.qids) + 1, dtype=np.int64)
+        np.cumsum([len(qid_to_all_titles[qid]) for qid in self.qids], out=self.all_titles_indptr[1:])
+        self.all_title_ids = np.array([self._all_titles_trie[t] for qid in self.qids for t in sorted(qid_to_all_titles[qid])], dtype=np.int64)
+
+        self._wpid_trie = marisa_trie.Trie(wpid_to_qid)
+        self.wpid_qid_codes = np.full(len(self._wpid_trie), NO_QID, dtype=np.int64)
+        for wpid, qid in wpid_to_qid.items():
+            self.wpid_qid_codes[self._wpid_trie[wpid]] = qid
+        self._set_views()
+
+    def _set_views(self):
+        # indexing a memoryview returns a python int several times faster than indexing a numpy array
+        self._qid_codes = memoryview(self.qid_codes)
+        self._resolved_ids = memoryview(self.resolved_ids)
+        # anchor titles repeat a lot, so recent lookups are cached in each process
+        self.resolve = lru_cache(maxsize=RESOLVE_CACHE_SIZE)(self._resolve)
+
+    def dump(self, save_dir):
+        utils.ensure_dir(save_dir)
+        self._title_trie.save(os.path.join(save_dir, 'titles.marisa'))
+        self._all_titles_trie.save(os.path.join(save_dir, 'all_titles.marisa'))
+        self._wpid_trie.save(os.path.join(save_dir, 'wpids.marisa'))
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(save_dir, f'{name}.npy'), getattr(self, name))
+
+    def load(self, load_dir):
+        self._title_trie = marisa_trie.Trie().mmap(os.path.join(load_dir, 'titles.marisa'))
+        self._all_titles_trie = marisa_trie.Trie().mmap(os.path.join(load_dir, 'all_titles.marisa'))
+        self._wpid_trie = marisa_trie.Trie().mmap(os.path.join(load_dir, 'wpids.marisa'))
+        for name in INDEX_ARRAYS:
+            setattr(self, name, np.load(os.path.join(load_dir, f'{name}.npy'), mmap_mode='r'))
+        self._set_views()
+
+    @property
+    def num_qids(self):
+        return len(self.qids)
+
+    def get_title_qid(self, title: str) -> int:
+        """ Returns the QID of a title of the mappings (exact match, not a variant), NO_QID if there is none """
+        key_id = self._title_trie.get(title)
+        if key_id is None or self._resolved_ids[key_id] != key_id:
+            return NO_QID
+        return self._qid_codes[key_id]
+
+    def _resolve(self, title: str) -> Tuple[str, int]:
+        """ Returns the title of the mappings found by trying title as is, unescaped and escaped (in that order) and its
+        QID. If none is found, returns the escaped title (the last one tried) and NO_QID. """
+        key_id = self._title_trie.get(title)
+        if key_id is not None:
+            resolved_id = self._resolved_ids[key_id]
+            if resolved_id != key_id:
+                title = self._title_trie.restore_key(resolved_id)
+            return title, self._qid_codes[key_id]
+        # titles without a precomputed variant
+        for variant in [unescape(title), escape(title)]:
+            qid = self.get_title_qid(variant)
+            if qid != NO_QID:
+                return variant, qid
+        return escape(title), NO_QID
+
+    def get_qid(self, title: str) -> int:
+        """ Returns the QID of title (see resolve), NO_QID if there is none """
+        return self.resolve(title)[1]
+
+    def get_wpid_qid(self, wpid) -> int:
+        """ Returns the QID of a wikipedia page id, NO_QID if there is none """
+        key_id = self._wpid_trie.get(str(wpid))
+        if key_id is None:
+            return NO_QID
+        return int(self.wpid_qid_codes[key_id])
+
+    def _find_qid(self, qid):
+        i = int(np.searchsorted(self.qids, qid))
+        if i < len(self.qids) and self.qids[i] == qid:
+            return i
+        return -1
+
+    def get_title(self, qid: int, default: str=None) -> str:
+        """ Returns the wikipedia title of an encoded QID """
+        i = self._find_qid(qid)
+        if i < 0:
+            return default
+        return self._title_trie.restore_key(int(self.qid_title_ids[i]))
+
+    def get_all_titles(self, qid: int) -> Set[str]:
+        """ Returns the titles, wikidata titles and wikipedia titles of an encoded QID """
+        i = self._find_qid(qid)
+        if i < 0:
+            return set()
+        return set(self._all_titles_trie.restore_key(int(t)) for t in self.all_title_ids[self.all_titles_indptr[i]:self.all_titles_indptr[i + 1]])
+
+    def qid_titles(self) -> Iterator[Tuple[int, Set[str]]]:
+        """ Returns generator over (encoded QID, all titles) in QID order """
+        for i, qid in enumerate(self.qids):
+            yield int(qid), set(self._all_titles_trie.restore_key(int(t)) for t in self.all_title_ids[self.all_titles_indptr[i]:self.all_titles_indptr[i + 1]])
+
+
+def resolve_title(title, title_to_qid):
+    """ Returns the key of title_to_qid found by trying title as is, unescaped and escaped (in that order), None if there is none """
+    for variant in [title, unescape(title), escape(title)]:
+        if variant in title_to_qid:
+            return variant
+    return None
+
+def get_title_index_dir(title_file):
+    return os.path.splitext(title_file)[0] + "_index"
+
+def build_title_index(title_file, save_dir=None):
+    """ Builds the index of title_file and saves it to save_dir (by default title_to_all_ids_index next to title_file) """
+    start = time.time()
+    save_dir = save_dir if save_dir is not None else get_title_index_dir(title_file)
+    title_index = TitleIndex(title_file=title_file)
+    title_index.dump(save_dir)
+    print(f"Built title index of {len(title_index.qid_codes)} titles (with variants) and {title_index.num_qids} QIDs in {save_dir}. "
+          f"{time.time() - start} seconds.")
+    return save_dir
+
+def get_title_index(title_file):
+    """ Opens the index of title_file, building it first if it is missing or older than title_file """
+    index_dir = get_title_index_dir(title_file)
+    index_files = [os.path.join(index_dir, f) for f in INDEX_FILES]
+    if not all(os.path.exists(f) for f in index_files) or \
+            min(os.path.getmtime(f) for f in index_files) < os.path.getmtime(title_file):
+        build_title_index(title_file, index_dir)
+    start = time.time()
+    title_index = TitleIndex(load_dir=index_dir)
+    print(f"Loaded title index of {title_index.num_qids} QIDs from {index_dir}. {time.time() - start} seconds.")
+    return title_index
@@ -0,0 +1,177 @@
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import marisa_trie
+import numpy as np
+
+from bootleg_data_prep.utils import utils
+
+
+class TypeHierarchy:
+    """ Materialized closure of the Wikidata subclass of (P279) hierarchy with the instance of (P31) types of entities.
+
+    Types and entities have integer ids from their vocabulary tries (get_type_ids and get_eids). In CSR form,
+    ancestors[type_indptr[t]:type_indptr[t+1]] are the sorted ids of all types t is a subclass of, including t
+    itself, and entity_types[entity_indptr[e]:entity_indptr[e+1]] are the direct types of entity e. The type
+    vocabulary only has the direct types of entities and their ancestors. All arrays are memory mapped when loaded.
+    """
+    def __init__(self, load_dir: str=None, subclass_edges: Iterable[Tuple[str, str]]=None,
+                 entity_types: Dict[str, List[str]]=None) -> None:
+        """ Loads the hierarchy from load_dir or builds it from (child, parent) P279 edges and the P31 types of every entity """
+        self._descendant_masks = {}
+        if load_dir is not None:
+            self.load(load_dir)
+        else:
+            self.build(subclass_edges, entity_types)
+
+    def build(self, subclass_edges, entity_types):
+        parents = defaultdict(set)
+        for child, parent in subclass_edges:
+            if child != parent:
+                parents[child].add(parent)
+        # only keep the types reachable from entity types
+        type_qids = set()
+        stack = [t for types in entity_types.values() for t in types]
+        while len(stack) > 0:
+            type_qid = stack.pop()
+            if type_qid in type_qids:
+                continue
+            type_qids.add(type_qid)
+            stack.extend(p for p in parents.get(type_qid, []) if p not in type_qids)
+        self._type_stoi = marisa_trie.Trie(type_qids)
+        self._entity_stoi = marisa_trie.Trie(entity_types.keys())
+        num_types = len(self._type_stoi)
+        type_parents = [[] for _ in range(num_types)]
+        for type_qid in type_qids:
+            type_parents[self._type_stoi[type_qid]] = [self._type_stoi[p] for p in parents.get(type_qid, [])]
+        self.type_indptr, self.ancestors = compute_closure(type_parents)
+
+        num_entities = len(self._entity_stoi)
+        entity_type_lists = [[] for _ in range(num_entities)]
+        for qid, types in entity_types.items():
+            entity_type_lists[self._entity_stoi[qid]] = sorted(set(self._type_stoi[t] for t in types))
+        self.entity_indptr = np.zeros(num_entities + 1, dtype=np.int64)
+        np.cumsum([len(types) for types in entity_type_lists], out=self.entity_indptr[1:])
+        self.entity_types = np.array([t for types in entity_type_lists for t in types], dtype=np.int32)
+
+    def dump(self, save_dir):
+        utils.ensure_dir(save_dir)
+        self._type_stoi.save(os.path.join(save_dir, 'type_vocabulary_trie.marisa'))
+        self._entity_stoi.save(os.path.join(save_dir, 'entity_vocabulary_trie.marisa'))
+        for name in ['type_indptr', 'ancestors', 'entity_indptr', 'entity_types']:
+            np.save(os.path.join(save_dir, f'{name}.npy'), getattr(self, name))
+
+    def load(self, load_dir):
+        self._type_stoi = marisa_trie.Trie().mmap(os.path.join(load_dir, 'type_vocabulary_trie.marisa'))
+        self._entity_stoi = marisa_trie.Trie().mmap(os.path.join(load_dir, 'entity_vocabulary_trie.marisa'))
+        for name in ['type_indptr', 'ancestors', 'entity_indptr', 'entity_types']:
+            setattr(self, name, np.load(os.path.join(load_dir, f'{name}.npy'), mmap_mode='r'))
+
+    @property
+    def num_types(self):
+        return len(self.type_indptr) - 1
+
+    @property
+    def num_entities(self):
+        return len(self.entity_indptr) - 1
+
+    def get_type_ids(self, type_qids: Iterable[str]) -> np.ndarray:
+        """ Returns the type id of every type QID, -1 for types not in the hierarchy """
+        return np.array([self._type_stoi.get(qid, -1) for qid in type_qids], dtype=np.int64)
+
+    def get_type_qid(self, type_id: int) -> str:
+        return self._type_stoi.restore_key(int(type_id))
+
+    def get_eids(self, qids: Iterable[str]) -> np.ndarray:
+        """ Returns the eid of every entity QID, -1 for entities without types """
+        return np.array([self._entity_stoi.get(qid, -1) for qid in qids], dtype=np.int64)
+
+    def get_ancestors(self, type_id: int) -> np.ndarray:
+        """ Returns the ids of all types type_id is a subclass of, including itself """
+        return self.ancestors[self.type_indptr[type_id]:self.type_indptr[type_id + 1]]
+
+    def get_direct_types(self, eid: int) -> np.ndarray:
+        return self.entity_types[self.entity_indptr[eid]:self.entity_indptr[eid + 1]]
+
+    def get_descendant_mask(self, type_id: int) -> np.ndarray:
+        """ Returns a boolean array over type ids that is True for the subclasses of type_id (and type_id itself) """
+        if type_id not in self._descendant_masks:
+            counts = np.concatenate([[0], np.cumsum(self.ancestors == type_id)])
+            self._descendant_masks[type_id] = counts[self.type_indptr[1:]] > counts[self.type_indptr[:-1]]
+        return self._descendant_masks[type_id]
+
+    def is_a(self, eids: np.ndarray, type_id: int) -> np.ndarray:
+        """ Returns a boolean array that is True for the eids that are an instance of type_id or of one of its subclasses """
+        eids = np.asarray(eids, dtype=np.int64)
+        if type_id < 0:
+            return np.zeros(len(eids), dtype=bool)
+        safe_eids = np.where(eids >= 0, eids, 0)
+        starts = self.entity_indptr[safe_eids]
+        lengths = np.where(eids >= 0, self.entity_indptr[safe_eids + 1] - starts, 0)
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        # positions in entity_types of the direct types of all eids, in order
+        positions = np.repeat(starts - bounds[:-1], lengths) + np.arange(bounds[-1])
+        hits = np.concatenate([[0], np.cumsum(self.get_descendant_mask(type_id)[self.entity_types[positions]])])
+        return hits[bounds[1:]] > hits[bounds[:-1]]
+
+
+def compute_closure(type_parents: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns the CSR indptr and sorted ancestors (including the type) of every type given the parents of every type.
+
+    Wikidata has subclass cycles, so the strongly connected components are found first (iterative Tarjan). Tarjan
+    finishes a component after all components reachable from it, i.e. after all its ancestors, so the closure of a
+    component is its types plus the closures of its parent components. All types of a component share the closure.
+    """
+    num_types = len(type_parents)
+    index = [-1] * num_types
+    lowlink = [0] * num_types
+    on_stack = [False] * num_types
+    component = [-1] * num_types
+    closures = []
+    stack = []
+    next_index = 0
+    for root in range(num_types):
+        if index[root] >= 0:
+            continue
+        work = [(root, 0)]
+        while len(work) > 0:
+            node, child_i = work.pop()
+            if child_i == 0:
+                index[node] = lowlink[node] = next_index
+                next_index += 1
+                stack.append(node)
+                on_stack[node] = True
+            recurse = False
+            parents = type_parents[node]
+            while child_i < len(parents):
+                parent = parents[child_i]
+                child_i += 1
+                if index[parent] < 0:
+                    work.append((node, child_i))
+                    work.append((parent, 0))
+                    recurse = True
+                    break
+                elif on_stack[parent]:
+                    lowlink[node] = min(lowlink[node], index[parent])
+            if recurse:
+                continue
+            if lowlink[node] == index[node]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = len(closures)
+                    members.append(member)
+                    if member == node:
+                        break
+                parent_components = set(component[p] for m in members for p in type_parents[m]) - {len(closures)}
+                closures.append(np.unique(np.concatenate([np.array(members, dtype=np.int32)] +
+                                                         [closures[c] for c in parent_components]).astype(np.int32)))
+            if len(work) > 0:
+                caller = work[-1][0]
+                lowlink[caller] = min(lowlink[caller], lowlink[node])
+    indptr = np.zeros(num_types + 1, dtype=np.int64)
+    np.cumsum([len(closures[component[t]]) for t in range(num_types)], out=indptr[1:])
+    ancestors = np.concatenate([closures[component[t]] for t in range(num_types)] + [np.zeros(0, dtype=np.int32)])
+    return indptr, ancestors
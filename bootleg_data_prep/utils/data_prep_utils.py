@@ -10,15 +10,44 @@ import time
 from collections import defaultdict
 from datetime import datetime
 import os
+import re
 
 from bootleg_data_prep.utils import utils
+from simple_wikidata_db.utils import ENTITY_ID_PREFIXES, encode_entity_id, decode_entity_id
+
+# integer id of the "-1" (no QID) placeholder
+NO_QID = -1
+# ids encode_qid can round trip: a Q/P/L prefix and a number without leading zeros
+ENCODABLE_QID = re.compile(f"[{''.join(ENTITY_ID_PREFIXES)}](0|[1-9][0-9]*)")
 
 
 def print_memory():
     process = psutil.Process(os.getpid())
     print(f"{int(process.memory_info().rss)/1024**3} GB ({process.memory_percent()} %) memory used process {process}")
 
-def load_qid_title_map(title_to_qid_fpath):
+def encode_qid(qid):
+    """Encodes a QID string as a compact integer id (see simple_wikidata_db.utils.encode_entity_id). "-1" maps to NO_QID."""
+    qid = str(qid)
+    if qid == "-1":
+        return NO_QID
+    if ENCODABLE_QID.fullmatch(qid) is None:
+        raise ValueError(f"Can not encode {qid!r} as an integer id. Only ids like Q42, P31 or L7 and the \"-1\" placeholder are supported.")
+    return encode_entity_id(qid)
+
+def decode_qid(code):
+    """Decodes an integer id from encode_qid back to the QID string."""
+    if code == NO_QID:
+        return "-1"
+    return decode_entity_id(code)
+
+def encode_qid_keys(qid_dict):
+    return {encode_qid(q): v for q, v in qid_dict.items()}
+
+def decode_qid_keys(qid_dict):
+    return {decode_qid(q): v for q, v in qid_dict.items()}
+
+def load_qid_title_map(title_to_qid_fpath, encode_qids=False):
+    """Loads the title-QID mappings. If encode_qids, every QID (as value or key) is an integer id from encode_qid."""
     start = time.time()
     title_to_qid = {}
     qid_to_all_titles = defaultdict(set)
@@ -31,6 +60,8 @@ def load_qid_title_map(title_to_qid_fpath):
             qid, title, wikidata_title, wikipedia_title, wpid = items['qid'], items['title'], items['wikidata_title'], items['wikipedia_title'], items['id']
             if str(qid) == "-1":
                 continue
+            if encode_qids:
+                qid = encode_qid(qid)
             all_rows.append([qid, title, wikidata_title, wikipedia_title, wpid])
             qid_to_all_titles[qid].add(wikidata_title)
             qid_to_all_titles[qid].add(wikipedia_title)
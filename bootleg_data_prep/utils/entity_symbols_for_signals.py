@@ -1,6 +1,6 @@
-import json
 import os
 import shutil
+from array import array
 from argparse import Namespace
 from collections import defaultdict
 
@@ -11,8 +11,10 @@ import numpy as np
 from bootleg_data_prep.utils import data_prep_utils as prep_utils
 from bootleg_data_prep.utils.constants import QIDCOUNT, TYPEWORDS, VOCAB, VOCABFILE, ALIAS2QID, QID2TYPEID_HY, \
     QID2TYPEID_WD, RELMAPPING, CTXRELS, QID2TYPEID_REL, RELATIONWORDS
+from bootleg_data_prep.utils.classes.kg_store import KGStore, NO_RELATION, build_vocabulary, convert_record_trie
 from bootleg_data_prep.utils.classes.record_trie_collection import RecordTrieCollection
 from bootleg_data_prep.utils.classes.type_symbols import TypeSymbols
+from bootleg_data_prep.utils.qid_sorted_store import store_generator
 from bootleg.symbols.entity_symbols import EntitySymbols
 from bootleg_data_prep.utils import utils as utils
 
@@ -69,10 +71,13 @@ def get_tri_dir(dir):
 
 def load_contextual_rels(dir):
     config_file = os.path.join(dir, "config.json")
-    if utils.exists_dir(config_file):
+    if not utils.exists_dir(os.path.join(dir, "indptr.npy")) and utils.exists_dir(config_file):
+        # entity dumps saved before the KGStore hold a record trie; convert it in place once
+        print(f"Converting the contextual relations in {dir} to a KGStore")
         contextual_rels_config = utils.load_json_file(config_file)
-        contextual_rels = marisa_trie.RecordTrie(contextual_rels_config["fmt"]).mmap(os.path.join(dir, f'{CTXRELS}.marisa'))
-        return contextual_rels
+        convert_record_trie(os.path.join(dir, f'{CTXRELS}.marisa'), contextual_rels_config["fmt"], dir)
+    if utils.exists_dir(os.path.join(dir, "indptr.npy")):
+        return KGStore(load_dir=dir)
     else:
         return None
 
@@ -207,34 +212,30 @@ class EntitySymbolsForSlice:
         return self.tri_collection.get_keys(ALIAS2QID)
 
     def get_relation(self, qid1, qid2):
-        pair1 = self.format_relation_pair(qid1, qid2)
-        pair2 = self.format_relation_pair(qid2, qid1)
-        if pair1 in self.contextual_rel:
-            return self.contextual_rel[pair1][0][0]
-        elif pair2 in self.contextual_rel:
-            return self.contextual_rel[pair2][0][0]
+        eid1, eid2 = self.contextual_rel.get_eids([qid1, qid2])
+        rel1, rel2 = self.contextual_rel.relations([eid1, eid2], [eid2, eid1])
+        if rel1 != NO_RELATION:
+            return int(rel1)
+        elif rel2 != NO_RELATION:
+            return int(rel2)
         return None
 
     def get_all_relations(self, qid1, qid2):
-        pair1 = self.format_relation_pair(qid1, qid2)
-        pair2 = self.format_relation_pair(qid2, qid1)
-        rels = set()
-        if pair1 in self.contextual_rel:
-            for item in self.contextual_rel[pair1][0]:
-                rels.add(item)
-        if pair2 in self.contextual_rel:
-            for item in self.contextual_rel[pair2][0]:
-                rels.add(item)
-        return rels
+        eid1, eid2 = self.contextual_rel.get_eids([qid1, qid2])
+        return self.contextual_rel.all_relations(eid1, eid2) | self.contextual_rel.all_relations(eid2, eid1)
+
+    def get_pair_relations(self, qids):
+        """ Returns the len(qids) x len(qids) matrix of relation ids between all pairs of qids (e.g. all candidates of
+        a sentence) in one vectorized lookup. Like get_relation, [i, j] is the relation qids[i] -> qids[j], or else
+        qids[j] -> qids[i], and NO_RELATION if there is none. """
+        rels = self.contextual_rel.pair_relations(self.contextual_rel.get_eids(qids))
+        return np.where(rels != NO_RELATION, rels, rels.T)
 
     def get_relation_name(self, relid):
         if relid is None or str(relid) not in self.contextual_rel_vocab_inv:
             return None
         return self.contextual_rel_vocab_inv[str(relid)]
 
-    def format_relation_pair(self, head, tail):
-        return f"{head}_{tail}"
-
     @classmethod
     def load(cls, entity_dump_dir):
         """ A method for loading the data for a separate entity_dump_directory. Good if the data is being moved around and the entity_dump dir is different."""
@@ -338,34 +339,40 @@ def load_relations(args, rel_file, all_qids):
     return rel_mapping
 
 def load_contextual_relations(args, rel_file, entity_dump_dir, all_qids):
-    all_relations = json.load(open(rel_file, "r", encoding="utf-8"))
-    keys = []
-    values = []
-    all_rels = sorted(list(set([k for rel_dict in track(all_relations.values(), total=len(all_relations)) for k in rel_dict.keys()])))
-    rels_vocab = {r:i for i, r in enumerate(all_rels)}
+    # edges are collected as eids of the KGStore vocabulary
+    vocabulary = build_vocabulary(all_qids)
+    heads = array("q")
+    tails = array("q")
+    values = array("l")
+    # the triples are streamed once. Relations get ids in order of appearance, which are remapped to sorted order below.
+    seen_rels = {}
     all_qids_set = set(all_qids)
-    for head_qid in track(all_relations, total=len(all_relations)):
+    for head_qid, rels in track(store_generator(rel_file)):
+        for rel in rels:
+            if rel not in seen_rels:
+                seen_rels[rel] = len(seen_rels)
         if head_qid not in all_qids_set:
             continue
-        for rel in all_relations[head_qid]:
-            for tail_qid in all_relations[head_qid][rel]:
+        head = vocabulary[head_qid]
+        for rel in rels:
+            for tail_qid in rels[rel]:
                 if tail_qid not in all_qids_set:
                     continue
-                key = f"{head_qid}_{tail_qid}"
-                value = rels_vocab[rel]
-                keys.append(key)
-                values.append(tuple([value]))
+                heads.append(head)
+                tails.append(vocabulary[tail_qid])
+                values.append(seen_rels[rel])
     if len(values) == 0:
         return
-    fmt = "<" + "l"
-    trie = marisa_trie.RecordTrie(fmt, zip(keys, values))
-    config = {"fmt": fmt}
+    all_rels = sorted(seen_rels)
+    rels_vocab = {r:i for i, r in enumerate(all_rels)}
+    seen_to_sorted = {seen_rels[r]: rels_vocab[r] for r in seen_rels}
+    values = np.array([seen_to_sorted[value] for value in values], dtype=np.int32)
+    kg_store = KGStore(vocabulary=vocabulary, heads=np.frombuffer(heads, dtype=np.int64),
+                       tails=np.frombuffer(tails, dtype=np.int64), rel_ids=values)
     out_dir = get_contextual_rel_dir(entity_dump_dir)
-    utils.ensure_dir(out_dir)
-    utils.dump_json_file(filename=os.path.join(out_dir, "config.json"), contents=config)
-    trie.save(os.path.join(out_dir, f'{CTXRELS}.marisa'))
+    kg_store.dump(out_dir)
     vocab_inv = {rels_vocab[k]:k for k in rels_vocab}
-    return trie, vocab_inv
+    return kg_store, vocab_inv
 
 def load_tri_collection(args, entity_symbols):
     entity_dump_dir = os.path.join(args.data_dir, f"{args.subfolder_name}", "entity_db/entity_mappings")
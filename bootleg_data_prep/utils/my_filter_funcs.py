@@ -6,6 +6,8 @@ import ujson as json
 import itertools
 import os
 
+from bootleg_data_prep.utils.classes.type_hierarchy import TypeHierarchy
+
 def prep_kg(args):
     all_triples_head = {}
     for trip in open(os.path.join(args.prep_file), "r", encoding="utf-8").readlines():
@@ -27,6 +29,21 @@ def prep_standard(args):
         to_keep = set(res)
     return {"to_keep": to_keep}
 
+def prep_type_hierarchy(args):
+    # prep_file is the type_hierarchy directory written by get_type_hierarchy.py and filter_file a JSON list of type QIDs
+    to_keep = set()
+    if args.filter_file != "":
+        to_keep = set(json.load(open(args.filter_file, "r", encoding="utf-8")))
+    return {"type_hierarchy_dir": args.prep_file, "to_keep": to_keep}
+
+# The type hierarchy is memory mapped once per process instead of being pickled with the extras
+type_hierarchies = {}
+
+def get_type_hierarchy(type_hierarchy_dir):
+    if type_hierarchy_dir not in type_hierarchies:
+        type_hierarchies[type_hierarchy_dir] = TypeHierarchy(load_dir=type_hierarchy_dir)
+    return type_hierarchies[type_hierarchy_dir]
+
 # True means filter/remove
 # False means keep
 
@@ -68,6 +85,18 @@ def sentence_filterAliases(args, aliases, qids, parent_qid, sentence, extras):
     discard = discard | (len(set(aliases).intersection(aliases_to_keep)) == 0)
     return discard
 
+def sentence_filterType(args, aliases, qids, parent_qid, sentence, extras):
+    # Keeps sentences with a QID that is an instance of one of the to_keep types or of their subclasses
+    discard = long_sentence(sentence)
+    if discard:
+        return True
+    type_hierarchy = get_type_hierarchy(extras['type_hierarchy_dir'])
+    eids = type_hierarchy.get_eids(qids)
+    for type_id in type_hierarchy.get_type_ids(extras['to_keep']):
+        if type_hierarchy.is_a(eids, type_id).any():
+            return False
+    return True
+
 def sentence_filterQIDMarriage(args, aliases, qids, parent_qid, sentence, extras):
     qids_to_keep = extras['to_keep']
     # Discard long sentences early to avoid large qid cross product
@@ -0,0 +1,99 @@
+'''
+QID sorted runs and stores
+
+Workers write their per-QID results as runs: jsonl files of [qid, value] lines sorted by QID. The parent merges the runs
+with a streaming k-way merge (merge_sorted_runs), so it only holds one line per run in memory, and writes a store: a
+directory of QID sorted jsonl shards with an index.json of the first and last QID of every shard.
+
+Readers either iterate a store (store_generator) or look up single QIDs (QIDSortedStore), which binary searches the shard
+index and loads only the shard holding the QID. store_generator also reads the older single json dict files.
+'''
+import heapq
+import os
+from bisect import bisect_right
+from itertools import groupby
+
+import ujson as json
+
+from bootleg_data_prep.language import ENSURE_ASCII
+
+STORE_INDEX_FILE = "index.json"
+
+
+def write_sorted_run(filename, qid_dict):
+    """ Writes the items of qid_dict as a QID sorted run """
+    with open(filename, "w", encoding="utf8") as out_f:
+        for qid in sorted(qid_dict):
+            out_f.write(json.dumps([qid, qid_dict[qid]], ensure_ascii=ENSURE_ASCII, escape_forward_slashes=False) + "\n")
+
+def run_generator(filename):
+    """ Returns generator over (qid, value) of a run """
+    with open(filename, "r", encoding="utf8") as in_f:
+        for line in in_f:
+            qid, value = json.loads(line)
+            yield qid, value
+
+def merge_sorted_runs(run_files, merge_values):
+    """ Returns QID sorted generator over (qid, merged value) of all runs.
+    merge_values gets the values of a QID in run order (a QID may be in several runs). """
+    merged = heapq.merge(*[run_generator(f) for f in run_files], key=lambda item: item[0])
+    for qid, items in groupby(merged, key=lambda item: item[0]):
+        yield qid, merge_values([value for _, value in items])
+
+def write_store(out_dir, items, shard_size):
+    """ Writes the QID sorted (qid, value) items as a store of shards of shard_size QIDs. Returns the number of QIDs. """
+    os.makedirs(out_dir, exist_ok=True)
+    # drop the shards of a previous run
+    for fname in os.listdir(out_dir):
+        if fname.startswith("shard_") or fname == STORE_INDEX_FILE:
+            os.remove(os.path.join(out_dir, fname))
+    shards = []
+    out_f = None
+    num_qids = 0
+    for qid, value in items:
+        if num_qids % shard_size == 0:
+            if out_f is not None:
+                out_f.close()
+            shards.append({"file": f"shard_{len(shards):05d}.jsonl", "first_qid": qid, "last_qid": qid, "num_qids": 0})
+            out_f = open(os.path.join(out_dir, shards[-1]["file"]), "w", encoding="utf8")
+        out_f.write(json.dumps([qid, value], ensure_ascii=ENSURE_ASCII, escape_forward_slashes=False) + "\n")
+        shards[-1]["last_qid"] = qid
+        shards[-1]["num_qids"] += 1
+        num_qids += 1
+    if out_f is not None:
+        out_f.close()
+    with open(os.path.join(out_dir, STORE_INDEX_FILE), "w", encoding="utf8") as out_f:
+        json.dump({"shards": shards, "num_qids": num_qids}, out_f, ensure_ascii=ENSURE_ASCII)
+    return num_qids
+
+def store_generator(path):
+    """ Returns QID sorted generator over (qid, value) of a store, or over the items of a json dict file """
+    if not os.path.isdir(path):
+        with open(path, "r", encoding="utf8") as in_f:
+            yield from json.load(in_f).items()
+        return
+    with open(os.path.join(path, STORE_INDEX_FILE), "r", encoding="utf8") as in_f:
+        shards = json.load(in_f)["shards"]
+    for shard in shards:
+        yield from run_generator(os.path.join(path, shard["file"]))
+
+
+class QIDSortedStore:
+    """ Looks up the value of single QIDs in a store. The last loaded shard is kept in memory. """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, STORE_INDEX_FILE), "r", encoding="utf8") as in_f:
+            self.shards = json.load(in_f)["shards"]
+        self.first_qids = [shard["first_qid"] for shard in self.shards]
+        self.loaded_shard = None
+        self.loaded_values = {}
+
+    def get(self, qid, default=None):
+        i = bisect_right(self.first_qids, qid) - 1
+        if i < 0 or qid > self.shards[i]["last_qid"]:
+            return default
+        if self.loaded_shard != i:
+            self.loaded_values = dict(run_generator(os.path.join(self.path, self.shards[i]["file"])))
+            self.loaded_shard = i
+        return self.loaded_values.get(qid, default)
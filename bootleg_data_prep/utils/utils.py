@@ -28,6 +28,18 @@ def dump_json_file(filename, contents):
         except TypeError:
             json.dump(contents, f, ensure_ascii=ENSURE_ASCII)
 
+def dump_json_items(filename, items):
+    """Streams (key, value) pairs into a single json dict without materializing the dict"""
+    with open(filename, 'w', encoding='utf8') as f:
+        f.write('{')
+        for i, (k, v) in enumerate(items):
+            if i > 0:
+                f.write(',')
+            f.write(ujson.dumps(str(k), ensure_ascii=ENSURE_ASCII))
+            f.write(':')
+            f.write(ujson.dumps(v, ensure_ascii=ENSURE_ASCII))
+        f.write('}')
+
 def load_json_file(filename):
     with open(filename, 'r', encoding="utf-8") as f:
         contents = ujson.load(f)
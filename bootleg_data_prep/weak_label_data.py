@@ -32,7 +32,7 @@ class WLMetadata:
             qid2alias = {}
             qid2alias_wd = {}
 
-            self.qid2title = entity_dump.get_qid2title_dict()
+            self.qid2title = prep_utils.encode_qid_keys(entity_dump.get_qid2title_dict())
             all_alias_len = []
             all_qid_len = []
             for alias in tqdm(entity_dump.get_all_aliases(), desc="Iterating over aliases"):
@@ -48,6 +48,7 @@ class WLMetadata:
             for qid, alias_cands in tqdm(qid2alias.items(), desc="Iterating over qids"):
                 all_alias_len.append(len(alias_cands))
 
+            # alias2qid_wd holds integer ids from prep_utils.encode_qid
             for alias in tqdm(alias2qid_wd, desc="Iterating over WD aliases"):
                 assert len(alias.strip()) > 0
                 for qid in alias2qid_wd[alias]:
@@ -67,8 +68,8 @@ class WLMetadata:
             for qid in tqdm(list(qid2alias.keys()), desc="Iterating over qids"):
                 qid2alias[qid] = qid2alias[qid][:max_aliases]
 
-            for qid in tqdm(list(qid2alias_wd.keys()), desc="Iterating over WD qids"):
-                qid2alias_wd[qid] = qid2alias_wd[qid][:max_aliases]
+            # the record tries are keyed by QID strings
+            qid2alias_wd = {prep_utils.decode_qid(qid): aliases[:max_aliases] for qid, aliases in tqdm(qid2alias_wd.items(), desc="Iterating over WD qids")}
 
             # This maps our keys that we use in the helper functions below to the right tri in tri collection.
             # The values are specific strings as outlines in the record trie collection class
@@ -131,8 +132,7 @@ class WLMetadata:
         self.tri_collection_qids.dump(save_dir=self.get_qid_tri_dir(dump_dir))
         self.tri_collection_aliases.dump(save_dir=self.get_alias_tri_dir(dump_dir))
         self.tri_collection_aliases_wd.dump(save_dir=self.get_alias_tri_wd_dir(dump_dir))
-        with open(self.get_qid2title_file(dump_dir), "w", encoding='utf8') as out_f:
-            ujson.dump(self.qid2title, out_f, ensure_ascii=ENSURE_ASCII)
+        utils.dump_json_items(self.get_qid2title_file(dump_dir), ((prep_utils.decode_qid(qid), title) for qid, title in self.qid2title.items()))
 
     @classmethod
     def load(cls, dump_dir):
@@ -140,7 +140,7 @@ class WLMetadata:
         tri_collection_aliases = RecordTrieCollection(load_dir=cls.get_alias_tri_dir(dump_dir))
         tri_collection_aliases_wd = RecordTrieCollection(load_dir=cls.get_alias_tri_wd_dir(dump_dir))
         with open(cls.get_qid2title_file(dump_dir)) as in_f:
-            qid2title = ujson.load(in_f)
+            qid2title = prep_utils.encode_qid_keys(ujson.load(in_f))
         return cls(entity_dump=None, alias2qid_wd=None, qid2title=qid2title, tri_collection_qids=tri_collection_qids, tri_collection_aliases=tri_collection_aliases, tri_collection_aliases_wd=tri_collection_aliases_wd)
 
     def contains_qid(self, qid):
@@ -176,7 +176,7 @@ class WLMetadata:
             return -1
 
     def get_title(self, qid):
-        return self.qid2title.get(qid, None)
+        return self.qid2title.get(prep_utils.encode_qid(qid), None)
 
 
 def parse_args():
@@ -344,13 +344,17 @@ def subprocess(all_args):
                 # Update stats
                 if len(final_aliases) > 0:
                     for alias, qid, source in zip(final_aliases, final_qids, final_sources):
+                        qid = prep_utils.encode_qid(qid)
                         filtered_qid_counts[source][qid] += 1
                         filtered_aliases_to_qid_count[source][alias][qid] += 1
             doc['sentences'] = new_sentences
             out_file.write(ujson.dumps(doc, ensure_ascii=ENSURE_ASCII) + '\n')
     out_file.close()
-    utils.dump_json_file(os.path.join(temp_outdir, f"filtered_alias_to_qid_count_{idx}.json"), filtered_aliases_to_qid_count)
-    utils.dump_json_file(os.path.join(temp_outdir, f"filtered_qid_counts_{idx}.json"), filtered_qid_counts)
+    utils.dump_json_items(os.path.join(temp_outdir, f"filtered_alias_to_qid_count_{idx}.json"),
+                          ((source, {alias: prep_utils.decode_qid_keys(qid_counts) for alias, qid_counts in alias_counts.items()})
+                           for source, alias_counts in filtered_aliases_to_qid_count.items()))
+    utils.dump_json_items(os.path.join(temp_outdir, f"filtered_qid_counts_{idx}.json"),
+                          ((source, prep_utils.decode_qid_keys(qid_counts)) for source, qid_counts in filtered_qid_counts.items()))
     print(f"Finished {idx}/{total}. Written to {out_fname}. {time.time() - start_time} seconds.")
     print(ujson.dumps(added_alias, indent=4, ensure_ascii=ENSURE_ASCII))
     return no_qid
@@ -478,8 +482,11 @@ def main():
         print(f"Loaded entity dump with {entity_dump.num_entities} entities.")
 
         print(f"Reading WD aliases")
-        with open(args.wd_aliases) as in_f:
-            wd_a2q = {k:v for k,v in ujson.load(in_f).items() if len(k.strip()) > 0}
+        # one {alias: qids} json per line (older files hold every alias on a single line); QIDs are kept as integer ids
+        wd_a2q = {}
+        with open(args.wd_aliases, encoding="utf-8") as in_f:
+            for line in in_f:
+                wd_a2q.update((k, [prep_utils.encode_qid(q) for q in v]) for k, v in ujson.loads(line).items() if len(k.strip()) > 0)
 
         utils.ensure_dir(wl_metadata_dump)
         wl_metadata = WLMetadata(entity_dump, wd_a2q)
@@ -490,23 +497,28 @@ def main():
     print(f"Loaded {len(in_files)} files from {path}. Launching {args.processes} processes.")
     docs_not_qid = launch_subprocess(args, outdir, temp_outdir, wl_metadata_dump, in_files)
 
-    # Gather new counts
+    # Gather new counts, one file at a time. QIDs are kept as integer ids in memory and decoded when written out
     # Total QID count
     qid_count_files = glob.glob(f"{temp_outdir}/filtered_qid_counts_*")
-    list_of_qids_dicts = [utils.load_json_file(f) for f in qid_count_files]
-    filtered_qid_count = prep_utils.aggregate_list_of_nested_dictionaries(list_of_qids_dicts)
+    filtered_qid_count = defaultdict(lambda: defaultdict(int))
+    for f in qid_count_files:
+        for source_key, subdict in utils.load_json_file(f).items():
+            for qid, cnt in subdict.items():
+                filtered_qid_count[source_key][prep_utils.encode_qid(qid)] += cnt
     # Alias, qid pair counts
     aliases_to_qid_count_files = glob.glob(f"{temp_outdir}/filtered_alias_to_qid_count_*")
-    list_of_alias_dicts = [utils.load_json_file(f) for f in aliases_to_qid_count_files]
     filtered_aliases_to_qid = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-    for subdict in list_of_alias_dicts:
-        for source_key, subsubdict in subdict.items():
+    for f in aliases_to_qid_count_files:
+        for source_key, subsubdict in utils.load_json_file(f).items():
             for alias_key, subsubsubdic in subsubdict.items():
                 for qid, cnt in subsubsubdic.items():
-                    filtered_aliases_to_qid[source_key][alias_key][qid] += cnt
+                    filtered_aliases_to_qid[source_key][alias_key][prep_utils.encode_qid(qid)] += cnt
     # Save counts
-    utils.dump_json_file(os.path.join(outdir, "filtered_qid_count.json"), filtered_qid_count)
-    utils.dump_json_file(os.path.join(outdir, "filtered_aliases_to_qid_count.json"), filtered_aliases_to_qid)
+    utils.dump_json_items(os.path.join(outdir, "filtered_qid_count.json"),
+                          ((source_key, prep_utils.decode_qid_keys(qid_counts)) for source_key, qid_counts in filtered_qid_count.items()))
+    utils.dump_json_items(os.path.join(outdir, "filtered_aliases_to_qid_count.json"),
+                          ((source_key, {alias: prep_utils.decode_qid_keys(qid_counts) for alias, qid_counts in alias_counts.items()})
+                           for source_key, alias_counts in filtered_aliases_to_qid.items()))
     with open(os.path.join(outdir, "docs_not_qids.json"), "w", encoding='utf8') as out_f:
         ujson.dump(docs_not_qid, out_f, ensure_ascii=ENSURE_ASCII)
 
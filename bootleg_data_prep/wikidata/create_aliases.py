@@ -1,26 +1,38 @@
 '''
-This file 
+This file
 
 1. Reads in all wikidata aliases from file
-2. Goes through triples and adds more aliases from a select set of properties 
-3. Performs first/last name augmentation 
-4. Dumps all results to file 
+2. Goes through triples and adds more aliases from a select set of properties
+3. Performs first/last name augmentation
+4. Dumps all results to file
 
-to run: 
-python3.6 -m 
+All normalization and name parsing runs in the workers with a cache keyed by the raw alias. The work is split in three
+hash partitioned stages so that no process holds all aliases:
 
-''' 
+- per table file: normalize the aliases and split them by QID partition
+- per QID partition: merge the aliases of every QID, add the first/last names of humans and split the (alias, qid)
+  pairs by alias partition
+- per alias partition: group the QIDs of every alias and write them as a shard of alias to QIDs lines
 
-    
-import os, json, argparse, time
-from tqdm import tqdm 
+The shards are concatenated into out_file, one {alias: [qids]} json line per alias, so readers can stream it.
+
+to run:
+python3.6 -m
+
+'''
+
+
+import os, json, argparse, time, shutil, zlib
 from multiprocessing import set_start_method, Pool
 from collections import defaultdict
 
+import marisa_trie
+
 import simple_wikidata_db.utils as utils
 from simple_wikidata_db.preprocess_dump import ALIAS_PROPERTIES
 
-from bootleg_data_prep.language import BASE_STOPWORDS, get_lnrm, ENSURE_ASCII, HumanNameParser
+from bootleg_data_prep.language import BASE_STOPWORDS, get_lnrm, ENSURE_ASCII, HumanNameParser, LANG_CODE
+from bootleg_data_prep.wikidata.entity_rels_scan import EntityRelsConsumer, load_qid_filter, run_scan
 
 
 def get_arg_parser():
@@ -34,96 +46,127 @@ def get_arg_parser():
     parser.add_argument('--not_lower', action='store_true', help='If set, will lower case all aliases.')
     return parser
 
-def get_aliases_from_table(alias_files, args):
-    pool = Pool(processes = args.processes)
-    messages = [(i, len(alias_files), alias_files[i]) for i in range(len(alias_files))]
-    list_of_qid2alias = pool.map(load_alias_file, messages)
-    return list_of_qid2alias
-
-def load_alias_file(message):
-    job_index, num_jobs, filename  = message
-    qid2alias = {}
-    for triple in utils.jsonl_generator(filename):
-        qid, alias = triple['qid'], triple['alias']
-        if not qid in qid2alias:
-            qid2alias[qid] = []
-        qid2alias[qid].append(alias)
-
-    print(f"Finished {job_index} / {num_jobs}...{filename}. Found {len(qid2alias)} entities.")
-    return qid2alias
-
-def get_aliases_from_values(value_files, args):
-    pool = Pool(processes = args.processes)
-    messages = [(i, len(value_files), value_files[i]) for i in range(len(value_files))]
-    list_of_qid2alias = pool.map(load_value_file, messages, chunksize=1)
-    return list_of_qid2alias
-
-def load_value_file(message):
-    job_index, num_jobs, filename  = message
-    qid2alias = {}
-    for triple in utils.jsonl_generator(filename):
-        qid, property_id, value = triple['qid'], triple['property_id'], triple['value'].lower()
-        if not property_id in ALIAS_PROPERTIES:
-            continue
-        if not qid in qid2alias:
-            qid2alias[qid] = []
-        qid2alias[qid].append(value)
-
-    print(f"Finished {job_index} / {num_jobs}...{filename}. Found {len(qid2alias)} entities.")
-    return qid2alias
-
-def get_types_and_aliases_from_entities(entity_files, args):
-    pool = Pool(processes = args.processes)
-    messages = [(i, len(entity_files), entity_files[i]) for i in range(len(entity_files))]
-    results = pool.map(load_entity_file, messages, chunksize=1)
-    list_of_qid2alias = [r['alias'] for r in results]
-    list_of_qid2type = [r['type'] for r in results]
-    return list_of_qid2alias, list_of_qid2type
-
-def load_entity_file(message):
-    job_index, num_jobs, filename  = message
-    qid2alias = {}
-    qid2type = {}
-    for triple in utils.jsonl_generator(filename):
-        qid, property_id, value = triple['qid'], triple['property_id'], triple['value']
-        if property_id in ALIAS_PROPERTIES:
-            if not qid in qid2alias:
-                qid2alias[qid] = []
-            qid2alias[qid].append(value)
-        if property_id == 'P31':
-            qid2type[qid] = value
-    print(f"Finished {job_index} / {num_jobs}...{filename}. Found {len(qid2alias)} entities.")
-    return {'alias': qid2alias, 'type': qid2type}
-
-def merge_aliases(list_of_qid2alias, strip, lower):
+class HumanConsumer(EntityRelsConsumer):
+    """ Collects the QIDs that are an instance of human (used for first/last name augmentation) """
+    name = 'human'
+    property_ids = {'P31'}
+
+    def __init__(self):
+        self.human_qid = set()
+
+    def consume(self, qid, property_id, value):
+        if value == 'Q5':
+            self.human_qid.add(qid)
+
+    def finish(self, job_index, out_dir):
+        return self.human_qid
+
+    @classmethod
+    def merge_and_save(cls, results, out_dir, args, bucketed=False):
+        human_qid = set()
+        for qids in results:
+            human_qid.update(qids)
+        return human_qid
+
+def get_qid_partition(qid, num_partitions):
+    return utils.get_bucket(qid, num_partitions)
+
+def get_alias_partition(alias, num_partitions):
+    # crc32 is stable across processes (hash() of str is not)
+    return zlib.crc32(alias.encode('utf-8')) % num_partitions
+
+def get_partition_file(temp_dir, stage, partition, job_index):
+    return os.path.join(temp_dir, f"{stage}_part{partition}_{job_index}.json")
+
+def init_process(args):
+    temp_dir, strip, lower, temp_human_f, temp_filter_f = args
+    global temp_dir_global
+    global strip_global
+    global lower_global
+    global human_qid_global
+    global qid_filter_global
+    temp_dir_global = temp_dir
+    strip_global = strip
+    lower_global = lower
+    human_qid_global = marisa_trie.Trie(json.load(open(temp_human_f, "r", encoding="utf-8")))
+    qid_filter_global = marisa_trie.Trie(json.load(open(temp_filter_f, "r", encoding="utf-8")))
+
+def write_partitions(stage, job_index, partitions):
+    for partition, items in enumerate(partitions):
+        with open(get_partition_file(temp_dir_global, stage, partition, job_index), "w", encoding='utf8') as out_f:
+            json.dump(items, out_f, ensure_ascii=ENSURE_ASCII)
+
+def normalize_table_file(message):
+    """ Normalizes the aliases of a table file and writes them split by QID partition """
+    job_index, num_jobs, filename, is_value_table, num_partitions = message
+    # cache of raw alias to normalized alias
+    lnrm_cache = {}
+    partitions = [defaultdict(set) for _ in range(num_partitions)]
+    num_rows = 0
+    for triple in utils.table_generator(filename, property_ids=ALIAS_PROPERTIES if is_value_table else None):
+        if is_value_table:
+            if not triple['property_id'] in ALIAS_PROPERTIES:
+                continue
+            qid, alias = triple['qid'], triple['value'].lower()
+        else:
+            qid, alias = triple['qid'], triple['alias']
+        if alias not in lnrm_cache:
+            lnrm_cache[alias] = get_lnrm(alias, strip=strip_global, lower=lower_global)
+        partitions[get_qid_partition(qid, num_partitions)][qid].add(lnrm_cache[alias])
+        num_rows += 1
+    write_partitions("qid", job_index, [{q: list(a) for q, a in p.items()} for p in partitions])
+    print(f"Finished {job_index} / {num_jobs}...{filename}. Normalized {num_rows} aliases ({len(lnrm_cache)} distinct).")
+    return num_rows
+
+def get_augmented_names(alias, name_cache):
+    """ Returns the first and last name of a human alias that are not stopwords """
+    if alias not in name_cache:
+        name = HumanNameParser(alias)
+        name_cache[alias] = [n for n in [name.first, name.last] if len(n) > 0 and n not in BASE_STOPWORDS]
+    return name_cache[alias]
+
+def augment_qid_partition(message):
+    """ Merges the aliases of every QID of a partition, adds the first/last names of humans and writes the
+    (alias, qid) pairs split by alias partition """
+    partition, num_partitions, num_jobs = message
     qid2alias = defaultdict(set)
-    all_aliases = set()
-    for d in tqdm(list_of_qid2alias):
-        for q, aliases in d.items():
-            for a in aliases:
-                a = get_lnrm(a, strip=strip, lower=lower)
-                qid2alias[q].add(a)
-                all_aliases.add(a)
-    for q, a in qid2alias.items():
-        qid2alias[q] = list(a)
-    print(f"Extracted {len(qid2alias)} QIDS and {len(all_aliases)} total aliases.")
-    return qid2alias
-
-def generate_short_long_names(qid2alias, human_qid):
-    augmented_qid2alias = {}
-    for qid, orig_aliases in tqdm(qid2alias.items()):
+    for job_index in range(num_jobs):
+        fname = get_partition_file(temp_dir_global, "qid", partition, job_index)
+        for qid, aliases in json.load(open(fname, "r", encoding="utf-8")).items():
+            qid2alias[qid].update(aliases)
+        os.remove(fname)
+    # cache of alias to first/last names
+    name_cache = {}
+    apply_filter = len(qid_filter_global) > 0
+    alias_partitions = [defaultdict(list) for _ in range(num_partitions)]
+    for qid, orig_aliases in qid2alias.items():
         new_aliases = set(orig_aliases)
-        if qid in human_qid:
+        if qid in human_qid_global:
             for alias in orig_aliases:
-                name = HumanNameParser(alias)
-                if len(name.first) > 0 and name.first not in BASE_STOPWORDS:
-                    new_aliases.add(name.first)
-                if len(name.last) > 0 and name.last not in BASE_STOPWORDS:
-                    new_aliases.add(name.last)
-        augmented_qid2alias[qid] = list(new_aliases)
-    print(f"Finished augmentation. {len(qid2alias)} QIDS.")
-    return augmented_qid2alias
-            
+                new_aliases.update(get_augmented_names(alias, name_cache))
+        if apply_filter and not qid in qid_filter_global:
+            continue
+        for alias in new_aliases:
+            alias_partitions[get_alias_partition(alias, num_partitions)][alias].append(qid)
+    write_partitions("alias", partition, alias_partitions)
+    print(f"Finished QID partition {partition} / {num_partitions}. {len(qid2alias)} QIDS.")
+    return len(qid2alias)
+
+def write_alias_shard(message):
+    """ Groups the QIDs of every alias of a partition and writes them as a shard of alias to QIDs lines """
+    partition, num_partitions = message
+    alias2qid = defaultdict(list)
+    for qid_partition in range(num_partitions):
+        fname = get_partition_file(temp_dir_global, "alias", partition, qid_partition)
+        for alias, qids in json.load(open(fname, "r", encoding="utf-8")).items():
+            alias2qid[alias].extend(qids)
+        os.remove(fname)
+    out_fname = os.path.join(temp_dir_global, f"shard_{partition}.jsonl")
+    with open(out_fname, "w", encoding='utf8') as out_f:
+        for alias in sorted(alias2qid):
+            out_f.write(json.dumps({alias: sorted(alias2qid[alias])}, ensure_ascii=ENSURE_ASCII) + "\n")
+    return out_fname, len(alias2qid)
+
 def main():
     set_start_method('spawn')
     start = time.time()
@@ -132,58 +175,60 @@ def main():
     print('Step 1 of 9: (optional) - loading qids (if got file)')
     if len(os.path.dirname(out_file)) > 0 and not os.path.exists(os.path.dirname(out_file)):
         os.makedirs(os.path.dirname(out_file))
+    temp_dir = f"{out_file}_tmp"
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir)
 
     if args.qids:
         print("args.qids", args.qids)
-        filter_qids = json.load(open(args.qids))
-        if type(filter_qids) is dict:
-            qid_filter = set(filter_qids.keys())
-        else:
-            qid_filter = set(filter_qids)
+    qid_filter = load_qid_filter(args.qids)
+    if args.qids:
         print(f"Loaded {len(qid_filter)} qids.")
     else:
-        qid_filter = set()
         print('no qids file')
 
-    print('Step 2 of 9: loading aliases ...')
-    fdir = os.path.join(args.data, "processed_batches", "aliases")
-    alias_table_files = utils.get_batch_files(fdir)
-    list_of_qid2alias = get_aliases_from_table(alias_table_files, args)
-
-    print('Step 3 of 9: process entity values')
-    fdir = os.path.join(args.data, "processed_batches", "entity_values")
-    value_table_files = utils.get_batch_files(fdir)
-    list_of_qid2alias.extend(get_aliases_from_values(value_table_files, args))
-
-    print('Step 4 of 9: entity rels')
-    fdir = os.path.join(args.data, "processed_batches", "entity_rels")
-    entity_table_files = utils.get_batch_files(fdir)
-    _, list_of_qid2types = get_types_and_aliases_from_entities(entity_table_files, args)
-
-    print("Step 5 of 9: Building human type map")
-    human_qid = {}
-    for d in list_of_qid2types:
-        for qid, typ in d.items():
-            if typ == 'Q5':
-                human_qid[qid] = 1
+    print('Step 2 of 9: entity rels')
+    print("Step 3 of 9: Building human type map")
+    human_qid = run_scan([HumanConsumer], args, temp_dir)[HumanConsumer.name]
     print(f"Found {len(human_qid)} entities of type individual.")
-    print("Step 6 of 9: merging aliases")
-    qid2alias = merge_aliases(list_of_qid2alias, not args.not_strip, not args.not_lower)
-    qid2alias = generate_short_long_names(qid2alias, human_qid)
-    print("Step 8 of 9: Inverting qid2alias...")
-    alias2qid = {}
-    for qid, aliases in qid2alias.items():
-        if len(qid_filter) > 0 and not qid in qid_filter:
-            continue 
-        for alias in aliases:
-            if not alias in alias2qid:
-                alias2qid[alias] = []
-            alias2qid[alias].append(qid)
-    print(f"{len(alias2qid)} aliases.")
-    print(f"Step 9 of 9: Saving to file {args.out_file}...")
-    with open(args.out_file, "w", encoding='utf8') as out_file:
-        json.dump(alias2qid, out_file, ensure_ascii=ENSURE_ASCII)
+    temp_human_f = os.path.join(temp_dir, "_humans.json")
+    json.dump(list(human_qid), open(temp_human_f, "w", encoding='utf8'), ensure_ascii=ENSURE_ASCII)
+    temp_filter_f = os.path.join(temp_dir, "_qid_filter.json")
+    json.dump(list(qid_filter), open(temp_filter_f, "w", encoding='utf8'), ensure_ascii=ENSURE_ASCII)
+    del human_qid, qid_filter
+
+    num_partitions = args.processes
+    pool = Pool(processes=args.processes, initializer=init_process,
+                initargs=((temp_dir, not args.not_strip, not args.not_lower, temp_human_f, temp_filter_f),))
+
+    print('Step 4 of 9: loading and normalizing aliases and entity values ...')
+    alias_table_files = utils.get_table_files(os.path.join(args.data, "processed_batches"), "aliases", LANG_CODE)
+    value_table_files = utils.get_table_files(os.path.join(args.data, "processed_batches"), "entity_values", LANG_CODE)
+    table_files = [(f, False) for f in alias_table_files] + [(f, True) for f in value_table_files]
+    messages = [(i, len(table_files), table_files[i][0], table_files[i][1], num_partitions) for i in range(len(table_files))]
+    pool.map(normalize_table_file, messages, chunksize=1)
+
+    print("Step 5 of 9: merging aliases and augmenting human names")
+    messages = [(p, num_partitions, len(table_files)) for p in range(num_partitions)]
+    num_qids = sum(pool.map(augment_qid_partition, messages, chunksize=1))
+    print(f"Extracted aliases of {num_qids} QIDS.")
+
+    print("Step 6 of 9: Inverting qid2alias...")
+    shards = pool.map(write_alias_shard, [(p, num_partitions) for p in range(num_partitions)], chunksize=1)
+    pool.close()
+    pool.join()
+    print(f"{sum(num_aliases for _, num_aliases in shards)} aliases.")
+
+    print(f"Step 7 of 9: Saving to file {args.out_file}...")
+    with open(args.out_file, "wb") as out_f:
+        for shard_fname, _ in shards:
+            with open(shard_fname, "rb") as in_f:
+                shutil.copyfileobj(in_f, out_f)
+    print(f"Step 8 of 9: Removing temporary files")
+    shutil.rmtree(temp_dir)
+    print(f"Step 9 of 9: Finished in {time.time() - start}s")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,116 @@
+'''
+This file
+
+1. Reads and decodes the entity_rels table once
+2. Dispatches every row to the registered consumers (types, kg triples, disambiguation pages, people, ...)
+3. Merges and saves the per-job results of every consumer
+
+A consumer subclasses EntityRelsConsumer. The worker processes create one instance per job (a table file, or all files of
+a bucket when the table was written with --num_buckets), feed it the rows of the properties it asks for and return what
+finish() returns. The parent passes the list of these results to the consumer's merge_and_save.
+'''
+
+import os, json, time
+from multiprocessing import Pool
+
+import marisa_trie
+
+import simple_wikidata_db.utils as utils
+
+from bootleg_data_prep.language import ENSURE_ASCII
+
+
+class EntityRelsConsumer:
+    """ A consumer of entity_rels rows. One instance is created per job in the worker processes. """
+    # name used to pick consumers on the command line
+    name = None
+    # properties the consumer reads. None reads every row.
+    property_ids = None
+    # whether rows are restricted to the QIDs given with --qids
+    uses_qid_filter = False
+    # properties whose rows are read for all QIDs even if uses_qid_filter is set
+    unfiltered_property_ids = set()
+
+    def consume(self, qid, property_id, value):
+        raise NotImplementedError
+
+    def finish(self, job_index, out_dir):
+        """ Returns the result of the job. It is sent back to the parent, so large results should be saved to out_dir. """
+        raise NotImplementedError
+
+    @classmethod
+    def merge_and_save(cls, results, out_dir, args, bucketed=False):
+        """ Merges the results of all jobs and saves them to out_dir. bucketed is set if every job held disjoint QIDs. """
+        raise NotImplementedError
+
+
+def load_qid_filter(qids_file):
+    """ Loads the QIDs in a json list or dict keyed by QID, or returns an empty set if no file is given """
+    if qids_file is None or len(qids_file) == 0:
+        return set()
+    filter_qids = json.load(open(qids_file, encoding="utf-8"))
+    if type(filter_qids) is dict:
+        return set(filter_qids.keys())
+    return set(filter_qids)
+
+def get_entity_rels_jobs(data_dir):
+    """ Returns the jobs over processed_batches/entity_rels (single files, or the files of each bucket) and whether they are buckets """
+    fdir = os.path.join(data_dir, "processed_batches", "entity_rels")
+    bucket_files = utils.get_bucket_files(fdir)
+    if len(bucket_files) > 0:
+        return [bucket_files[b] for b in sorted(bucket_files)], True
+    return [[f] for f in utils.get_table_files(os.path.join(data_dir, "processed_batches"), "entity_rels", None)], False
+
+def init_process(args):
+    consumer_classes, temp_f = args
+    global consumer_classes_global
+    global filter_qids_global
+    consumer_classes_global = consumer_classes
+    vals = list(json.load(open(temp_f, "r", encoding="utf-8"))) if temp_f is not None else []
+    filter_qids_global = marisa_trie.Trie(vals)
+
+def scan_job(message):
+    start = time.time()
+    job_index, num_jobs, filenames, out_dir = message
+    consumers = [consumer_class() for consumer_class in consumer_classes_global]
+    # route each property to the consumers reading it
+    all_property_consumers = [c for c in consumers if c.property_ids is None]
+    property_consumers = {}
+    for consumer in consumers:
+        for property_id in consumer.property_ids or []:
+            property_consumers.setdefault(property_id, []).append(consumer)
+    property_ids = None if len(all_property_consumers) > 0 else set(property_consumers)
+    apply_filter = len(filter_qids_global) > 0
+    num_rows = 0
+    for filename in filenames:
+        for triple in utils.table_generator(filename, property_ids=property_ids):
+            qid, property_id, value = triple['qid'], triple['property_id'], triple['value']
+            num_rows += 1
+            in_filter = not apply_filter or qid in filter_qids_global
+            for consumer in all_property_consumers + property_consumers.get(property_id, []):
+                if in_filter or not consumer.uses_qid_filter or property_id in consumer.unfiltered_property_ids:
+                    consumer.consume(qid, property_id, value)
+    results = [consumer.finish(job_index, out_dir) for consumer in consumers]
+    print(f"Finished {job_index} / {num_jobs}...{filenames}. Dispatched {num_rows} rows to {len(consumers)} consumers. {time.time() - start} seconds.")
+    return results
+
+def run_scan(consumer_classes, args, out_dir, filter_qids=()):
+    """ Scans processed_batches/entity_rels under args.data once for all consumer_classes.
+    Returns {consumer name: what its merge_and_save returned}. """
+    jobs, bucketed = get_entity_rels_jobs(args.data)
+    temp_f = None
+    if len(filter_qids) > 0 and any(c.uses_qid_filter for c in consumer_classes):
+        temp_f = os.path.join(out_dir, "_temp_filter.json")
+        json.dump(list(filter_qids), open(temp_f, "w", encoding='utf8'), ensure_ascii=ENSURE_ASCII)
+    print(f"Starting {[c.name for c in consumer_classes]} with {args.processes} processes")
+    pool = Pool(processes = args.processes, initializer=init_process, initargs=((consumer_classes, temp_f),))
+    messages = [(i, len(jobs), jobs[i], out_dir) for i in range(len(jobs))]
+    job_results = pool.map(scan_job, messages, chunksize=1)
+    pool.close()
+    pool.join()
+    if temp_f is not None:
+        os.remove(temp_f)
+    merged = {}
+    for i, consumer_class in enumerate(consumer_classes):
+        merged[consumer_class.name] = consumer_class.merge_and_save([res[i] for res in job_results], out_dir, args, bucketed=bucketed)
+    return merged
@@ -2,22 +2,22 @@
 This file 
 
 1. Reads in all entity-entity relations
-2. Dumps them out in the kg_adj format 
+2. Dumps them out as a QID sorted, sharded store (see bootleg_data_prep/utils/qid_sorted_store.py) in <out_dir>/kg_triples
 
 to run: 
 python3.6 -m processor.get_all_wikipedia_triples
 
 ''' 
 
-import os, json, argparse, time
+import os, argparse, time
 
-import marisa_trie
-from glob import glob
-from multiprocessing import set_start_method, Pool
+from multiprocessing import set_start_method
 
-import simple_wikidata_db.utils as utils
+from bootleg_data_prep.utils.qid_sorted_store import merge_sorted_runs, write_sorted_run, write_store
+from bootleg_data_prep.wikidata.entity_rels_scan import EntityRelsConsumer, load_qid_filter, run_scan
 
-from bootleg_data_prep.language import ENSURE_ASCII
+KG_TRIPLES_STORE = "kg_triples"
+KG_TRIPLES_SHARD_SIZE = 500000
 
 
 def get_arg_parser():
@@ -28,62 +28,54 @@ def get_arg_parser():
     parser.add_argument('--qids', default = '/lfs/raiders8/0/lorr1/data/wiki_dump/alias_filtered_sentences/entity_db/entity_mappings/qid2title.json')
     return parser 
 
-def init_process(args):
-    temp_f = args[0]
-    vals = list(json.load(open(temp_f, "r", encoding="utf-8")))
-    global filter_qids_global
-    filter_qids_global = marisa_trie.Trie(vals)
-
-def launch_entity_table(entity_files, filter_qids, out_dir, args):
-    temp_f = os.path.join(out_dir, "_temp_filter.json")
-    json.dump(list(filter_qids), open(temp_f, "w", encoding='utf8'), ensure_ascii=ENSURE_ASCII)
-    print(f"Starting with {args.processes} processes")
-    pool = Pool(processes = args.processes, initializer=init_process, initargs=(tuple([temp_f]),))
-    messages = [(i, len(entity_files), entity_files[i], out_dir) for i in range(len(entity_files))]
-    pool.map(load_and_filter_triples, messages, chunksize=1)
-    merge_and_save(out_dir)
-    return
-
-def merge_and_save(out_dir):
-    in_files = glob(os.path.join(out_dir, f"_out_*.json"))
-    out_f = os.path.join(out_dir, "kg_triples.json")
-    final_triples = {}
-    for f in in_files:
-        triples = json.load(open(f, 'r', encoding="utf-8"))
-        for qid in triples:
-            if qid not in final_triples:
-                final_triples[qid] = {}
-            for rel in triples[qid]:
-                if rel not in final_triples[qid]:
-                    final_triples[qid][rel] = []
-                for qid2 in triples[qid][rel]:
-                    final_triples[qid][rel].append(qid2)
-    with open(out_f,'w', encoding='utf8') as wfd:
-        json.dump(final_triples, wfd, ensure_ascii=ENSURE_ASCII)
+class TriplesConsumer(EntityRelsConsumer):
+    """ Collects the kg triples of every QID """
+    name = 'kg_triples'
+    property_ids = None
+    uses_qid_filter = True
+
+    def __init__(self):
+        self.triples = {}
+
+    def consume(self, qid, property_id, value):
+        if qid not in self.triples:
+            self.triples[qid] = {}
+        if property_id not in self.triples[qid]:
+            self.triples[qid][property_id] = []
+        self.triples[qid][property_id].append(value)
+
+    def finish(self, job_index, out_dir):
+        out_f = os.path.join(out_dir, f"_triples_{job_index}.jsonl")
+        print(f"Found {len(self.triples)}")
+        write_sorted_run(out_f, self.triples)
+        return out_f
+
+    @classmethod
+    def merge_and_save(cls, results, out_dir, args, bucketed=False):
+        merge_and_save(out_dir, results)
+
+def merge_rels(rel_dicts):
+    """ Concatenates the values of every relation of a QID found in several runs """
+    if len(rel_dicts) == 1:
+        return rel_dicts[0]
+    merged = {}
+    for rels in rel_dicts:
+        for rel, values in rels.items():
+            if rel not in merged:
+                merged[rel] = []
+            merged[rel].extend(values)
+    return merged
+
+def merge_and_save(out_dir, in_files):
+    """ Streams the QID sorted worker runs into the sharded kg_triples store, holding one line per run in memory """
+    out_store = os.path.join(out_dir, KG_TRIPLES_STORE)
+    num_qids = write_store(out_store, merge_sorted_runs(in_files, merge_rels), KG_TRIPLES_SHARD_SIZE)
+    print(f"Written triples of {num_qids} QIDs to {out_store}")
     print(f"Removing the temporary files")
     for file in in_files:
         os.remove(file)
     return
 
-def load_and_filter_triples(message):
-    start = time.time()
-    job_index, num_jobs, filename, out_dir = message
-    triples = {}
-    print(f"Starting {job_index} / {num_jobs} on {filename}.")
-    for triple in utils.jsonl_generator(filename):
-        qid, property_id, value = triple['qid'], triple['property_id'], triple['value']
-        if len(filter_qids_global) == 0 or qid in filter_qids_global: # and value in filter_qids_global:
-            if qid not in triples:
-                triples[qid] = {}
-            if property_id not in triples[qid]:
-                triples[qid][property_id] = []
-            triples[qid][property_id].append(value)
-    out_f = open(os.path.join(out_dir, f"_out_{job_index}.json"), "w", encoding='utf8')
-    print(f"Found {len(triples)}")
-    json.dump(triples, out_f, ensure_ascii=ENSURE_ASCII)
-    print(f"Finished {job_index} / {num_jobs}...{filename}. {time.time() - start} seconds. Saved in {out_f}.")
-    return
-            
 def main():
     set_start_method('forkserver')
     start = time.time()
@@ -93,17 +85,9 @@ def main():
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    filter_qids = []
-    if len(args.qids) > 0:
-        filter_qids = json.load(open(args.qids))
-        if type(filter_qids) is dict:
-            filter_qids = list(filter_qids.keys())
-        else:
-            filter_qids = set(filter_qids)
+    filter_qids = load_qid_filter(args.qids)
     print(f"Loaded {len(filter_qids)} qids.")
-    fdir = os.path.join(args.data, "processed_batches", "entity_rels")
-    entity_table_files = utils.get_batch_files(fdir)
-    launch_entity_table(entity_table_files, filter_qids, out_dir, args)
+    run_scan([TriplesConsumer], args, out_dir, filter_qids)
     print(f"Finihsed in {time.time() - start}s.")
 
 if __name__ == "__main__":
@@ -1,19 +1,32 @@
 '''
-This file 
+This file
 
 1. Reads in all entity descriptions and the first sentence of every wikipedia page
-2. Dumps mapping from QID to description
+2. Dumps mapping from QID to description as a QID sorted, sharded store (see bootleg_data_prep/utils/qid_sorted_store.py)
+   in <out_dir>/qid2desc
+
+Every page file and descriptions file is read by its own worker. Workers only keep the QIDs of the filter (a marisa
+trie mmapped by every worker) and write QID sorted runs of [rank, description] values. The merge keeps the description
+with the lowest rank. Page first sentences rank before wikidata descriptions and, as before, a later page file wins over
+an earlier one while the first descriptions file wins over later ones.
+
+to run:
+python3 -m bootleg_data_prep.wikidata.get_entity_descriptions --data $BOOTLEG_PREP_WIKIDATA_DIR --out_dir wikidata_output --wikipedia_page_data alias_filtered_sentences --qids qid2title.json
 '''
 
-import os, json, argparse, time
-from rich.progress import track
+import os, argparse, time, shutil
 import marisa_trie
 from glob import glob
 from multiprocessing import set_start_method, Pool
-from pathlib import Path
+import ujson as json
 import simple_wikidata_db.utils as utils
 
-from bootleg_data_prep.language import ENSURE_ASCII
+from bootleg_data_prep.language import LANG_CODE
+from bootleg_data_prep.utils.qid_sorted_store import merge_sorted_runs, write_sorted_run, write_store
+from bootleg_data_prep.wikidata.entity_rels_scan import load_qid_filter
+
+QID2DESC_STORE = "qid2desc"
+QID2DESC_SHARD_SIZE = 500000
 
 
 def get_arg_parser():
@@ -22,44 +35,82 @@ def get_arg_parser():
     parser.add_argument('--out_dir', type = str, default = 'desc_output', help = 'path to output directory')
     parser.add_argument('--wikipedia_page_data', type = str, default = '/lfs/raiders8/0/lorr1/data/wiki_dump/alias_filtered_sentences')
     parser.add_argument('--qids', default = '/lfs/raiders8/0/lorr1/data/wiki_dump/alias_filtered_sentences/entity_db/entity_mappings/qid2title.json')
-    return parser 
+    parser.add_argument('--processes', type = int, default = 10, help = "Number of concurrent processes to spin off. ")
+    return parser
+
+def init_process(args):
+    temp_dir, qid_filter_f = args
+    global temp_dir_global
+    global qid_filter_global
+    temp_dir_global = temp_dir
+    qid_filter_global = marisa_trie.Trie().mmap(qid_filter_f)
+
+def keep_qid(qid):
+    return len(qid_filter_global) <= 0 or qid in qid_filter_global
+
+def read_page_file(message):
+    """ Takes the first sentence of every page. Later pages of the file win. """
+    job_index, num_jobs, rank, filename = message
+    qid2desc = {}
+    with open(filename, "r", encoding="utf8") as in_f:
+        for line in in_f:
+            line = json.loads(line)
+            if keep_qid(line["qid"]) and len(line["sentences"]) > 0:
+                qid2desc[line["qid"]] = [rank, line["sentences"][0]["sentence"]]
+    return write_run(job_index, num_jobs, filename, qid2desc)
+
+def read_description_file(message):
+    """ Takes the wikidata description of every QID. Earlier descriptions of the file win. """
+    job_index, num_jobs, rank, filename = message
+    qid2desc = {}
+    for line in utils.table_generator(filename):
+        if line["qid"] not in qid2desc and keep_qid(line["qid"]):
+            qid2desc[line["qid"]] = [rank, line["description"]]
+    return write_run(job_index, num_jobs, filename, qid2desc)
+
+def write_run(job_index, num_jobs, filename, qid2desc):
+    out_f = os.path.join(temp_dir_global, f"_desc_{job_index}.jsonl")
+    write_sorted_run(out_f, qid2desc)
+    print(f"Finished {job_index} / {num_jobs}...{filename}. Found {len(qid2desc)} descriptions.")
+    return out_f
+
+def merge_descriptions(values):
+    """ Returns the description with the lowest rank """
+    return min(values, key=lambda value: value[0])[1]
 
 def main():
+    set_start_method('spawn')
     start = time.time()
     args = get_arg_parser().parse_args()
 
-    filter_qids = set()
-    if len(args.qids) > 0:
-        filter_qids = json.load(open(args.qids))
-        if type(filter_qids) is dict:
-            filter_qids = set(filter_qids.keys())
-        else:
-            filter_qids = set(filter_qids)
+    out_dir = os.path.join(args.data, args.out_dir)
+    temp_dir = os.path.join(out_dir, "_desc_tmp")
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir)
+
+    filter_qids = load_qid_filter(args.qids)
     print(f"Loaded {len(filter_qids)} qids.")
+    qid_filter_f = os.path.join(temp_dir, "_qid_filter.marisa")
+    marisa_trie.Trie(filter_qids).save(qid_filter_f)
+    del filter_qids
 
-    qid2desc = {}
-    all_files = list(Path(args.wikipedia_page_data).glob("wiki_*.jsonl"))
-    print("Reading in first sentence for each QID")
-    for file in track(all_files):
-        with open(file) as in_f:
-            for line in in_f:
-                line = json.loads(line)
-                if (len(filter_qids) <= 0 or line["qid"] in filter_qids) and (len(line["sentences"]) > 0):
-                    qid2desc[line["qid"]] = line["sentences"][0]["sentence"]
-    print("Reading in descriptions from wikidata")
-    fdir = os.path.join(args.data, "processed_batches", "descriptions")
-    entity_table_files = utils.get_batch_files(fdir)
-    for f in track(entity_table_files):
-        for line in open(f):
-            line = json.loads(line)
-            if line["qid"] not in qid2desc and (len(filter_qids) <= 0 or line["qid"] in filter_qids):
-                qid2desc[line["qid"]] = line["description"]
+    page_files = sorted(glob(os.path.join(args.wikipedia_page_data, "wiki_*.jsonl")))
+    description_files = utils.get_table_files(os.path.join(args.data, "processed_batches"), "descriptions", LANG_CODE)
+    num_jobs = len(page_files) + len(description_files)
+    # later page files rank first, then description files in order
+    page_messages = [(i, num_jobs, len(page_files) - 1 - i, f) for i, f in enumerate(page_files)]
+    description_messages = [(len(page_files) + i, num_jobs, len(page_files) + i, f) for i, f in enumerate(description_files)]
+    print(f"Reading in first sentence for each QID from {len(page_files)} files and descriptions from {len(description_files)} files")
+    pool = Pool(processes=args.processes, initializer=init_process, initargs=((temp_dir, qid_filter_f),))
+    run_files = pool.map(read_page_file, page_messages, chunksize=1) + pool.map(read_description_file, description_messages, chunksize=1)
+    pool.close()
+    pool.join()
 
-    out_dir = os.path.join(args.data, args.out_dir)
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir)
-    json.dump(qid2desc, open(os.path.join(out_dir, "qid2desc.json"), "w"), ensure_ascii=ENSURE_ASCII, indent=4)
-    print(f"Saved to {out_dir}. Finihsed in {time.time() - start}s.")
+    out_store = os.path.join(out_dir, QID2DESC_STORE)
+    num_qids = write_store(out_store, merge_sorted_runs(run_files, merge_descriptions), QID2DESC_SHARD_SIZE)
+    shutil.rmtree(temp_dir)
+    print(f"Saved descriptions of {num_qids} QIDs to {out_store}. Finished in {time.time() - start}s.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,10 +3,9 @@ import argparse
 import os
 import time
 import ujson
-from multiprocessing import Pool
 
-import simple_wikidata_db.utils as utils
-from language import ENSURE_ASCII
+from bootleg_data_prep.language import ENSURE_ASCII
+from bootleg_data_prep.wikidata.entity_rels_scan import EntityRelsConsumer, run_scan
 
 INSTANCE_OF_PROP = "P31"
 HUMAN = {"Q5", "Q159979"}
@@ -20,27 +19,41 @@ def get_arg_parser():
     return parser 
 
 
-def launch_entity_table(entity_files, args):
-    print(f"Starting with {args.processes} processes")
-    pool = Pool(processes = args.processes)
-    messages = [(i, len(entity_files), entity_files[i]) for i in range(len(entity_files))]
-    res = pool.map(load_entity_file, messages, chunksize=1)
-    return res
+class PersonGenderConsumer(EntityRelsConsumer):
+    """ Collects the QIDs of people and the gender of every QID """
+    name = 'person_gender'
+    property_ids = {INSTANCE_OF_PROP, GENDER}
 
-def load_entity_file(message):
-    start = time.time()
-    job_index, num_jobs, filename = message
-    ids = set()
-    id2gender = {}
-    for triple in utils.jsonl_generator(filename):
-        qid, property_id, value = triple['qid'], triple['property_id'], triple['value']
+    def __init__(self):
+        self.ids = set()
+        self.id2gender = {}
+
+    def consume(self, qid, property_id, value):
         if property_id == INSTANCE_OF_PROP and value in HUMAN:
-            ids.add(qid)
+            self.ids.add(qid)
         if property_id == GENDER:
-            id2gender[qid] = value
+            self.id2gender[qid] = value
+
+    def finish(self, job_index, out_dir):
+        return self.ids, self.id2gender
+
+    @classmethod
+    def merge_and_save(cls, results, out_dir, args, bucketed=False):
+        final_ids = set()
+        final_id2gender = {}
+        for ids, id2gen in results:
+            final_ids.update(ids)
+            final_id2gender.update(id2gen)
 
-    print(f"Finished {job_index} / {num_jobs}...{filename}. Fetched types for {len(ids)} entities and {len(id2gender)} id2gender. {time.time() - start} seconds.")
-    return ids, id2gender
+        out_fpath = os.path.join(out_dir, 'person_qids.json')
+        with open(out_fpath, 'w', encoding='utf8') as out_file:
+            ujson.dump(list(final_ids), out_file, ensure_ascii=ENSURE_ASCII, indent=4)
+
+        out_fpath2 = os.path.join(out_dir, 'person_gender.json')
+        with open(out_fpath2, 'w', encoding='utf8') as out_file:
+            ujson.dump(final_id2gender, out_file, ensure_ascii=ENSURE_ASCII, indent=4)
+        print(f"Written {len(final_ids)} to {out_fpath} and person2gender to {out_fpath2}")
+        return final_ids, final_id2gender
 
 def main():
     start = time.time()
@@ -50,26 +63,8 @@ def main():
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    fdir = os.path.join(args.data, "processed_batches", "entity_rels")
-    external_tables = utils.get_batch_files(fdir)
-    all_res = launch_entity_table(external_tables, args)
-
-    final_ids = set()
-    final_id2gender = {}
-    for ids, id2gen in all_res:
-        for id in ids:
-            final_ids.add(id)
-        for id in id2gen:
-            final_id2gender[id] = id2gen[id]
-
-    out_fpath = os.path.join(out_dir, 'person_qids.json')
-    with open(out_fpath, 'w', encoding='utf8') as out_file:
-        ujson.dump(list(final_ids), out_file, ensure_ascii=ENSURE_ASCII, indent=4)
-
-    out_fpath2 = os.path.join(out_dir, 'person_gender.json')
-    with open(out_fpath2, 'w', encoding='utf8') as out_file:
-        ujson.dump(final_id2gender, out_file, ensure_ascii=ENSURE_ASCII, indent=4)
-    print(f"Written {len(final_ids)} to {out_fpath} and person2gender to {out_fpath2} in {time.time()-start}")
+    run_scan([PersonGenderConsumer], args, out_dir)
+    print(f"Finished in {time.time()-start}")
     
     
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+'''
+This file
+
+1. Reads in the property_labels table written by simple_wikidata_db/preprocess_dump.py
+2. Dumps mapping from PID to its label (or first alias if the property has no label) in the language
+
+This replaces scraping pid_names_LANGCODE.json from the web and works for every language extracted by preprocess_dump.
+'''
+
+import os, json, argparse, time
+from rich.progress import track
+import simple_wikidata_db.utils as utils
+
+from bootleg_data_prep.language import ENSURE_ASCII, LANG_CODE
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type = str, default = '/lfs/raiders8/0/lorr1/wikidata', help = 'path to output directory')
+    parser.add_argument('--out_dir', type = str, default = 'wikidata_output', help = 'path to output directory')
+    parser.add_argument('--out_file', type = str, default = 'pid_names.json', help = 'name of the output file')
+    return parser
+
+def main():
+    start = time.time()
+    args = get_arg_parser().parse_args()
+
+    pid_labels = {}
+    pid_aliases = {}
+    table_files = utils.get_table_files(os.path.join(args.data, "processed_batches"), "property_labels", LANG_CODE)
+    print(f"Reading in property labels from {len(table_files)} files")
+    for f in track(table_files):
+        for line in utils.table_generator(f):
+            if line["name_type"] == "label":
+                pid_labels[line["qid"]] = line["name"]
+            elif line["qid"] not in pid_aliases:
+                pid_aliases[line["qid"]] = line["name"]
+    pid_names = {**pid_aliases, **pid_labels}
+    print(f"Found names for {len(pid_names)} properties ({len(pid_names) - len(pid_labels)} from aliases).")
+
+    out_dir = os.path.join(args.data, args.out_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    out_file = os.path.join(out_dir, args.out_file)
+    with open(out_file, "w", encoding="utf-8") as out_f:
+        json.dump(pid_names, out_f, ensure_ascii=ENSURE_ASCII, indent=4, sort_keys=True)
+    print(f"Saved to {out_file}. Finished in {time.time() - start}s.")
+
+if __name__ == "__main__":
+    main()
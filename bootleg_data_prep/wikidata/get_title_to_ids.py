@@ -8,21 +8,28 @@ This file
 ...
 where title is some redirect, wikipedia, or wikidata title that at one point linked to the QID. ID is the wikipedia id.
 
+Redirects to redirects are followed to the end of their chain, so redirect titles map to the QID of the final page. The
+flat table of every redirect title and its final title is saved to redirect_to_canonical_title.jsonl and the redirect
+cycles to redirect_cycles.jsonl.
+
 to run: 
 python3.6 -m processor.get_title_to_ids
 
 '''
-import os, argparse, time, html, json, jsonlines, copy
+import os, argparse, time, html, json, jsonlines
 from glob import glob
 from urllib.parse import unquote
 
+from multiprocessing import Pool
+
 from tqdm import tqdm
 
 from collections import defaultdict
 import simple_wikidata_db.utils as utils
 import dateutil.parser
 
-from bootleg_data_prep.language import ENSURE_ASCII
+from bootleg_data_prep.language import ENSURE_ASCII, LANG_CODE
+from bootleg_data_prep.utils.classes.title_index import build_title_index
 
 
 def get_arg_parser():
@@ -32,24 +39,45 @@ def get_arg_parser():
     parser.add_argument('--total_wikipedia_xml_lines', type = int, default = 1132098881, help = "For reporting progress of wikipedia xml readining (optional)")
     parser.add_argument('--wikipedia_pageids', type = str, default = '/lfs/raiders8/0/lorr1/pageids', help = 'path to output directory')
     parser.add_argument('--out_dir', type = str, default = '/lfs/raiders8/0/lorr1/title_mappings', help = 'path to output directory')
+    parser.add_argument('--resume', action = 'store_true', help = 'Read the title mappings back from title_to_all_ids_raw.jsonl of a previous run instead of rebuilding them')
+    parser.add_argument('--processes', type = int, default = 1, help = "Number of processes reading byte ranges of the wikipedia xml (1 reads it serially)")
     return parser 
 
 
 def convert_title(title):
     return html.unescape(unquote(title))
 
-def read_in_saved_title_file(title_file, total_lines):
-    wikititle2item = defaultdict(set)
+def item_to_dict(item):
+    qid, wpid, title, wikidata_title, wikipedia_title = item
+    return {
+        "qid": qid,
+        "id": wpid,
+        "title": title,
+        "wikidata_title": wikidata_title,
+        "wikipedia_title": wikipedia_title
+    }
+
+def add_title_item(wikititle2item, item):
+    """ Appends the (qid, id, title, wikidata_title, wikipedia_title) item to the items of its wikipedia title.
+    The items of a title are a dict used as an insertion ordered set. Returns whether the item is new. """
+    items = wikititle2item.setdefault(item[4], {})
+    if item in items:
+        return False
+    items[item] = None
+    return True
+
+def read_in_saved_title_file(title_file, total_lines=None):
+    """ Reads back the title items saved by merge_title_mappings (used when resuming) """
+    wikititle2item = {}
     with jsonlines.open(title_file, 'r') as in_file:
         for items in tqdm(in_file, total=total_lines, desc="Reading in title file"):
             # the title is the url title that may be redirected to another wikipedia page
-            qid, title, wikidata_title, wikipedia_title, wpid = items['qid'], items['title'], items['wikidata_title'], items['wikipedia_title'], items['id']
-            # convert to string for hashing
-            wikititle2item[wikipedia_title].add(json.dumps(items, default=str, ensure_ascii=ENSURE_ASCII))
+            add_title_item(wikititle2item, (items['qid'], items['id'], items['title'], items['wikidata_title'], items['wikipedia_title']))
     return wikititle2item
 
 def merge_title_mappings(output_file, qid_to_wikidata, wikipedia_titles_to_qid, wikipedia_titles_to_wpid):
-    total_lines = 0
+    """ Returns the title items of every wikipedia title. They are also saved to output_file so the step can be resumed. """
+    wikititle2item = {}
     with open(output_file, "w", encoding='utf8') as out_f:
         for wikipedia_title, qids in tqdm(wikipedia_titles_to_qid.items(), desc="Merging dicts"):
             if len(qids) > 1:
@@ -62,62 +90,171 @@ def merge_title_mappings(output_file, qid_to_wikidata, wikipedia_titles_to_qid,
                 else:
                     wikidata_titles = qid_to_wikidata[qid]
                 for wikidata_title in wikidata_titles:
-                    for title in [wikipedia_title]:
-                        res = {
-                            "qid": qid,
-                            "id": wpid,
-                            "title": title,
-                            "wikidata_title": wikidata_title,
-                            "wikipedia_title": wikipedia_title
-                        }
-                        out_f.write(json.dumps(res, default=str, ensure_ascii=ENSURE_ASCII) + "\n")
-                        total_lines += 1
-    return total_lines
-
-def read_in_redirects(in_filename, total_lines):
-    title_map = defaultdict(set)
-    with open(in_filename, "r", encoding="utf-8") as in_f:
-        cur_title = ""
-        redirect_title = ""
-        cur_timestamp = None
-        for line in tqdm(in_f, total=total_lines, desc="Reading in redirects"):
-            line = line.strip()
-            if line.startswith("<title>"):
-                cur_title = line.replace("<title>", "").replace("</title>", "")
-                if cur_timestamp is None and len(redirect_title) > 0:
-                    print("CUR TITLE", cur_title, "WITH", redirect_title, "HAD A NONE TIMESTAMP")
-                redirect_title = ""
-                cur_timestamp = None
-            if line.startswith("<redirect title"):
-                redirect_title = line.replace("<redirect title=\"", "").replace("\" />", "")
-            if line.startswith("<timestamp"):
-                cur_timestamp = dateutil.parser.isoparse(line.replace("<timestamp>", "").replace("</timestamp>", ""))
-                title_map[redirect_title].add(tuple([cur_timestamp, cur_title]))
+                    item = (qid, wpid, wikipedia_title, wikidata_title, wikipedia_title)
+                    if add_title_item(wikititle2item, item):
+                        out_f.write(json.dumps(item_to_dict(item), default=str, ensure_ascii=ENSURE_ASCII) + "\n")
+    return wikititle2item
+
+class RedirectParser:
+    """ Collects the (timestamp, title) of every page under the title it redirects to, line by line.
+    Pages that are not redirects are collected under the empty title. """
+    def __init__(self):
+        self.title_map = defaultdict(set)
+        self.cur_title = ""
+        self.redirect_title = ""
+        self.cur_timestamp = None
+
+    def parse_line(self, line):
+        line = line.strip()
+        if line.startswith("<title>"):
+            self.cur_title = line.replace("<title>", "").replace("</title>", "")
+            if self.cur_timestamp is None and len(self.redirect_title) > 0:
+                print("CUR TITLE", self.cur_title, "WITH", self.redirect_title, "HAD A NONE TIMESTAMP")
+            self.redirect_title = ""
+            self.cur_timestamp = None
+        if line.startswith("<redirect title"):
+            self.redirect_title = line.replace("<redirect title=\"", "").replace("\" />", "")
+        if line.startswith("<timestamp"):
+            self.cur_timestamp = dateutil.parser.isoparse(line.replace("<timestamp>", "").replace("</timestamp>", ""))
+            self.title_map[self.redirect_title].add(tuple([self.cur_timestamp, self.cur_title]))
+
+def get_page_byte_ranges(in_filename, num_ranges):
+    """ Splits the file in about num_ranges byte ranges that start at a <page> line (or the start of the file).
+    Pages never span two ranges, and the parser state is reset by the <title> of every page, so ranges parse independently. """
+    file_size = os.path.getsize(in_filename)
+    starts = [0]
+    with open(in_filename, "rb") as in_f:
+        for i in range(1, num_ranges):
+            in_f.seek(max(file_size * i // num_ranges, starts[-1]))
+            # skip the partial line
+            in_f.readline()
+            while True:
+                pos = in_f.tell()
+                line = in_f.readline()
+                if len(line) == 0 or line.strip().startswith(b"<page>"):
+                    break
+            if starts[-1] < pos < file_size:
+                starts.append(pos)
+    return list(zip(starts, starts[1:] + [file_size]))
+
+def read_redirects_byte_range(args):
+    in_filename, start, end = args
+    parser = RedirectParser()
+    with open(in_filename, "rb") as in_f:
+        in_f.seek(start)
+        pos = start
+        while pos < end:
+            line = in_f.readline()
+            if len(line) == 0:
+                break
+            pos += len(line)
+            parser.parse_line(line.decode("utf-8"))
+    return dict(parser.title_map)
+
+def read_in_redirects(in_filename, total_lines, processes=1):
+    if processes <= 1:
+        parser = RedirectParser()
+        with open(in_filename, "r", encoding="utf-8") as in_f:
+            for line in tqdm(in_f, total=total_lines, desc="Reading in redirects"):
+                parser.parse_line(line)
+        title_map = parser.title_map
+    else:
+        # a few ranges per process to balance the load
+        byte_ranges = get_page_byte_ranges(in_filename, 4 * processes)
+        title_map = defaultdict(set)
+        with Pool(processes=processes) as pool:
+            for range_title_map in tqdm(pool.imap_unordered(read_redirects_byte_range, [(in_filename, start, end) for start, end in byte_ranges]),
+                                        total=len(byte_ranges), desc="Reading in redirects"):
+                for k, pairs in range_title_map.items():
+                    title_map[k].update(pairs)
     new_dict = {}
     for k in tqdm(title_map, desc="Converting to lists"):
         new_dict[k] = list(title_map[k])
     return new_dict
 
-def add_redirects(title_map, wikititle2item):
-    wikititle2item_save = copy.deepcopy(wikititle2item)
-    for good_title in tqdm(title_map, desc="Adding redirects"):
-        good_title_converted = convert_title(good_title)
-        if good_title not in wikititle2item_save and good_title_converted not in wikititle2item_save:
-            # print(f"Good {good_title} (or {good_title_converted}) not in wikititle2item")
+def resolve_redirect_chains(title_map, is_page_title):
+    """ Follows every redirect to the end of its chain (A -> B -> C gives A -> C).
+
+    Each redirect page points to the target of its latest revision, which makes a forest of parent pointers over
+    titles. Titles for which is_page_title holds are roots even if they are also redirect pages, so titles that
+    already have a wikipedia page keep it. The root of every title is found with path compression, so every pointer
+    is followed once. Returns the title -> canonical title map of all redirect titles and the cycles found. Titles on
+    or leading into a cycle map to None. """
+    parent = {}
+    parent_timestamp = {}
+    for target, pairs in title_map.items():
+        # pages that are not redirects
+        if target == "":
             continue
-        if good_title in wikititle2item_save:
-            items = wikititle2item_save[good_title]
+        for timestamp, title in pairs:
+            if is_page_title(title):
+                continue
+            if title not in parent or timestamp > parent_timestamp[title]:
+                parent[title] = target
+                parent_timestamp[title] = timestamp
+    del parent_timestamp
+    canonical = {}
+    cycles = []
+    for title in tqdm(parent, desc="Resolving redirect chains"):
+        if title in canonical:
+            continue
+        path = []
+        path_index = {}
+        node = title
+        while node in parent and node not in canonical and node not in path_index:
+            path_index[node] = len(path)
+            path.append(node)
+            node = parent[node]
+        if node in path_index:
+            cycles.append(path[path_index[node]:])
+            root = None
+        elif node in canonical:
+            root = canonical[node]
         else:
-            items = wikititle2item_save[good_title_converted]
+            root = node
+        for node in path:
+            canonical[node] = root
+    return canonical, cycles
+
+def flatten_redirects(title_map, canonical):
+    """ Returns title_map with every redirect moved to the canonical title of its target. Redirects into cycles are dropped. """
+    flat_title_map = defaultdict(list)
+    for target, pairs in title_map.items():
+        if target == "":
+            continue
+        root = canonical.get(target, target)
+        if root is None:
+            continue
+        flat_title_map[root].extend(pairs)
+    return flat_title_map
+
+def write_canonical_titles(output_file, canonical):
+    with open(output_file, "w", encoding='utf8') as out_f:
+        for title, canonical_title in canonical.items():
+            if canonical_title is not None:
+                out_f.write(json.dumps({"title": title, "canonical_title": canonical_title}, ensure_ascii=ENSURE_ASCII) + "\n")
+
+def report_redirect_cycles(output_file, cycles, max_print=10):
+    print(f"Found {len(cycles)} redirect cycles ({sum(len(c) for c in cycles)} titles). They are saved to {output_file}.")
+    for cycle in cycles[:max_print]:
+        print("Redirect cycle:", " -> ".join(cycle + cycle[:1]))
+    with open(output_file, "w", encoding='utf8') as out_f:
+        for cycle in cycles:
+            out_f.write(json.dumps(cycle, ensure_ascii=ENSURE_ASCII) + "\n")
+
+def add_redirects(title_map, wikititle2item):
+    """ Adds, in place, an item for every title redirecting to a wikipedia title. It copies the first item of the
+    wikipedia title (always one read from the title mappings, as redirect items are appended after them) with the redirect title. """
+    for good_title in tqdm(title_map, desc="Adding redirects"):
+        items_title = good_title
+        if items_title not in wikititle2item:
+            items_title = convert_title(good_title)
+            if items_title not in wikititle2item:
+                continue
+        qid, wpid, _, wikidata_title, wikipedia_title = next(iter(wikititle2item[items_title]))
         for redirect_title_pair in title_map[good_title]:
-            new_item = {}
-            # print(good_title, "R:", redirect_title, list(wikititle2item[good_title])[0], "---", wikititle2item[good_title])
-            item_to_copy = json.loads(list(items)[0])
-            for k in item_to_copy:
-                new_item[k] = item_to_copy[k]
-            new_item["title"] = redirect_title_pair[1]
-            wikititle2item[good_title].add(json.dumps(new_item, default=str, ensure_ascii=ENSURE_ASCII))
-    return wikititle2item, wikititle2item_save
+            add_title_item(wikititle2item, (qid, wpid, redirect_title_pair[1], wikidata_title, wikipedia_title))
+    return wikititle2item
 
 
 def read_in_wikipedia_pageids(args):
@@ -134,25 +271,19 @@ def read_in_wikipedia_pageids(args):
 
 
 def read_in_wikipedia_title(args):
-    fdir = os.path.join(args.data, "processed_batches", "wikipedia_links")
-    wikipedia_files = utils.get_batch_files(fdir)
+    wikipedia_files = utils.get_table_files(os.path.join(args.data, "processed_batches"), "wikipedia_links", LANG_CODE)
     title_to_id = defaultdict(set)
     for file in tqdm(wikipedia_files, desc="Reading in wikipedia files"):
-        with open(file, "r", encoding="utf-8") as in_f:
-            for line in in_f:
-                line = json.loads(line)
-                title_to_id[line["wiki_title"]].add(line["qid"])
+        for line in utils.table_generator(file):
+            title_to_id[line["wiki_title"]].add(line["qid"])
     return title_to_id
 
 def read_in_wikidata_title(args):
-    fdir = os.path.join(args.data, "processed_batches", "labels")
-    wikidata_files = utils.get_batch_files(fdir)
+    wikidata_files = utils.get_table_files(os.path.join(args.data, "processed_batches"), "labels", LANG_CODE)
     id_to_title = defaultdict(set)
     for file in tqdm(wikidata_files, desc="Reading in wikidata files"):
-        with open(file, "r", encoding="utf-8") as in_f:
-            for line in in_f:
-                line = json.loads(line)
-                id_to_title[line["qid"]].add(line["label"])
+        for line in utils.table_generator(file):
+            id_to_title[line["qid"]].add(line["label"])
     return id_to_title
 
 def main():
@@ -165,25 +296,41 @@ def main():
     # This will NOT contain redirects from Wikidata
     output_file = os.path.join(out_dir, "title_to_all_ids_raw.jsonl")
 
-    wikipedia_titles_to_qid = read_in_wikipedia_title(args)
-    wikipedia_titles_to_wpid = read_in_wikipedia_pageids(args)
-    qid_to_wikidata = read_in_wikidata_title(args)
+    # read first so the redirect workers do not fork a parent holding the title mappings
+    redirect_title_map = read_in_redirects(args.wikipedia_xml, args.total_wikipedia_xml_lines, args.processes)
+    assert len(redirect_title_map) > 0
 
-    total_lines = merge_title_mappings(output_file, qid_to_wikidata, wikipedia_titles_to_qid, wikipedia_titles_to_wpid)
+    if args.resume and os.path.exists(output_file):
+        print(f"Resuming from {output_file}")
+        wikititle2item = read_in_saved_title_file(output_file)
+    else:
+        wikipedia_titles_to_qid = read_in_wikipedia_title(args)
+        wikipedia_titles_to_wpid = read_in_wikipedia_pageids(args)
+        qid_to_wikidata = read_in_wikidata_title(args)
+        wikititle2item = merge_title_mappings(output_file, qid_to_wikidata, wikipedia_titles_to_qid, wikipedia_titles_to_wpid)
+        del wikipedia_titles_to_qid, wikipedia_titles_to_wpid, qid_to_wikidata
 
-    redirect_title_map = read_in_redirects(args.wikipedia_xml, args.total_wikipedia_xml_lines)
-    assert len(redirect_title_map) > 0
-    print('Writing down temp_redirects.json which may take a couple of minutes ...')
+    # Resolve redirects to redirects so every redirect title is added to the wikipedia title at the end of its chain
+    canonical, cycles = resolve_redirect_chains(redirect_title_map,
+                                                lambda title: title in wikititle2item or convert_title(title) in wikititle2item)
+    print(f"Resolved {len(canonical)} redirect titles. {sum(1 for t in redirect_title_map if t in canonical)} redirect targets are redirects.")
+    write_canonical_titles(os.path.join(out_dir, "redirect_to_canonical_title.jsonl"), canonical)
+    report_redirect_cycles(os.path.join(out_dir, "redirect_cycles.jsonl"), cycles)
+    redirect_title_map = flatten_redirects(redirect_title_map, canonical)
+    del canonical, cycles
 
-    # Add redirects from Wikidata
-    wikititle2item = read_in_saved_title_file(output_file, total_lines)
-    wikititle2item, wikititle2item_original = add_redirects(redirect_title_map, wikititle2item)
+    # Add redirects from Wikipedia
+    add_redirects(redirect_title_map, wikititle2item)
+    del redirect_title_map
     print('Writing down title_to_all_ids.jsonl which may take a couple of minutes ...')
     output_file = os.path.join(out_dir, "title_to_all_ids.jsonl")
     with jsonlines.open(output_file, 'w') as out_file:
-        for good_title in wikititle2item:
-            for item in wikititle2item[good_title]:
-                out_file.write(json.loads(item))
+        for items in wikititle2item.values():
+            for item in items:
+                out_file.write(item_to_dict(item))
+    del wikititle2item
+    # steps 3a and 3b open this index instead of loading title_to_all_ids.jsonl
+    build_title_index(output_file)
 
     print(f"Finished in {time.time() - start}")
 
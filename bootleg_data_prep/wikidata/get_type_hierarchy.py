@@ -0,0 +1,91 @@
+'''
+This file
+
+1. Reads in the subclass of (P279) relations of all QIDs and the instance of (P31) relations of the filtered QIDs
+2. Computes the closure of the subclass hierarchy (see bootleg_data_prep/utils/classes/type_hierarchy.py)
+3. Saves it to <out_dir>/type_hierarchy, next to wikidata_types.json
+
+Load it with TypeHierarchy(load_dir=...) to ask whether entities are a kind of a type (is_a) or for the ancestors of a type.
+
+to run:
+python3 -m bootleg_data_prep.wikidata.get_type_hierarchy --data $BOOTLEG_PREP_WIKIDATA_DIR --out_dir wikidata_output --qids qid2title.json
+
+'''
+
+import os, argparse, time
+
+from multiprocessing import set_start_method
+
+from bootleg_data_prep.utils.classes.type_hierarchy import TypeHierarchy
+from bootleg_data_prep.wikidata.entity_rels_scan import EntityRelsConsumer, load_qid_filter, run_scan
+
+INSTANCE_OF = 'P31'
+SUBCLASS_OF = 'P279'
+TYPE_HIERARCHY_DIR = 'type_hierarchy'
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type = str, default = '/lfs/raiders8/0/lorr1/wikidata', help = 'path to output directory')
+    parser.add_argument('--out_dir', type = str, default = 'types_output', help = 'path to output directory')
+    parser.add_argument('--processes', type = int, default = 80, help = "Number of concurrent processes to spin off. ")
+    parser.add_argument('--qids', default = None, help = 'QIDs to keep the instance of types for (json list or dict keyed by QID)')
+    return parser
+
+class TypeHierarchyConsumer(EntityRelsConsumer):
+    """ Collects the subclass edges of all QIDs and the instance of types of the filtered QIDs """
+    name = 'type_hierarchy'
+    property_ids = {INSTANCE_OF, SUBCLASS_OF}
+    uses_qid_filter = True
+    # types are not in the QID filter, so their parents are read for all QIDs
+    unfiltered_property_ids = {SUBCLASS_OF}
+
+    def __init__(self):
+        self.subclass_edges = []
+        self.entity_types = {}
+
+    def consume(self, qid, property_id, value):
+        if property_id == SUBCLASS_OF:
+            self.subclass_edges.append((qid, value))
+        else:
+            if qid not in self.entity_types:
+                self.entity_types[qid] = []
+            self.entity_types[qid].append(value)
+
+    def finish(self, job_index, out_dir):
+        print(f"Found {len(self.subclass_edges)} subclass edges and types of {len(self.entity_types)} entities.")
+        return self.subclass_edges, self.entity_types
+
+    @classmethod
+    def merge_and_save(cls, results, out_dir, args, bucketed=False):
+        subclass_edges = []
+        entity_types = {}
+        for edges, types in results:
+            subclass_edges.extend(edges)
+            for qid, qid_types in types.items():
+                if qid not in entity_types:
+                    entity_types[qid] = []
+                entity_types[qid].extend(qid_types)
+        type_hierarchy = TypeHierarchy(subclass_edges=subclass_edges, entity_types=entity_types)
+        out_path = os.path.join(out_dir, TYPE_HIERARCHY_DIR)
+        type_hierarchy.dump(out_path)
+        print(f"Written hierarchy of {type_hierarchy.num_types} types ({len(type_hierarchy.ancestors)} ancestors) "
+              f"and {type_hierarchy.num_entities} entities to {out_path}")
+        return out_path
+
+def main():
+    set_start_method('spawn')
+    start = time.time()
+    args = get_arg_parser().parse_args()
+
+    out_dir = os.path.join(args.data, args.out_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    filter_qids = load_qid_filter(args.qids)
+    print(f"Loaded {len(filter_qids)} qids.")
+    run_scan([TypeHierarchyConsumer], args, out_dir, filter_qids)
+    print(f"Finished in {time.time() - start}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,17 +11,17 @@ python3.6 -m processor.get_types
 
     
 import os, json, argparse, time
-from glob import glob
 
-import marisa_trie
 from tqdm import tqdm 
-from multiprocessing import set_start_method, Pool
+from multiprocessing import set_start_method
 
 from collections import defaultdict
 
 import simple_wikidata_db.utils as utils
 
-from bootleg_data_prep.language import ENSURE_ASCII
+from bootleg_data_prep.language import ENSURE_ASCII, LANG_CODE
+from bootleg_data_prep.utils.qid_sorted_store import merge_sorted_runs, write_sorted_run
+from bootleg_data_prep.wikidata.entity_rels_scan import EntityRelsConsumer, load_qid_filter, run_scan
 
 OCCUPATION = 'P106'
 INSTANCE_OF = 'P31'
@@ -37,53 +37,45 @@ def get_arg_parser():
     parser.add_argument('--qids', default = '/lfs/raiders8/0/lorr1/es_bootleg/es_qids.json')
     return parser 
 
-def init_process(args):
-    temp_f = args[0]
-    vals = list(json.load(open(temp_f, "r", encoding="utf-8")))
-    global filter_qids_global
-    filter_qids_global = marisa_trie.Trie(vals)
-
-def launch_entity_table(entity_files, qid_to_title, filter_qids, out_dir, args):
-    temp_f = os.path.join(out_dir, "_temp_filter.json")
-    json.dump(list(filter_qids), open(temp_f, "w", encoding='utf8'), ensure_ascii=ENSURE_ASCII)
-    print(f"Starting with {args.processes} processes")
-    pool = Pool(processes = args.processes, initializer=init_process, initargs=(tuple([temp_f]),))
-    messages = [(i, len(entity_files), entity_files[i], out_dir) for i in range(len(entity_files))]
-    pool.map(load_entity_file, messages, chunksize=1)
-    merge_and_save(out_dir, qid_to_title)
-    return
-
-def load_entity_file(message):
-    start = time.time()
-    job_index, num_jobs, filename, out_dir = message
-    type_dict = defaultdict(set)
-    for triple in utils.jsonl_generator(filename):
-        qid, property_id, value = triple['qid'], triple['property_id'], triple['value']
-        if property_id in TYPE_PIDS and (len(filter_qids_global) == 0 or qid in filter_qids_global):
-            type_dict[qid].add(value)
-
-    out_f = open(os.path.join(out_dir, f"_out_{job_index}.json"), "w", encoding='utf8')
-    print(f"Found {len(type_dict)}")
-    type_dict = dict(type_dict)
-    # convert to list type for json serialization
-    for k in list(type_dict.keys()):
-        type_dict[k] = list(type_dict[k])
-    json.dump(type_dict, out_f, ensure_ascii=ENSURE_ASCII)
-    print(f"Finished {job_index} / {num_jobs}...{filename}. Fetched types for {len(type_dict)} entities. {time.time() - start} seconds.")
-    return dict(type_dict)
-
-def merge_and_save(out_dir, qid_to_title):
-    type_dict = defaultdict(set)
+class TypesConsumer(EntityRelsConsumer):
+    """ Collects the types of every QID """
+    name = 'types'
+    property_ids = TYPE_PIDS
+    uses_qid_filter = True
+
+    def __init__(self):
+        self.type_dict = defaultdict(set)
+
+    def consume(self, qid, property_id, value):
+        self.type_dict[qid].add(value)
+
+    def finish(self, job_index, out_dir):
+        out_f = os.path.join(out_dir, f"_types_{job_index}.jsonl")
+        # convert to list type for json serialization
+        write_sorted_run(out_f, {k: sorted(v) for k, v in self.type_dict.items()})
+        print(f"Fetched types for {len(self.type_dict)} entities.")
+        return out_f
+
+    @classmethod
+    def merge_and_save(cls, results, out_dir, args, bucketed=False):
+        print(f"Loading wikidata qids to titles")
+        qid_to_title = read_in_wikidata_title(args)
+        merge_and_save(out_dir, qid_to_title, results)
+
+def merge_types(type_lists):
+    """ Unions the types of a QID found in several runs """
+    if len(type_lists) == 1:
+        return type_lists[0]
+    return sorted(set(t for types in type_lists for t in types))
+
+def merge_and_save(out_dir, qid_to_title, in_files):
+    """ Streams the QID sorted worker runs twice: once to count type frequencies, once to write the sorted types """
     type_freq = defaultdict(int)
-    in_files = glob(os.path.join(out_dir, f"_out_*.json"))
-    for f in tqdm(in_files):
-        d = json.load(open(f, 'r', encoding="utf-8"))
-        for qid, types in d.items():
-            for qtype in types:
-                type_dict[qid].add(qtype)
-                type_freq[qtype] += 1
+    for qid, types in tqdm(merge_sorted_runs(in_files, merge_types), desc="Counting types"):
+        for qtype in types:
+            type_freq[qtype] += 1
     # Sort types based on most to least frequent
-    sorted_typs = sort_types(type_dict, type_freq)
+    sorted_typs = sort_types(merge_sorted_runs(in_files, merge_types), type_freq)
     write_types(out_dir, sorted_typs, qid_to_title)
 
     with open(os.path.join(out_dir, 'type_freqs.json'), 'w', encoding='utf8') as out_file:
@@ -95,21 +87,25 @@ def merge_and_save(out_dir, qid_to_title):
     return
 
 # Sort types based on most to least frequent
-def sort_types(type_dict, type_freq):
-    sorted_types = {} # map QID to list of ordered type qids
-    for qid, types in type_dict.items():
+def sort_types(type_items, type_freq):
+    """ Returns generator over (QID, list of type qids ordered from most to least frequent). The type lists of the
+    runs are sorted, so types of equal frequency stay in type QID string order. """
+    for qid, types in type_items:
         stypes = sorted(types, key=lambda i: type_freq[i], reverse=True)
-        sorted_types[qid] = stypes 
-    return sorted_types
+        yield qid, stypes
 
-def write_types(out_dir, type_list, qid_to_title):
+def write_types(out_dir, type_items, qid_to_title):
+    """ Writes the types of every QID as type ids. Type ids, and the _<type qid> suffix of duplicate type titles, are
+    given in the order types are first seen over the QID sorted entities, so the same input always gives the same vocab. """
     index = 1
     typetitle2index = {}
     title2typeqid = {}
     typeqid2index = {}
     with open(os.path.join(out_dir, 'wikidata_types.json'), 'w', encoding='utf8') as out_file:
-        new_type_list = {}
-        for qid, types in type_list.items(): 
+        # written entry by entry so the QID to types map is never in memory
+        out_file.write('{')
+        num_written = 0
+        for qid, types in type_items:
             type_indices = []
             for qtype in types:
                 typetitle = qid_to_title.get(qtype, qtype)
@@ -124,8 +120,11 @@ def write_types(out_dir, type_list, qid_to_title):
                     typetitle2index[typetitle] = index
                     index += 1
                 type_indices.append(typeqid2index[qtype])
-            new_type_list[qid] = type_indices
-        json.dump(new_type_list, out_file, ensure_ascii=ENSURE_ASCII)
+            if num_written > 0:
+                out_file.write(',')
+            out_file.write(json.dumps(qid, ensure_ascii=ENSURE_ASCII) + ':' + json.dumps(type_indices))
+            num_written += 1
+        out_file.write('}')
     
     with open(os.path.join(out_dir, 'wikidatatitle_to_typeid.json'), 'w', encoding='utf8') as out_file:
         json.dump(typetitle2index, out_file, ensure_ascii=ENSURE_ASCII)
@@ -134,14 +133,11 @@ def write_types(out_dir, type_list, qid_to_title):
     print(f"Writtten to {out_dir}")
 
 def read_in_wikidata_title(args):
-    fdir = os.path.join(args.data, "processed_batches", "labels")
-    wikidata_files = utils.get_batch_files(fdir)
+    wikidata_files = utils.get_table_files(os.path.join(args.data, "processed_batches"), "labels", LANG_CODE)
     id_to_title = {}
     for file in tqdm(wikidata_files, desc="Reading in wikidata files"):
-        with open(file, "r", encoding="utf-8") as in_f:
-            for line in in_f:
-                line = json.loads(line)
-                id_to_title[line["qid"]] = line["label"]
+        for line in utils.table_generator(file):
+            id_to_title[line["qid"]] = line["label"]
     return id_to_title
 
 def main():
@@ -153,22 +149,10 @@ def main():
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    print(f"Loading wikidata qids to titles")
-    qid_to_title = read_in_wikidata_title(args)
-
     print("args.qids", args.qids)
-    if len(args.qids) > 0:
-        filter_qids = json.load(open(args.qids))
-        if type(filter_qids) is dict:
-            filter_qids = set(filter_qids.keys())
-        else:
-            filter_qids = set(json.load(open(args.qids)))
-    else:
-        filter_qids = []
+    filter_qids = load_qid_filter(args.qids)
     print(f"Loaded {len(filter_qids)} qids.")
-    fdir = os.path.join(args.data, "processed_batches", "entity_rels")
-    entity_table_files = utils.get_batch_files(fdir)
-    launch_entity_table(entity_table_files, qid_to_title, filter_qids, out_dir, args)
+    run_scan([TypesConsumer], args, out_dir, filter_qids)
     print(f"Finished in {time.time() - start}")
 
 
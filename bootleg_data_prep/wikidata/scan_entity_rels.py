@@ -0,0 +1,62 @@
+'''
+This file
+
+1. Reads in all entity-entity relations once
+2. Runs the selected consumers over them in the same scan:
+    - types (get_types.py): wikidata_types.json, wikidatatitle_to_typeid.json, wikidatatitle_to_typeqid.json, type_freqs.json
+    - kg_triples (get_all_wikipedia_triples.py): the QID sorted kg_triples store
+    - disambig (get_disambiguation_qids.py): disambig_qids.json
+    - person_gender (get_person_gender_qids.py): person_qids.json and person_gender.json
+    - type_hierarchy (get_type_hierarchy.py): the subclass closure in type_hierarchy/
+3. Writes the output of every consumer to the same out_dir
+
+--qids only restricts types, kg_triples and the instance of types of type_hierarchy, as when running their scripts separately.
+
+to run:
+python3 -m bootleg_data_prep.wikidata.scan_entity_rels --data $BOOTLEG_PREP_WIKIDATA_DIR --out_dir wikidata_output --qids qid2title.json
+
+'''
+
+import os, argparse, time
+
+from multiprocessing import set_start_method
+
+from bootleg_data_prep.wikidata.entity_rels_scan import load_qid_filter, run_scan
+from bootleg_data_prep.wikidata.get_all_wikipedia_triples import TriplesConsumer
+from bootleg_data_prep.wikidata.get_disambiguation_qids import DisambigConsumer
+from bootleg_data_prep.wikidata.get_person_gender_qids import PersonGenderConsumer
+from bootleg_data_prep.wikidata.get_type_hierarchy import TypeHierarchyConsumer
+from bootleg_data_prep.wikidata.get_types import TypesConsumer
+
+CONSUMERS = {c.name: c for c in [TypesConsumer, TriplesConsumer, DisambigConsumer, PersonGenderConsumer, TypeHierarchyConsumer]}
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type = str, default = '/lfs/raiders8/0/lorr1/wikidata', help = 'path to output directory')
+    parser.add_argument('--out_dir', type = str, default = 'wikidata_output', help = 'path to output directory')
+    parser.add_argument('--processes', type = int, default = 80, help = "Number of concurrent processes to spin off. ")
+    parser.add_argument('--qids', type = str, default = None, help = 'QIDs to keep types, kg triples and instance of types for (json list or dict keyed by QID)')
+    parser.add_argument('--consumers', type = str, default = ','.join(CONSUMERS), help = f'comma separated consumers to run from {list(CONSUMERS)}')
+    return parser
+
+
+def main():
+    set_start_method('spawn')
+    start = time.time()
+    args = get_arg_parser().parse_args()
+
+    out_dir = os.path.join(args.data, args.out_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    consumer_names = args.consumers.split(',')
+    for name in consumer_names:
+        assert name in CONSUMERS, f"Unknown consumer {name}. Choose from {list(CONSUMERS)}"
+    filter_qids = load_qid_filter(args.qids)
+    print(f"Loaded {len(filter_qids)} qids.")
+    run_scan([CONSUMERS[name] for name in consumer_names], args, out_dir, filter_qids)
+    print(f"Finished {consumer_names} in {time.time() - start}s.")
+
+
+if __name__ == "__main__":
+    main()
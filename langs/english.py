@@ -1,10 +1,11 @@
 import string
-import unicodedata
 import nltk
 from nltk import tokenize
 from nltk import corpus
 from nameparser import HumanName
 
+from langs.normalizer import LnrmNormalizer
+
 PUNC = string.punctuation
 PUNC_TRANSLATION_TABLE = str.maketrans(dict.fromkeys(PUNC))  # OR {key: None for key in string.punctuation}
 BASE_STOPWORDS = set(corpus.stopwords.words('english'))
@@ -52,29 +53,10 @@ def pos_tag(tokens):
 def ngrams(tags, n):
     return nltk.ngrams(tags, n)
 
-def get_lnrm(s, strip, lower):
-    """Convert a string to its lnrm form
-    We form the lower-cased normalized version l(s) of a string s by canonicalizing
-    its UTF-8 characters, eliminating diacritics, lower-casing the UTF-8 and
-    throwing out all ASCII-range characters that are not alpha-numeric.
-    from http://nlp.stanford.edu/pubs/subctackbp.pdf Section 2.3
-    Args:
-        input string
-    Returns:
-        the lnrm form of the string
-    """
-    if not strip and not lower:
-        return s
-    lnrm = str(s)
-    if lower:
-        lnrm = lnrm.lower()
-    if strip:
-        lnrm = unicodedata.normalize('NFD', lnrm)
-        lnrm = ''.join([x for x in lnrm if (not unicodedata.combining(x)
-                                            and x.isalnum() or x == ' ')]).strip()
-    # will remove if there are any duplicate white spaces e.g. "the  alias    is here"
-    lnrm = " ".join(lnrm.split())
-    return lnrm
+# see langs/normalizer.py
+LNRM_NORMALIZER = LnrmNormalizer(normalization_form='NFD')
+get_lnrm = LNRM_NORMALIZER.get_lnrm
+get_lnrms = LNRM_NORMALIZER.get_lnrms
 
 class HumanNameParser(HumanName):
     pass
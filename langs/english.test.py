@@ -5,7 +5,12 @@ This is a SHALLOW test to aid developing new language module,
 
 """
 
-import english as language
+import os
+import sys
+
+# the language modules import langs.normalizer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langs import english as language
 
 assert isinstance(language.PUNC, str)
 assert isinstance(language.PUNC_TRANSLATION_TABLE, dict)
@@ -28,6 +33,7 @@ assert isinstance(ngrams_list, list)
 assert isinstance(ngrams_list[0], tuple)
 normalized_text = language.get_lnrm('Big Small\t business', True, True)
 assert normalized_text == 'big small business'
+assert language.get_lnrms(['Big Small\t business'], True, True) == ['big small business']
 hn = language.HumanNameParser('Homer Simpson')
 assert hn.first == 'Homer'
 assert hn.last == 'Simpson'
@@ -5,7 +5,12 @@ This is a SHALLOW test to aid developing new language module,
 
 """
 
-import hebrew as language
+import os
+import sys
+
+# the language modules import langs.normalizer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langs import hebrew as language
 
 assert isinstance(language.PUNC, str)
 assert isinstance(language.PUNC_TRANSLATION_TABLE, dict)
@@ -28,6 +33,7 @@ assert isinstance(ngrams_list, list)
 assert isinstance(ngrams_list[0], tuple)
 normalized_text = language.get_lnrm('משרד החוץ\t פרסם', True, True)
 assert normalized_text == 'משרד החוץ פרסם'
+assert language.get_lnrms(['משרד החוץ\t פרסם'], True, True) == ['משרד החוץ פרסם']
 hn = language.HumanNameParser('הומר סימפסון')
 assert hn.first == 'הומר'
 assert hn.last == 'סימפסון'
@@ -0,0 +1,124 @@
+"""
+Shared lnrm normalizer used by the language modules.
+
+The lnrm form of a string (http://nlp.stanford.edu/pubs/subctackbp.pdf Section 2.3) is computed with
+
+- an ASCII fast path: unicode normalization and combining marks are no-ops on ASCII, so a single str.translate drops
+  the non-alphanumerics
+- translation tables that delete combining marks and non-alphanumerics after unicode normalization. The ASCII and
+  combining diacritics ranges are precomputed; other characters are classified once, the first time they are seen
+- a bounded LRU cache over the raw strings (anchors and aliases repeat a lot)
+- a batch API (get_lnrms) that lowers and translates ASCII strings joined together
+
+A language module builds one LnrmNormalizer with its unicode normalization form and exports its get_lnrm/get_lnrms.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+LNRM_CACHE_SIZE = 2 ** 20
+# joins ASCII strings in get_lnrms; it is never part of an ASCII string
+BATCH_SEPARATOR = '\ue000'
+MULTI_SPACE_RE = re.compile(' {2,}')
+PRECOMPUTED_RANGES = [range(0, 0x80), range(0x300, 0x370)]
+
+
+def keep_lnrm_char(c):
+    return (not unicodedata.combining(c) and c.isalnum()) or c == ' '
+
+
+def reference_lnrm(s, strip, lower, normalization_form='NFD'):
+    """ Character by character lnrm, as the language modules used to compute it. Kept to check and benchmark LnrmNormalizer """
+    if not strip and not lower:
+        return s
+    lnrm = str(s)
+    if lower:
+        lnrm = lnrm.lower()
+    if strip:
+        lnrm = unicodedata.normalize(normalization_form, lnrm)
+        lnrm = ''.join([x for x in lnrm if keep_lnrm_char(x)]).strip()
+    lnrm = " ".join(lnrm.split())
+    return lnrm
+
+
+class LnrmTranslationTable(dict):
+    """ str.translate table that deletes combining marks and non-alphanumerics (except spaces).
+
+    Characters are classified on first lookup (__missing__) and stored, so later lookups stay in C.
+    """
+    def __init__(self, precomputed_ranges=()):
+        super().__init__()
+        for char_range in precomputed_ranges:
+            for code in char_range:
+                self[code]
+
+    def __missing__(self, code):
+        c = chr(code)
+        value = c if keep_lnrm_char(c) else None
+        self[code] = value
+        return value
+
+
+class LnrmNormalizer:
+    def __init__(self, normalization_form='NFD', cache_size=LNRM_CACHE_SIZE):
+        self.normalization_form = normalization_form
+        self.table = LnrmTranslationTable(PRECOMPUTED_RANGES)
+        # get_lnrms only translates ASCII strings joined by BATCH_SEPARATOR
+        self.batch_table = {code: self.table[code] for code in range(0x80)}
+        self.batch_table[ord(BATCH_SEPARATOR)] = BATCH_SEPARATOR
+        self._cached_lnrm = lru_cache(maxsize=cache_size)(self._lnrm)
+
+    def _lnrm(self, s, strip, lower):
+        if lower:
+            s = s.lower()
+        if strip:
+            if not s.isascii():
+                s = unicodedata.normalize(self.normalization_form, s)
+            s = s.translate(self.table)
+        # will remove if there are any duplicate white spaces e.g. "the  alias    is here"
+        return " ".join(s.split())
+
+    def get_lnrm(self, s, strip, lower):
+        """Convert a string to its lnrm form
+        We form the lower-cased normalized version l(s) of a string s by canonicalizing
+        its UTF-8 characters, eliminating diacritics, lower-casing the UTF-8 and
+        throwing out all ASCII-range characters that are not alpha-numeric.
+        from http://nlp.stanford.edu/pubs/subctackbp.pdf Section 2.3
+        Args:
+            input string
+        Returns:
+            the lnrm form of the string
+        """
+        if not strip and not lower:
+            return s
+        return self._cached_lnrm(str(s), bool(strip), bool(lower))
+
+    def _ascii_lnrms(self, strings, strip, lower):
+        if len(strings) == 0:
+            return []
+        joined = BATCH_SEPARATOR.join(strings)
+        if lower:
+            joined = joined.lower()
+        if not strip:
+            return [" ".join(s.split()) for s in joined.split(BATCH_SEPARATOR)]
+        # spaces are the only whitespace left after the translation, so they are collapsed on the joined string
+        joined = MULTI_SPACE_RE.sub(' ', joined.translate(self.batch_table))
+        joined = joined.replace(' ' + BATCH_SEPARATOR, BATCH_SEPARATOR).replace(BATCH_SEPARATOR + ' ', BATCH_SEPARATOR)
+        return joined.strip(' ').split(BATCH_SEPARATOR)
+
+    def get_lnrms(self, strings, strip, lower):
+        """ Returns the lnrm form of every string of a list (same output as get_lnrm on each) """
+        if not strip and not lower:
+            return list(strings)
+        strings = [str(s) for s in strings]
+        unique_strings = list(dict.fromkeys(strings))
+        ascii_strings = [s for s in unique_strings if s.isascii()]
+        lnrms = dict(zip(ascii_strings, self._ascii_lnrms(ascii_strings, strip, lower)))
+        if len(lnrms) < len(unique_strings):
+            for s in unique_strings:
+                if s not in lnrms:
+                    lnrms[s] = self._cached_lnrm(s, bool(strip), bool(lower))
+        return [lnrms[s] for s in strings]
+
+    def cache_info(self):
+        return self._cached_lnrm.cache_info()
@@ -16,9 +16,9 @@ fi
 ./step2b-create-aliases.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step2b-create-aliases.log
 ./step3a-curate-aliases.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step3a-curate-aliases.log
 ./step3b-remove-bad-aliases.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step3b-remove-bad-aliases.log
-./step4a-get-all-wikipedia-triples.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step4a-get-all-wikipedia-triples.log
-./step4b-get-types.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step4b-get-types.log
+./step4a-scan-entity-rels.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step4a-scan-entity-rels.log
 ./step4c-get-descriptions.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step4c-get-descriptions.log
+./step4f-get-pid-names.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step4f-get-pid-names.log
 if [ "$BOOTLEG_PREP_WEAK_LABELING" = true ] ; then
   ./step4d-weak-labeling.bash 2>&1 | tee $BOOTLEG_PREP_OUTPUT_LOGS_DIR/step4d-weak-labeling.log
 fi
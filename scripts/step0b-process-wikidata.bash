@@ -7,9 +7,10 @@ source ./envs.bash
 cd $BOOTLEG_PREP_DATA_DIR
 export PYTHONPATH=$BOOTLEG_PREP_CODE_DIR/simple_wikidata_db
 python3 $BOOTLEG_PREP_CODE_DIR/simple_wikidata_db/preprocess_dump.py \
-    --input_file $BOOTLEG_PREP_DATA_DIR/wikidata/raw_data/latest-all.json \
+    --input_file $BOOTLEG_PREP_DATA_DIR/wikidata/raw_data/latest-all.json.bz2 \
     --out_dir $BOOTLEG_PREP_WIKIDATA_DIR/processed_batches \
     --total_lines 100000000 \
     --batch_size 1000 \
+    --parallel_read \
     --num_processes $BOOTLEG_PREP_PROCESS_COUNT_MIN \
     --language_id $BOOTLEG_PREP_LANG_CODE
@@ -4,11 +4,7 @@ echo "Step step4g-prnoun-labeling"
 echo "=============================================================================="
 echo
 source ./envs.bash
-echo "THIS IS EXPERIMENTAL AND REQUIRES RUNNING THE BELOW FIRST FOR THE FIRST TIME RUNNING"
-echo "python3 -m bootleg_data_prep.wikidata.get_person_gender_qids \
-        --data $BOOTLEG_PREP_WIKIDATA_DIR \
-        --out_dir wikidata_output \
-        --processes 10"
+echo "THIS IS EXPERIMENTAL AND READS person_qids.json AND person_gender.json WRITTEN BY STEP 4a (person_gender consumer)"
 python3 $BOOTLEG_PREP_CODE_DIR/bootleg_data_prep/prn_labels.py \
     $BOOTLEG_PREP_WIKIPEDIA_DIR/data/wiki_dump/orig_wl \
     $BOOTLEG_PREP_WIKIPEDIA_DIR/data/wiki_dump/orig_wl_prn \
@@ -0,0 +1,9 @@
+echo
+echo "=============================================================================="
+echo "Step step4f-get-pid-names"
+echo "=============================================================================="
+echo
+source ./envs.bash
+python3 $BOOTLEG_PREP_CODE_DIR/bootleg_data_prep/wikidata/get_pid_names.py \
+    --data $BOOTLEG_PREP_WIKIDATA_DIR \
+    --out_dir wikidata_output
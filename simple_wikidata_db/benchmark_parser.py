@@ -0,0 +1,74 @@
+""" Parser micro-benchmark
+
+Compares entities/sec of the full ujson.loads parse against the lazy parser used by preprocess_dump.py --lazy_parse
+on the first lines of a dump, and checks that both return the same fields for everything triplify reads.
+
+Example command:
+
+python3 benchmark_parser.py \
+    --input_file latest-all.json.bz2 \
+    --num_lines 100000
+
+"""
+import argparse
+import time
+import ujson
+
+from itertools import islice
+
+try:
+    from utils import open_dump_file, clean_dump_line
+    from entity_parser import lazy_parse_entity, parse_entity
+except:
+    from simple_wikidata_db.utils import open_dump_file, clean_dump_line
+    from simple_wikidata_db.entity_parser import lazy_parse_entity, parse_entity
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_file', type = str, required = True, help = 'path to raw wikidata json dump (optionally .bz2 or .gz compressed)')
+    parser.add_argument('--language_id', type = str, default = 'en', help = 'language identifier')
+    parser.add_argument('--num_lines', type = int, default = 100000, help = 'number of dump lines to benchmark on')
+    parser.add_argument('--repeats', type = int, default = 3, help = 'the best of this many runs is reported')
+    return parser
+
+def get_read_fields(obj, language_id):
+    """ Returns the parts of a parsed entity which triplify reads """
+    fields = {'type': obj['type'], 'id': obj['id'], 'claims': obj['claims'] if isinstance(obj['claims'], dict) else {}}
+    for key, entry_key in [('labels', language_id), ('descriptions', language_id), ('aliases', language_id), ('sitelinks', f'{language_id}wiki')]:
+        fields[key] = obj[key].get(entry_key) if isinstance(obj[key], dict) else None
+    return fields
+
+def time_parser(parse_func, lines, repeats):
+    """ Returns the best entities/sec of parse_func over lines """
+    best = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for line in lines:
+            parse_func(line)
+        best = max(best, len(lines) / (time.perf_counter() - start))
+    return best
+
+def main():
+    args = get_arg_parser().parse_args()
+    lines = [clean_dump_line(line) for line in islice(open_dump_file(args.input_file), args.num_lines)]
+    lines = [line for line in lines if line.startswith('{')]
+    print(f"Loaded {len(lines)} entities ({sum(map(len, lines)) / 1024**2:.1f}MB) from {args.input_file}")
+
+    num_fallbacks = 0
+    num_mismatches = 0
+    for line in lines:
+        lazy_obj = lazy_parse_entity(line, [args.language_id])
+        if lazy_obj is None:
+            num_fallbacks += 1
+        elif get_read_fields(lazy_obj, args.language_id) != get_read_fields(ujson.loads(line), args.language_id):
+            num_mismatches += 1
+    print(f"Lazy parser fell back to a full parse for {num_fallbacks} entities. Mismatches: {num_mismatches}")
+
+    full_rate = time_parser(ujson.loads, lines, args.repeats)
+    lazy_rate = time_parser(lambda line: parse_entity(line, [args.language_id]), lines, args.repeats)
+    print(f"full parse: {full_rate:.0f} entities/sec")
+    print(f"lazy parse: {lazy_rate:.0f} entities/sec ({lazy_rate / full_rate:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
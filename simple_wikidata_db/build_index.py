@@ -0,0 +1,165 @@
+""" Builds secondary indexes over processed_batches
+
+fetch_with_name.py and fetch_with_rel_and_value.py answer a single lookup by scanning every file of a table. This
+script scans the tables once and saves sorted numpy arrays which query_index.py memory maps and binary searches:
+
+- rows_<table>: for every row of every table, the encoded QID it belongs to (the claim's QID for qualifiers), the id
+  of its file and its byte offset (jsonl) or row number (columnar) in that file, sorted by QID.
+- names: hashes of every label and alias with the encoded QID they belong to, sorted by hash.
+- rels: the encoded (property_id, value, qid) of every entity_rels row, sorted by property and value.
+
+Example command:
+
+python3 build_index.py \
+    --data $DIR_TO_SAVE_DATA_TO \
+    --language_id en \
+    --num_procs 10
+
+"""
+import argparse
+import hashlib
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import ujson as json
+from tqdm import tqdm
+
+try:
+    from utils import *
+except:
+    from simple_wikidata_db.utils import *
+
+INDEX_META_FILE = 'meta.json'
+# tables whose string column is indexed by name
+NAME_COLUMNS = {'labels': 'label', 'aliases': 'alias'}
+REL_TABLE = 'entity_rels'
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type = str, required = True, help = 'path to the output directory of preprocess_dump.py')
+    parser.add_argument('--index_dir', type = str, default = None, help = 'path to save the index to (defaults to <data>/index)')
+    parser.add_argument('--language_id', type = str, default = None, help = 'language to index when the tables were written with --language_ids')
+    parser.add_argument('--tables', type = str, default = ','.join(TABLE_COLUMNS), help = 'comma separated tables to index rows of')
+    parser.add_argument('--num_procs', type = int, default = 10, help = 'Number of processes')
+    return parser
+
+def hash_names(names):
+    """ Returns an int64 array with a 64 bit hash of every name """
+    digests = b''.join(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest() for name in names)
+    return np.frombuffer(digests, dtype='<i8').copy()
+
+def get_index_path(index_dir, name, array):
+    return os.path.join(index_dir, f"{name}.{array}.npy")
+
+def encode_row_qids(table, qids):
+    """ Encodes the QID column of table (the claim id column for qualifiers) """
+    if table == 'qualifiers':
+        qids = [get_row_bucket_key(table, {'claim_id': claim_id}) for claim_id in qids]
+    return np.fromiter((encode_entity_id(qid) for qid in qids), dtype=np.int64, count=len(qids))
+
+def jsonl_offset_generator(fname):
+    """ Returns generator over (byte offset, row) of a jsonl table file """
+    offset = 0
+    with open(fname, 'rb') as in_f:
+        for line in in_f:
+            if len(line.strip()) > 0:
+                yield offset, json.loads(line)
+            offset += len(line)
+
+def index_file(input_args):
+    """ Returns the arrays of a single table file: the row QIDs and offsets, plus the names or relations it holds """
+    table, fname = input_args
+    key_column = BUCKET_KEYS[table]
+    if fname.endswith(f".{COLUMNAR_ENDING}"):
+        columns = read_columnar_file(fname)
+        num_rows = len(columns[key_column])
+        if table == 'qualifiers':
+            keys = encode_row_qids(table, columns[key_column].tolist())
+        else:
+            keys = np.array(columns[key_column], dtype=np.int64)
+        res = {'keys': keys, 'offsets': np.arange(num_rows, dtype=np.int64)}
+        if table in NAME_COLUMNS:
+            res['name_hashes'] = hash_names(columns[NAME_COLUMNS[table]].tolist())
+        if table == REL_TABLE:
+            res['rel_props'] = np.array(columns['property_id'], dtype=np.int64)
+            res['rel_values'] = np.array(columns['value'], dtype=np.int64)
+        return table, fname, res
+    offsets = []
+    rows = []
+    for offset, row in jsonl_offset_generator(fname):
+        offsets.append(offset)
+        rows.append(row)
+    res = {'keys': encode_row_qids(table, [row[key_column] for row in rows]), 'offsets': np.array(offsets, dtype=np.int64)}
+    if table in NAME_COLUMNS:
+        res['name_hashes'] = hash_names([row[NAME_COLUMNS[table]] for row in rows])
+    if table == REL_TABLE:
+        res['rel_props'] = np.fromiter((encode_entity_id(row['property_id']) for row in rows), dtype=np.int64, count=len(rows))
+        res['rel_values'] = np.fromiter((encode_entity_id(row['value']) for row in rows), dtype=np.int64, count=len(rows))
+    return table, fname, res
+
+def save_arrays(index_dir, name, arrays, order):
+    """ Saves every array of arrays (a dict) reordered by order as <index_dir>/<name>.<array>.npy """
+    for array_name, arr in arrays.items():
+        np.save(get_index_path(index_dir, name, array_name), arr[order])
+
+def main():
+    start = time.time()
+    args = get_arg_parser().parse_args()
+    processed_dir = args.data
+    if os.path.isdir(os.path.join(processed_dir, 'processed_batches')):
+        processed_dir = os.path.join(processed_dir, 'processed_batches')
+    index_dir = args.index_dir if args.index_dir is not None else os.path.join(args.data, 'index')
+    create_dir(index_dir)
+
+    tables = [table for table in args.tables.split(',') if os.path.isdir(os.path.join(processed_dir, table))]
+    for table in set(NAME_COLUMNS) | {REL_TABLE}:
+        if table not in tables and os.path.isdir(os.path.join(processed_dir, table)):
+            tables.append(table)
+    files = []
+    tasks = []
+    for table in tables:
+        for fname in sorted(get_table_files(processed_dir, table, args.language_id)):
+            files.append(os.path.relpath(fname, processed_dir))
+            tasks.append((table, fname))
+    file_ids = {os.path.join(processed_dir, fname): file_id for file_id, fname in enumerate(files)}
+
+    results = {table: [] for table in tables}
+    with Pool(processes=args.num_procs) as pool:
+        for table, fname, res in tqdm(pool.imap_unordered(index_file, tasks, chunksize=1), total=len(tasks)):
+            res['file_ids'] = np.full(len(res['keys']), file_ids[fname], dtype=np.int32)
+            results[table].append(res)
+
+    def concat(table, array_name):
+        return np.concatenate([res[array_name] for res in results[table]] + [np.zeros(0, dtype=np.int64)])
+
+    indexed_tables = [table for table in args.tables.split(',') if table in results]
+    for table in indexed_tables:
+        arrays = {array_name: concat(table, array_name) for array_name in ['keys', 'file_ids', 'offsets']}
+        arrays['file_ids'] = arrays['file_ids'].astype(np.int32)
+        save_arrays(index_dir, f"rows_{table}", arrays, np.argsort(arrays['keys'], kind='stable'))
+        print(f"Indexed {len(arrays['keys'])} rows of {table}")
+
+    name_tables = [table for table in NAME_COLUMNS if table in results]
+    names = {
+        'hashes': np.concatenate([concat(table, 'name_hashes') for table in name_tables] + [np.zeros(0, dtype=np.int64)]),
+        'qids': np.concatenate([concat(table, 'keys') for table in name_tables] + [np.zeros(0, dtype=np.int64)]),
+    }
+    save_arrays(index_dir, 'names', names, np.lexsort((names['qids'], names['hashes'])))
+    print(f"Indexed {len(names['hashes'])} names of {name_tables}")
+
+    if REL_TABLE in results:
+        rels = {'props': concat(REL_TABLE, 'rel_props'), 'values': concat(REL_TABLE, 'rel_values'), 'qids': concat(REL_TABLE, 'keys')}
+        save_arrays(index_dir, 'rels', rels, np.lexsort((rels['qids'], rels['values'], rels['props'])))
+        print(f"Indexed {len(rels['props'])} relations")
+
+    with open(os.path.join(index_dir, INDEX_META_FILE), 'w', encoding='utf8') as out_f:
+        json.dump({'processed_dir': os.path.abspath(processed_dir), 'language_id': args.language_id, 'files': files,
+                   'tables': indexed_tables, 'name_tables': name_tables, 'rels': REL_TABLE in results}, out_f)
+    print(f"Saved index to {index_dir} in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Parallel reading of compressed (bz2/gz) Wikidata dumps
+
+A compressed dump is split into independently decompressible units:
+- bz2: every compressed block. Blocks start at arbitrary *bit* offsets, so we scan for the 48-bit block magic at every
+  bit offset and decompress a block by wrapping it into a fresh single-block stream (the same trick bzip2recover uses).
+- gz: every gzip member. Files written by a single gzip/pigz call are one member and can only be streamed serially.
+
+The unit index is computed once and cached next to the dump as <dump>.block_index.json so reruns start instantly.
+"""
+import bz2
+import mmap
+import multiprocessing
+import os
+import ujson as json
+import zlib
+
+try:
+    from utils import clean_dump_line
+except:
+    from simple_wikidata_db.utils import clean_dump_line
+
+BZ2_BLOCK_MAGIC = 0x314159265359
+BZ2_EOS_MAGIC = 0x177245385090
+GZIP_MAGIC = b'\x1f\x8b\x08'
+# a bz2 block magic can (very rarely) appear inside compressed data. Such a false boundary is merged with its neighbours.
+MAX_BLOCK_MERGES = 4
+SCAN_REGION_SIZE = 1024**3
+COMPRESSED_EXTENSIONS = {'.bz2': 'bz2', '.gz': 'gzip'}
+
+
+def get_compression(fname):
+    """ Returns 'bz2', 'gzip' or None based on the file extension """
+    return COMPRESSED_EXTENSIONS.get(os.path.splitext(fname)[1])
+
+def get_index_path(fname):
+    return f"{fname}.block_index.json"
+
+def _bit_patterns(magic):
+    """ Returns, for each bit shift, the 5 fully determined middle bytes of the 48-bit magic plus masks for the two partial edge bytes """
+    patterns = []
+    for shift in range(8):
+        window = (magic << (8 - shift)).to_bytes(7, 'big')
+        first_mask = 0xFF >> shift
+        last_mask = (0xFF << (8 - shift)) & 0xFF
+        patterns.append((shift, window[1:6], first_mask, window[0] & first_mask, last_mask, window[6] & last_mask))
+    return patterns
+
+def _scan_bz2_region(input_args):
+    """ Returns (bit offset, is_block) for every block or end-of-stream magic starting in the byte range [lo, hi) """
+    fname, lo, hi = input_args
+    found = []
+    with open(fname, 'rb') as in_f, mmap.mmap(in_f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        for magic, is_block in [(BZ2_BLOCK_MAGIC, True), (BZ2_EOS_MAGIC, False)]:
+            for shift, middle, first_mask, first_value, last_mask, last_value in _bit_patterns(magic):
+                pos = mm.find(middle, lo + 1, min(hi + 6, size))
+                while pos >= 0:
+                    last_byte = mm[pos + 5] if pos + 5 < size else 0
+                    if mm[pos - 1] & first_mask == first_value and last_byte & last_mask == last_value:
+                        found.append(((pos - 1) * 8 + shift, is_block))
+                    pos = mm.find(middle, pos + 1, min(hi + 6, size))
+    return found
+
+def _scan_gzip_region(input_args):
+    """ Returns the byte offsets in [lo, hi) where a gzip member header starts and decompresses cleanly """
+    fname, lo, hi = input_args
+    found = []
+    with open(fname, 'rb') as in_f, mmap.mmap(in_f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        pos = mm.find(GZIP_MAGIC, lo, min(hi + 2, size))
+        while pos >= 0:
+            # reserved flag bits must be zero in a real header
+            if pos + 3 < size and mm[pos + 3] & 0xE0 == 0:
+                try:
+                    zlib.decompressobj(wbits=31).decompress(mm[pos:pos + 65536])
+                    found.append(pos)
+                except zlib.error:
+                    pass
+            pos = mm.find(GZIP_MAGIC, pos + 1, min(hi + 2, size))
+    return found
+
+def build_block_index(fname, num_processes):
+    """ Scans the compressed file in parallel and returns its unit index """
+    compression = get_compression(fname)
+    size = os.path.getsize(fname)
+    regions = [(fname, lo, min(lo + SCAN_REGION_SIZE, size)) for lo in range(0, size, SCAN_REGION_SIZE)]
+    scan_func = _scan_bz2_region if compression == 'bz2' else _scan_gzip_region
+    with multiprocessing.Pool(processes=max(1, min(num_processes, len(regions)))) as pool:
+        found = [item for region in pool.map(scan_func, regions, chunksize=1) for item in region]
+    found.sort()
+    if compression == 'bz2':
+        # a block ends where the next block or end-of-stream marker begins
+        units = [[found[i][0], found[i + 1][0]] for i in range(len(found) - 1) if found[i][1]]
+    else:
+        starts = [0] + [pos for pos in found if pos > 0]
+        units = [[starts[i], starts[i + 1]] for i in range(len(starts) - 1)] + [[starts[-1], size]]
+    return {'compression': compression, 'size': size, 'units': units}
+
+def load_block_index(fname, num_processes):
+    """ Loads the cached unit index of fname, building and caching it if missing or stale """
+    index_path = get_index_path(fname)
+    size = os.path.getsize(fname)
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as in_f:
+            index = json.load(in_f)
+        if index['size'] == size:
+            print(f"Loaded {len(index['units'])} {index['compression']} units from {index_path}")
+            return index
+    print(f"Building block index for {fname}. This only happens once.")
+    index = build_block_index(fname, num_processes)
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as out_f:
+        json.dump(index, out_f)
+    os.replace(index_path + '.tmp', index_path)
+    print(f"Saved {len(index['units'])} {index['compression']} units to {index_path}")
+    return index
+
+def decompress_bz2_block(in_f, start_bit, end_bit):
+    """ Decompresses the bz2 block occupying bits [start_bit, end_bit) by wrapping it into a single-block stream """
+    start_byte, end_byte = start_bit // 8, (end_bit + 7) // 8
+    in_f.seek(start_byte)
+    value = int.from_bytes(in_f.read(end_byte - start_byte), 'big')
+    num_bits = end_bit - start_bit
+    value = (value >> (end_byte * 8 - end_bit)) & ((1 << num_bits) - 1)
+    # for a single-block stream the combined stream crc is the block crc stored right after the block magic
+    block_crc = (value >> (num_bits - 80)) & 0xFFFFFFFF
+    value = (((value << 48) | BZ2_EOS_MAGIC) << 32) | block_crc
+    num_bits += 80
+    padding = -num_bits % 8
+    return bz2.decompress(b'BZh9' + (value << padding).to_bytes((num_bits + padding) // 8, 'big'))
+
+def read_unit(in_f, index, unit_id):
+    """ Decompresses the unit at unit_id and returns (data, id of the next unit) """
+    units = index['units']
+    if index['compression'] == 'gzip':
+        start, end = units[unit_id]
+        in_f.seek(start)
+        return zlib.decompress(in_f.read(end - start), wbits=31), unit_id + 1
+    for last_id in range(unit_id, min(unit_id + MAX_BLOCK_MERGES, len(units))):
+        try:
+            return decompress_bz2_block(in_f, units[unit_id][0], units[last_id][1]), last_id + 1
+        except (OSError, EOFError, ValueError):
+            continue
+    raise ValueError(f"Could not decompress bz2 block {unit_id} starting at bit {units[unit_id][0]}")
+
+def get_unit_ranges(index, range_size):
+    """ Groups consecutive units into (range_id, start unit, end unit) ranges of roughly range_size compressed bytes """
+    units = index['units']
+    ranges = []
+    start_id = 0
+    unit_bytes = (lambda u: (u[1] - u[0]) // 8) if index['compression'] == 'bz2' else (lambda u: u[1] - u[0])
+    cur_size = 0
+    for unit_id, unit in enumerate(units):
+        cur_size += unit_bytes(unit)
+        if cur_size >= range_size:
+            ranges.append((len(ranges), start_id, unit_id + 1))
+            start_id = unit_id + 1
+            cur_size = 0
+    if start_id < len(units):
+        ranges.append((len(ranges), start_id, len(units)))
+    return ranges
+
+def compressed_range_line_generator(fname, index, start_id, end_id):
+    """ Returns generator over the dump lines owned by the units [start_id, end_id).
+    A range owns every line starting strictly after its first decompressed byte and at or before its last one
+    (the first range also owns the very first line). It therefore skips through the first newline and keeps
+    decompressing past end_id until the newline closing the last owned line is found. """
+    units = index['units']
+    carry = b''
+    skipping = start_id > 0
+    unit_id = start_id
+    with open(fname, 'rb') as in_f:
+        while unit_id < len(units):
+            past_end = unit_id >= end_id
+            try:
+                data, unit_id = read_unit(in_f, index, unit_id)
+            except ValueError:
+                if skipping:
+                    # a false block boundary: the previous range decodes these bits as part of its last block
+                    unit_id += 1
+                    continue
+                raise
+            if skipping:
+                newline = data.find(b'\n')
+                if newline < 0:
+                    continue
+                if past_end:
+                    return
+                data = data[newline + 1:]
+                skipping = False
+            if past_end:
+                newline = data.find(b'\n')
+                if newline < 0:
+                    carry += data
+                    continue
+                yield clean_dump_line((carry + data[:newline]).decode('utf-8'))
+                return
+            lines = (carry + data).split(b'\n')
+            carry = lines.pop()
+            for line in lines:
+                yield clean_dump_line(line.decode('utf-8'))
+    if len(carry) > 0:
+        yield clean_dump_line(carry.decode('utf-8'))
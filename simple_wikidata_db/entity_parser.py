@@ -0,0 +1,109 @@
+"""Lazy parsing of Wikidata dump lines
+
+triplify only needs an item's id, the labels/descriptions/aliases in the extracted languages, their {lang}wiki
+sitelinks and the claims. Fully decoding a line also builds the labels, descriptions, aliases and sitelinks of every other language,
+which for popular entities is most of the line.
+
+The dump is written as compact JSON with the top-level keys in a fixed order, so parse_entity locates the top-level
+keys with plain string searches. A key like "labels": can't appear inside a string value (the quote closing the key
+would have to be escaped), and for items none of these keys is reused at a deeper level. Only the claims and the
+entries of the chosen languages are decoded. Anything unexpected (other entity types, missing or repeated keys,
+whitespace, decoding errors) falls back to a full ujson.loads.
+"""
+import json
+import ujson
+
+# top-level keys of an item which triplify reads
+SUBTREE_KEYS = ['labels', 'descriptions', 'aliases', 'sitelinks', 'claims']
+# other top-level keys which may follow the subtrees
+OTHER_KEYS = ['lastrevid', 'modified']
+
+ITEM_PREFIX = '{"type":"item","id":"'
+
+_decoder = json.JSONDecoder()
+
+
+def _find_top_level_keys(line):
+    """ Returns {key: position of the key} for the top-level keys in line, or None if the line doesn't look as expected """
+    positions = {}
+    for key in SUBTREE_KEYS + OTHER_KEYS:
+        pattern = f'"{key}":'
+        pos = line.find(pattern)
+        if pos < 0:
+            if key in SUBTREE_KEYS:
+                return None
+            continue
+        if line.find(pattern, pos + 1) >= 0:
+            return None
+        positions[key] = pos
+    return positions
+
+def _get_entry(line, start, end, key):
+    """ Decodes the value of key inside the object line[start:end] (a top-level subtree) or returns None if it is missing """
+    pos = line.find(f'"{key}":', start, end)
+    if pos < 0:
+        return None
+    value, value_end = _decoder.raw_decode(line, pos + len(key) + 3)
+    if value_end > end:
+        raise ValueError(f"{key} runs past the end of its subtree")
+    return value
+
+def get_item_id(line):
+    """ Returns the id of a compact item line without parsing it, or None for any other line """
+    if not line.startswith(ITEM_PREFIX):
+        return None
+    end = line.find('"', len(ITEM_PREFIX))
+    if end < 0:
+        return None
+    return line[len(ITEM_PREFIX):end]
+
+def has_sitelink(line, language_ids):
+    """ Returns whether a compact item line has a {language_id}wiki sitelink for any of language_ids """
+    return any(f'"{language_id}wiki":' in line for language_id in language_ids)
+
+def lazy_parse_entity(line, language_ids):
+    """ Returns a dict with the same type, id, labels, descriptions, aliases, sitelinks and claims as ujson.loads(line)
+    for everything triplify reads (only the language_ids entries and their {language_id}wiki sitelinks are kept), or
+    None if the line has to be parsed fully. """
+    if not line.startswith('{"type":"item",'):
+        return None
+    positions = _find_top_level_keys(line)
+    if positions is None:
+        return None
+    keys = sorted(positions, key=positions.get)
+    # each value runs from its key to the comma before the next key (or the closing brace of the line)
+    spans = {}
+    for i, key in enumerate(keys):
+        start = positions[key] + len(key) + 3
+        end = positions[keys[i + 1]] - 1 if i + 1 < len(keys) else len(line) - 1
+        if line[end] not in ',}':
+            return None
+        spans[key] = (start, end)
+    try:
+        header = ujson.loads(line[:positions[keys[0]] - 1] + '}')
+        obj = {'type': header['type'], 'id': header['id']}
+        for key in ['labels', 'descriptions', 'aliases', 'sitelinks']:
+            start, end = spans[key]
+            obj[key] = {}
+            for language_id in language_ids:
+                entry_key = f'{language_id}wiki' if key == 'sitelinks' else language_id
+                entry = _get_entry(line, start, end, entry_key)
+                if entry is not None:
+                    obj[key][entry_key] = entry
+        start, end = spans['claims']
+        # raises on trailing data, so a wrong span can't be decoded silently
+        obj['claims'] = ujson.loads(line[start:end])
+    except (ValueError, KeyError):
+        return None
+    if isinstance(obj['claims'], list):
+        # empty maps are sometimes dumped as []
+        obj['claims'] = {}
+    return obj
+
+def parse_entity(line, language_ids, lazy=True):
+    """ Parses a dump line, skipping the subtrees triplify doesn't read when lazy is set """
+    if lazy:
+        obj = lazy_parse_entity(line, language_ids)
+        if obj is not None:
+            return obj
+    return ujson.loads(line)
@@ -7,6 +7,7 @@ python3.6 fetch_aliases.py --data $DATA --out_dir $OUT --qid Q30
 
     
 import argparse
+import os
 import time
 from functools import partial
 from multiprocessing import Pool
@@ -15,8 +16,10 @@ from tqdm import tqdm
 
 try:
     from utils import *
+    from query_index import WikidataIndex
 except:
     from simple_wikidata_db.utils import *
+    from simple_wikidata_db.query_index import WikidataIndex
 
 
 def get_arg_parser():
@@ -24,12 +27,14 @@ def get_arg_parser():
     parser.add_argument('--data', type = str, default = 'data/processed/aliases', help = 'path to output directory')
     parser.add_argument('--name', type = str, default='Victoria', help ='name to search for')
     parser.add_argument('--num_procs', type = int, default=10, help ='Number of processes')
+    parser.add_argument('--language_id', type = str, default = None, help = 'language to scan when the tables were written with --language_ids')
+    parser.add_argument('--index_dir', type = str, default=None, help ='answer from the index written by build_index.py instead of scanning the table')
     return parser 
 
 
 def filtering_func(target_name, filename):
     filtered = []
-    for item in jsonl_generator(filename):
+    for item in table_generator(filename):
         if item['alias'] == target_name:
             filtered.append(item)
     return filtered
@@ -38,15 +43,21 @@ def main():
     start = time.time()
     args = get_arg_parser().parse_args()
 
-    table_files = get_batch_files(args.data)
-    pool = Pool(processes = args.num_procs)
-    filtered = []
-    for output in tqdm(
-        pool.imap_unordered(
-            partial(filtering_func, args.name), table_files, chunksize=1), 
-        total=len(table_files)
-    ):
-        filtered.extend(output)
+    if args.index_dir is not None:
+        index = WikidataIndex(args.index_dir)
+        filtered = [item for qid in index.get_qids_with_name(args.name) for item in index.get_rows('aliases', qid) if item['alias'] == args.name]
+    else:
+        # data is the table directory; with --language_ids the rows of every language are in <table>/<language_id>/
+        processed_dir, table = os.path.split(os.path.normpath(args.data))
+        table_files = get_table_files(processed_dir, table, args.language_id)
+        pool = Pool(processes = args.num_procs)
+        filtered = []
+        for output in tqdm(
+            pool.imap_unordered(
+                partial(filtering_func, args.name), table_files, chunksize=1), 
+            total=len(table_files)
+        ):
+            filtered.extend(output)
     
     print(f"Extracted {len(filtered)} rows:")
     for i, item in enumerate(filtered):
@@ -9,6 +9,7 @@ python3.6 fetch_with_rel_and_value.py --data $DATA --out_dir $OUT
 
     
 import argparse
+import os
 import time
 from functools import partial
 from multiprocessing import Pool
@@ -17,8 +18,10 @@ from tqdm import tqdm
 
 try:
     from utils import *
+    from query_index import WikidataIndex
 except:
     from simple_wikidata_db.utils import *
+    from simple_wikidata_db.query_index import WikidataIndex
 
 def get_arg_parser():
     parser = argparse.ArgumentParser()
@@ -26,12 +29,14 @@ def get_arg_parser():
     parser.add_argument('--rel', type = str, default='P413', help ='relationship')
     parser.add_argument('--entity', type = str, default='Q622747', help ='entity value')
     parser.add_argument('--num_procs', type = int, default=10, help ='Number of processes')
+    parser.add_argument('--language_id', type = str, default = None, help = 'language to scan when the tables were written with --language_ids')
+    parser.add_argument('--index_dir', type = str, default=None, help ='answer from the index written by build_index.py instead of scanning the table')
     return parser 
 
 
 def filtering_func(rel, entity, filename):
     filtered = []
-    for item in jsonl_generator(filename):
+    for item in table_generator(filename):
         if item['property_id'] == rel and item['value'] == entity:
             filtered.append(item)
     return filtered
@@ -40,15 +45,22 @@ def main():
     start = time.time()
     args = get_arg_parser().parse_args()
 
-    table_files = get_batch_files(args.data)
-    pool = Pool(processes = args.num_procs)
-    filtered = []
-    for output in tqdm(
-        pool.imap_unordered(
-            partial(filtering_func, args.rel, args.entity), table_files, chunksize=1), 
-        total=len(table_files)
-    ):
-        filtered.extend(output)
+    if args.index_dir is not None:
+        index = WikidataIndex(args.index_dir)
+        filtered = [item for qid in index.get_qids_with_rel_value(args.rel, args.entity) for item in index.get_rows('entity_rels', qid)
+                    if item['property_id'] == args.rel and item['value'] == args.entity]
+    else:
+        # data is the table directory; with --language_ids the rows of every language are in <table>/<language_id>/
+        processed_dir, table = os.path.split(os.path.normpath(args.data))
+        table_files = get_table_files(processed_dir, table, args.language_id)
+        pool = Pool(processes = args.num_procs)
+        filtered = []
+        for output in tqdm(
+            pool.imap_unordered(
+                partial(filtering_func, args.rel, args.entity), table_files, chunksize=1), 
+            total=len(table_files)
+        ):
+            filtered.extend(output)
     
     print(f"Extracted {len(filtered)} rows:")
     for i, item in enumerate(filtered):
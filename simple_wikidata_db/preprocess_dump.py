@@ -12,77 +12,130 @@ python3 preprocess_dump.py \
 import argparse
 import glob
 import multiprocessing
+import multiprocessing.util
 import os
 import shutil
 import time
+import numpy as np
 import ujson
 
+from collections import defaultdict
+from itertools import islice
 from math import ceil
 from tqdm import tqdm
 
 try:
     from utils import *
+    from compressed_dump import compressed_range_line_generator, get_compression, get_unit_ranges, load_block_index
+    from entity_parser import get_item_id, has_sitelink, parse_entity
 except:
     from simple_wikidata_db.utils import *
+    from simple_wikidata_db.compressed_dump import compressed_range_line_generator, get_compression, get_unit_ranges, load_block_index
+    from simple_wikidata_db.entity_parser import get_item_id, has_sitelink, parse_entity
 
 # names of tables
-TABLE_NAMES = ['labels', 'descriptions', 'aliases', 'external_ids', 'entity_values', 'qualifiers', 'wikipedia_links', 'entity_rels']
+TABLE_NAMES = ['labels', 'descriptions', 'aliases', 'external_ids', 'entity_values', 'qualifiers', 'wikipedia_links', 'entity_rels', 'property_labels']
 
 # properties which encode some alias/name
 ALIAS_PROPERTIES = {'P138', 'P734', 'P735', 'P742', 'P1448', 'P1449', 'P1477', 'P1533', 'P1549', 'P1559', 'P1560', 'P1635', 'P1705', 'P1782', 'P1785', 'P1786', 'P1787', 'P1810', 'P1813', 'P1814',
                     'P1888', 'P1950', 'P2358', 'P2359', 'PP2365', 'P2366', 'P2521', 'P2562', 'P2976', 'PP3321', 'P4239', 'P4284', 'P4970', 'P5056', 'P5278', 'PP6978', 'P7383'}
 
+# name of the folder in out_dir holding the manifest of committed batches/byte ranges
+MANIFEST_DIR = 'manifest'
+# arguments which determine the batch/byte range ids -- a run can only be resumed with the same values
+RESUME_ARGS = ['input_file', 'parallel_read', 'batch_size', 'range_size_mb', 'language_ids', 'language_subdirs', 'output_format', 'num_buckets',
+               'keep_sitelinked', 'keep_qids', 'keep_one_hop']
+# sorted encoded QIDs kept in addition to sitelinked items (the --keep_qids file plus the one-hop expansion)
+ALLOWLIST_FILE = 'allowlist.npy'
+# tables whose rows depend on the language. With --language_ids these get a subdirectory per language.
+LANGUAGE_TABLE_NAMES = ['labels', 'descriptions', 'aliases', 'wikipedia_links', 'entity_values', 'qualifiers', 'property_labels']
+
 # data types in wikidata dump which we ignore
 IGNORE = set(['wikibase-lexeme', 'musical-notation', 'globe-coordinate', 'commonsMedia', 'geo-shape', 'wikibase-sense', 'wikibase-property', 'math', 'tabular-data'])
 
 def get_arg_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input_file', type = str, required = True, help = 'path to raw wikidata json dump')
+    parser.add_argument('--input_file', type = str, required = True, help = 'path to raw wikidata json dump (optionally .bz2 or .gz compressed)')
     parser.add_argument('--out_dir', type = str, required = True , help = 'path to output directory')
     parser.add_argument('--language_id', type = str, default = 'en', help = 'language identifier')
+    parser.add_argument('--language_ids', type = str, default = None, help = 'comma separated language identifiers (e.g. en,he,zh) to extract in a single pass. Overrides language_id.')
     parser.add_argument('--total_lines', type = int, default = 77117245, help = 'number of lines in wikidata dump file -- userful to tracking progress.')
     parser.add_argument('--num_processes', type = int, default = 90, help = "number of concurrent processes to spin off. ")
     parser.add_argument('--batch_size', type = int, default = 10000)
     parser.add_argument('--test', action='store_true', help = 'Test run that terminates after 1 batch is processed. Useful for debugging.')
+    parser.add_argument('--parallel_read', action='store_true', help = 'Split the dump into byte ranges and have each worker read and parse its own range instead of receiving lines from the parent.')
+    parser.add_argument('--max_file_mb', type = int, default = 256, help = 'Each worker rolls over to new table files once one of its files reaches this size (in MB).')
+    parser.add_argument('--output_format', type = str, default = 'jsonl', choices = ['jsonl', 'columnar'], help = 'Write tables as jsonl or as typed columnar files with integer encoded QIDs/PIDs.')
+    parser.add_argument('--write_buffer_mb', type = int, default = 8, help = 'Write buffer size (in MB) of every open table file.')
+    parser.add_argument('--range_size_mb', type = int, default = 256, help = 'Size of each byte range (in MB) when running with --parallel_read. For compressed dumps this is measured in compressed bytes.')
+    parser.add_argument('--lazy_parse', action='store_true', help = 'Only decode the claims and the language_id entries of each entity instead of the full JSON line. Unusual lines fall back to a full parse.')
+    parser.add_argument('--keep_sitelinked', action='store_true', help = 'Only keep items with a {language_id}wiki sitelink (for any of the languages). Can be combined with keep_qids.')
+    parser.add_argument('--keep_qids', type = str, default = None, help = 'Only keep the items in this file (json list/dict of QIDs or one QID per line). Can be combined with keep_sitelinked.')
+    parser.add_argument('--keep_one_hop', action='store_true', help = 'Also keep the items that kept items point to in entity_rels. Needs an extra scan of the dump.')
+    parser.add_argument('--num_buckets', type = int, default = 0, help = 'If > 0, hash-partition every table by QID into this many buckets (one file per bucket per worker part).')
+    parser.add_argument('--resume', action='store_true', help = 'Resume an interrupted run in out_dir: skip batches/byte ranges listed in its manifest and discard partially written files.')
+    parser.add_argument('--checkpoint_mins', type = float, default = 15, help = 'Workers commit their open table files to the manifest at least this often (in minutes).')
     return parser 
 
 def process_mainsnak(data, args):
-    
+    """ Returns (value, language) of a snak. language is set for monolingual text and None for language neutral values. """
     datatype = data['datatype']
     if datatype == 'string':
-        return data['datavalue']['value']
+        return data['datavalue']['value'], None
     elif datatype == 'monolingualtext':
-        if data['datavalue']['value']['language'] == args.language_id:
-            return data['datavalue']['value']['text']
+        if data['datavalue']['value']['language'] in args.language_ids:
+            return data['datavalue']['value']['text'], data['datavalue']['value']['language']
     elif datatype == 'quantity':
-        return data['datavalue']['value']['amount']
+        return data['datavalue']['value']['amount'], None
     elif datatype == 'time':
-        return data['datavalue']['value']['time']
+        return data['datavalue']['value']['time'], None
     elif datatype == 'wikibase-item':
-        return data['datavalue']['value']['id']
+        return data['datavalue']['value']['id'], None
     elif datatype == 'external-id':
-        return data['datavalue']['value']
+        return data['datavalue']['value'], None
     elif datatype == 'url':
-        return data['datavalue']['value']
+        return data['datavalue']['value'], None
     
     # we ignore all other triples
     elif datatype in IGNORE:
-        return None 
+        return None, None
     else:
-        append_to_jsonl_file([data], os.path.join(args.out_dir, "errors", f"errors{multiprocessing.current_process().pid}.jsonl"))
+        writer_global.write("errors", [data])
     
-    return None
+    return None, None
 
-def process_batch(input_args):
-    batch_id, list_lines = input_args
+def is_allowed(entity_id, sitelinked):
+    """ Returns whether an item passes the allowlist """
+    if args_global.keep_sitelinked and sitelinked:
+        return True
+    return allowlist_global is not None and sorted_array_contains(allowlist_global, encode_entity_id(entity_id))
+
+def is_allowed_line(line):
+    """ Checks the allowlist on a dump line. Returns None if the line has to be parsed first. """
+    entity_id = get_item_id(line)
+    if entity_id is None:
+        return None
+    return is_allowed(entity_id, has_sitelink(line, args_global.language_ids))
+
+def is_allowed_entity(obj):
+    if obj['type'] != 'item':
+        return True
+    return is_allowed(obj['id'], any(f'{language_id}wiki' in obj['sitelinks'] for language_id in args_global.language_ids))
+
+def process_lines(list_lines):
     all_triples = {}
     total_lines = 0
     for line in list_lines:
         try:
             if len(line) == 0:
                 continue
-            obj = ujson.loads(line)
             total_lines += 1
+            # drop items which are not in the allowlist before parsing them
+            if args_global.filter_entities and is_allowed_line(line) is False:
+                continue
+            obj = parse_entity(line, args_global.language_ids, lazy=args_global.lazy_parse)
+            if args_global.filter_entities and not is_allowed_entity(obj):
+                continue
             triples = triplify(obj, args_global)
             for k in triples:
                 if k not in all_triples:
@@ -91,53 +144,134 @@ def process_batch(input_args):
         except Exception as e:
             print("Error", e)
             continue
-    batch_write_data(all_triples, batch_id, args_global)
+    for table, rows in all_triples.items():
+        writer_global.write(table, rows)
     return total_lines
 
+def process_batch(input_args):
+    batch_id, list_lines = input_args
+    writer_global.start_task()
+    try:
+        total_lines = process_lines(list_lines)
+    except BaseException:
+        # the worker lives on, so the rows of the failed batch must not be committed with the next one
+        writer_global.abort_task()
+        raise
+    writer_global.finish_task(batch_id)
+    return total_lines
+
+def get_range_lines(start, end):
+    if block_index_global is not None:
+        # start and end are unit ids of the compressed dump
+        return compressed_range_line_generator(args_global.input_file, block_index_global, start, end)
+    return byte_range_line_generator(args_global.input_file, start, end)
+
+def process_byte_range(input_args):
+    range_id, start, end = input_args
+    total_lines = 0
+    writer_global.start_task()
+    try:
+        lines = get_range_lines(start, end)
+        for _, list_lines in batch_generator(lines, args_global.batch_size):
+            total_lines += process_lines(list_lines)
+    except BaseException:
+        # the worker lives on, so the rows of the failed range must not be committed with the next one
+        writer_global.abort_task()
+        raise
+    writer_global.finish_task(range_id)
+    return total_lines
+
+def collect_relation_targets(input_args):
+    """ Returns the sorted encoded ids of all items which the allowed items of a batch/byte range point to """
+    if args_global.parallel_read:
+        _, start, end = input_args
+        lines = get_range_lines(start, end)
+    else:
+        _, lines = input_args
+    targets = []
+    for line in lines:
+        try:
+            if len(line) == 0 or is_allowed_line(line) is False:
+                continue
+            obj = parse_entity(line, args_global.language_ids, lazy=True)
+            if obj['type'] != 'item' or not is_allowed_entity(obj):
+                continue
+            for claims in obj['claims'].values():
+                for claim in claims:
+                    mainsnak = claim['mainsnak']
+                    if mainsnak['snaktype'] == 'value' and mainsnak['datatype'] == 'wikibase-item':
+                        targets.append(encode_entity_id(mainsnak['datavalue']['value']['id']))
+        except Exception as e:
+            print("Error", e)
+            continue
+    return np.unique(np.array(targets, dtype=np.int64))
+
+def get_language_table(table, language_id, args):
+    """ Returns the table rows of language_id are written to. With --language_ids these are <table>/<language_id>. """
+    if args.language_subdirs:
+        return f"{table}/{language_id}"
+    return table
+
 def triplify(obj, args):
-    out_data = {name: [] for name in TABLE_NAMES}
-    # skip properties
-    if obj['type'] == 'property':
-        return {}
+    out_data = defaultdict(list)
     id = obj['id'] # The canonical ID of the entity.
-    # extract labels 
-    label = ""
-    if args.language_id in obj['labels']:
-        label =  obj['labels'][args.language_id]['value']
-        out_data['labels'].append({
-            'qid': id,
-            'label': label
-        })
-        out_data['aliases'].append({
-            'qid': id,
-            'alias': label
-        })
-    
-    # extract description 
-    description = ""
-    if args.language_id in obj['descriptions']:
-        description = obj['descriptions'][args.language_id]['value']
-        out_data['descriptions'].append({
-            'qid': id,
-            'description': description,
-        })
-    
-    # extract aliases 
-    if args.language_id in obj['aliases']:
-        for alias in obj['aliases'][args.language_id]:
-            out_data['aliases'].append({
+    # properties only contribute their names
+    if obj['type'] == 'property':
+        for language_id in args.language_ids:
+            property_table = get_language_table('property_labels', language_id, args)
+            if language_id in obj['labels']:
+                out_data[property_table].append({
+                    'qid': id,
+                    'name': obj['labels'][language_id]['value'],
+                    'name_type': 'label'
+                })
+            if language_id in obj['aliases']:
+                for alias in obj['aliases'][language_id]:
+                    out_data[property_table].append({
+                        'qid': id,
+                        'name': alias['value'],
+                        'name_type': 'alias'
+                    })
+        return out_data
+    for language_id in args.language_ids:
+        # extract labels 
+        label = ""
+        if language_id in obj['labels']:
+            label =  obj['labels'][language_id]['value']
+            out_data[get_language_table('labels', language_id, args)].append({
                 'qid': id,
-                'alias': alias['value'],
+                'label': label
+            })
+            out_data[get_language_table('aliases', language_id, args)].append({
+                'qid': id,
+                'alias': label
+            })
+        
+        # extract description 
+        description = ""
+        if language_id in obj['descriptions']:
+            description = obj['descriptions'][language_id]['value']
+            out_data[get_language_table('descriptions', language_id, args)].append({
+                'qid': id,
+                'description': description,
+            })
+        
+        # extract aliases 
+        if language_id in obj['aliases']:
+            for alias in obj['aliases'][language_id]:
+                out_data[get_language_table('aliases', language_id, args)].append({
+                    'qid': id,
+                    'alias': alias['value'],
+                })
+                
+        # extract wikipedia sitelink -- we just add this to the external links table 
+        sitelink = ""
+        if f'{language_id}wiki' in obj['sitelinks']:
+            sitelink = obj['sitelinks'][f'{language_id}wiki']['title']
+            out_data[get_language_table('wikipedia_links', language_id, args)].append({
+                'qid': id, 
+                'wiki_title': sitelink
             })
-            
-    # extract english wikipedia sitelink -- we just add this to the external links table 
-    sitelink = ""
-    if f'{args.language_id}wiki' in obj['sitelinks']:
-        sitelink = obj['sitelinks'][f'{args.language_id}wiki']['title']
-        out_data['wikipedia_links'].append({
-            'qid': id, 
-            'wiki_title': sitelink
-        })
          
     # extract claims and qualifiers
     for property_id in obj['claims']:
@@ -146,7 +280,7 @@ def triplify(obj, args):
                 continue
             claim_id = claim['id']
             datatype = claim['mainsnak']['datatype']
-            value = process_mainsnak(claim['mainsnak'], args)
+            value, claim_language = process_mainsnak(claim['mainsnak'], args)
 
             if value is None: 
                 continue 
@@ -166,17 +300,21 @@ def triplify(obj, args):
                     'value': value
                 }) 
             else: 
-                out_data['entity_values'].append({
+                # monolingual text goes to the table of its language
+                values_table = 'entity_values' if claim_language is None else get_language_table('entity_values', claim_language, args)
+                out_data[values_table].append({
                     'claim_id': claim_id,
                     'qid': id, 
                     'property_id': property_id,
                     'value': value
                 })
                 if property_id in ALIAS_PROPERTIES: 
-                    out_data['aliases'].append({
-                        'qid': id,
-                        'alias': value,
-                    })
+                    # language neutral values are aliases in every language
+                    for alias_language in (args.language_ids if claim_language is None else [claim_language]):
+                        out_data[get_language_table('aliases', alias_language, args)].append({
+                            'qid': id,
+                            'alias': value,
+                        })
             
             # get qualifiers 
             if 'qualifiers' in claim:
@@ -185,10 +323,15 @@ def triplify(obj, args):
                         if not qualifier['snaktype'] == 'value':
                             continue
                         qualifier_id = qualifier['hash']
-                        value = process_mainsnak(qualifier, args)
+                        value, value_language = process_mainsnak(qualifier, args)
                         if value is None: 
                             continue 
-                        out_data['qualifiers'].append({
+                        # qualifiers of a monolingual claim belong to the claim's language
+                        if claim_language is not None and value_language is not None and value_language != claim_language:
+                            continue
+                        qualifier_language = claim_language if claim_language is not None else value_language
+                        qualifiers_table = 'qualifiers' if qualifier_language is None else get_language_table('qualifiers', qualifier_language, args)
+                        out_data[qualifiers_table].append({
                             'qualifier_id': qualifier_id,
                             'claim_id': claim_id,
                             'property_id': qualifier_property,
@@ -197,38 +340,25 @@ def triplify(obj, args):
             
     return out_data 
 
-def write_data(triples, line_counts, batch_counts, args):
-    tables = triples.keys()
-    for table in tables:
-        # reached batch size limit, reset line count and increment batch number
-        if line_counts[table] >= args.batch_size:
-            line_counts[table] = 0
-            batch_counts[table] += 1
-
-        batch = batch_counts[table]
-        out_file = f"{args.out_dir}/{table}/{batch}.jsonl"
-        append_to_jsonl_file(triples[table], out_file)
-        line_counts[table] += len(triples[table])
-
-def batch_write_data(triples, batch_id, args):
-    tables = triples.keys()
-    for table in tables:
-        out_file = f"{args.out_dir}/{table}/{batch_id}.jsonl"
-        append_to_jsonl_file(triples[table], out_file)
-
-def init_func(args):
+def init_func(args, block_index, run_id, allowlist_file):
     global args_global
+    global block_index_global
+    global allowlist_global
+    global writer_global
     args_global = args
+    block_index_global = block_index
+    # the allowlist is memory mapped so the workers share one copy through the page cache
+    allowlist_global = np.load(allowlist_file, mmap_mode='r') if allowlist_file is not None else None
+    # file names include the run id so a resumed run never reuses the name of a committed file from a recycled pid
+    writer_global = TableWriter(args.out_dir, prefix=f"{run_id}_{os.getpid()}", max_file_bytes=args.max_file_mb * 1024 * 1024,
+                                buffer_size=args.write_buffer_mb * 1024 * 1024, output_format=args.output_format,
+                                manifest_dir=os.path.join(args.out_dir, MANIFEST_DIR), checkpoint_secs=args.checkpoint_mins * 60,
+                                num_buckets=args.num_buckets)
+    # flush and close the open table files when the worker exits on pool.close()/join()
+    multiprocessing.util.Finalize(writer_global, writer_global.close, exitpriority=10)
 
-def main():
-    start = time.time()
-    args = get_arg_parser().parse_args()
-    print(f"ARGS: {args}")
-
-    # check that output file exists -- create it if it doesn't
-    if not os.path.exists(args.out_dir):
-        os.makedirs(args.out_dir)
-    
+def setup_output_dirs(args, manifest_dir):
+    """ Creates empty table, errors and manifest folders in out_dir, removing the output of any previous run """
     # make a folder for each table
     for table in TABLE_NAMES:
         table_dir = os.path.join(args.out_dir, table)
@@ -237,6 +367,9 @@ def main():
         else: 
             shutil.rmtree(table_dir)
             os.makedirs(table_dir)
+        if args.language_subdirs and table in LANGUAGE_TABLE_NAMES:
+            for language_id in args.language_ids:
+                os.makedirs(os.path.join(table_dir, language_id))
     
     # make a folder for errors 
     errors_dir = os.path.join(args.out_dir, "errors")
@@ -251,22 +384,141 @@ def main():
         if os.path.exists(file):
             os.remove(file)
 
-    dump_iterator = batch_line_generator(args.input_file, args.batch_size)
+    # start a fresh manifest
+    if os.path.exists(manifest_dir):
+        shutil.rmtree(manifest_dir)
+    os.makedirs(manifest_dir)
+    write_json_atomic(os.path.join(manifest_dir, 'config.json'), {arg: getattr(args, arg) for arg in RESUME_ARGS})
+
+def resume_output_dirs(args, manifest_dir):
+    """ Checks that out_dir was written with the same task ids and removes every table file not committed to its manifest.
+    Returns the set of finished batch/byte range ids. """
+    config_file = os.path.join(manifest_dir, 'config.json')
+    assert os.path.exists(config_file), f"Can't resume: {config_file} does not exist"
+    with open(config_file, 'r', encoding='utf8') as in_f:
+        config = ujson.load(in_f)
+    for arg in RESUME_ARGS:
+        assert config[arg] == getattr(args, arg), f"Can't resume: {arg} was {config[arg]} but is now {getattr(args, arg)}"
+    finished_tasks, committed_files = load_manifest(manifest_dir)
+    num_removed = 0
+    for table in TABLE_NAMES + ['errors']:
+        os.makedirs(os.path.join(args.out_dir, table), exist_ok=True)
+        if args.language_subdirs and table in LANGUAGE_TABLE_NAMES:
+            for language_id in args.language_ids:
+                os.makedirs(os.path.join(args.out_dir, table, language_id), exist_ok=True)
+        for dirpath, _, fnames in os.walk(os.path.join(args.out_dir, table)):
+            for fname in fnames:
+                if os.path.relpath(os.path.join(dirpath, fname), args.out_dir) not in committed_files:
+                    os.remove(os.path.join(dirpath, fname))
+                    num_removed += 1
+    for fname in glob.glob(os.path.join(manifest_dir, '*.tmp')):
+        os.remove(fname)
+    print(f"Resuming with {len(finished_tasks)} finished tasks. Removed {num_removed} partially written files.")
+    return finished_tasks
+
+def get_tasks(args, block_index, finished_tasks):
+    """ Returns the function processing a batch/byte range, an iterator over the unfinished tasks and the number of tasks """
+    if args.parallel_read:
+        # the parent only hands out byte offsets; workers seek, read and parse their own range
+        if block_index is not None:
+            byte_ranges = get_unit_ranges(block_index, args.range_size_mb * 1024 * 1024)
+        else:
+            byte_ranges = get_byte_ranges(args.input_file, args.range_size_mb * 1024 * 1024)
+        print(f"Split {args.input_file} into {len(byte_ranges)} byte ranges")
+        dump_iterator = [r for r in byte_ranges if r[0] not in finished_tasks]
+        return process_byte_range, dump_iterator, len(dump_iterator)
+    # finished batches still have to be read to keep the batch ids aligned, but are not parsed again
+    dump_iterator = (batch for batch in batch_line_generator(args.input_file, args.batch_size) if batch[0] not in finished_tasks)
+    return process_batch, dump_iterator, max(0, int(ceil(args.total_lines/args.batch_size)) - len(finished_tasks))
+
+def save_allowlist(allowlist, allowlist_file):
+    tmp_file = allowlist_file[:-len('.npy')] + '.tmp.npy'
+    np.save(tmp_file, allowlist)
+    os.replace(tmp_file, allowlist_file)
+
+def build_allowlist(args, block_index, allowlist_file, run_id):
+    """ Saves the sorted encoded QIDs to keep besides sitelinked items: the keep_qids file and, with keep_one_hop,
+    every item an allowed item points to. The one-hop expansion is an extra scan of the dump. """
+    allowlist = np.zeros(0, dtype=np.int64)
+    if args.keep_qids is not None:
+        allowlist = load_qid_file(args.keep_qids)
+        print(f"Loaded {len(allowlist)} QIDs to keep from {args.keep_qids}")
+    save_allowlist(allowlist, allowlist_file)
+    if not args.keep_one_hop:
+        return
+    _, dump_iterator, total_tasks = get_tasks(args, block_index, set())
+    if args.test:
+        dump_iterator = islice(dump_iterator, 1)
+        total_tasks = 1
+    targets = [allowlist]
+    with multiprocessing.Pool(processes=args.num_processes, initializer=init_func, initargs=[args, block_index, run_id, allowlist_file]) as pool:
+        for task_targets in tqdm(pool.imap_unordered(collect_relation_targets, dump_iterator, chunksize=1), total=total_tasks, desc="Expanding allowlist"):
+            targets.append(task_targets)
+    allowlist = np.unique(np.concatenate(targets))
+    print(f"Keeping {len(allowlist)} QIDs after the one-hop expansion")
+    save_allowlist(allowlist, allowlist_file)
+
+def main():
+    start = time.time()
+    args = get_arg_parser().parse_args()
+    # with --language_ids, language dependent rows are written to <table>/<language_id>/
+    args.language_subdirs = args.language_ids is not None
+    args.language_ids = args.language_ids.split(',') if args.language_subdirs else [args.language_id]
+    args.filter_entities = args.keep_sitelinked or args.keep_qids is not None
+    assert args.filter_entities or not args.keep_one_hop, "--keep_one_hop expands --keep_sitelinked and/or --keep_qids"
+    print(f"ARGS: {args}")
+
+    # check that output file exists -- create it if it doesn't
+    if not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+
+    block_index = None
+    if args.parallel_read and get_compression(args.input_file) is not None:
+        block_index = load_block_index(args.input_file, args.num_processes)
+        if len(block_index['units']) <= 1:
+            print(f"{args.input_file} is a single compressed member and can't be split. Decompressing it serially in the parent instead.")
+            block_index = None
+            args.parallel_read = False
+
+    manifest_dir = os.path.join(args.out_dir, MANIFEST_DIR)
+    if args.resume:
+        finished_tasks = resume_output_dirs(args, manifest_dir)
+    else:
+        finished_tasks = set()
+        setup_output_dirs(args, manifest_dir)
+
+    allowlist_file = None
+    if args.filter_entities:
+        allowlist_file = os.path.join(args.out_dir, ALLOWLIST_FILE)
+        if args.resume and os.path.exists(allowlist_file):
+            print(f"Reusing the allowlist in {allowlist_file}")
+        else:
+            build_allowlist(args, block_index, allowlist_file, int(start))
+
+    process_func, dump_iterator, total_tasks = get_tasks(args, block_index, finished_tasks)
     total_lines = 0
 
     pool = multiprocessing.Pool(processes=args.num_processes,
                                 initializer=init_func,
                                 initargs=[
-                                    args
+                                    args,
+                                    block_index,
+                                    int(start),
+                                    allowlist_file
                                 ])
 
-    for line_cnt in tqdm(pool.imap_unordered(process_batch, dump_iterator, chunksize=1), total=int(ceil(args.total_lines/args.batch_size))):
+    if args.test:
+        dump_iterator = islice(dump_iterator, 1)
+        total_tasks = 1
+
+    for line_cnt in tqdm(pool.imap_unordered(process_func, dump_iterator, chunksize=1), total=total_tasks):
         total_lines += line_cnt
-        if args.test:
-            break
+    # workers close their table files and commit them to the manifest on exit
+    pool.close()
+    pool.join()
 
     print(f"Finished processing {total_lines} in {time.time()-start}s")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
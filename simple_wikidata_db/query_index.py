@@ -0,0 +1,127 @@
+""" Answers lookups over processed_batches from the index written by build_index.py
+
+Every lookup is a binary search over memory mapped arrays, followed by reading only the matching rows.
+
+Example commands:
+
+python3 query_index.py --index_dir $DIR_TO_SAVE_DATA_TO/index --name Victoria
+python3 query_index.py --index_dir $DIR_TO_SAVE_DATA_TO/index --rel P413 --entity Q622747
+python3 query_index.py --index_dir $DIR_TO_SAVE_DATA_TO/index --qid Q30 --tables labels,entity_rels
+
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import ujson as json
+
+try:
+    from utils import *
+    from build_index import INDEX_META_FILE, NAME_COLUMNS, get_index_path, hash_names
+except:
+    from simple_wikidata_db.utils import *
+    from simple_wikidata_db.build_index import INDEX_META_FILE, NAME_COLUMNS, get_index_path, hash_names
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--index_dir', type = str, required = True, help = 'path to the index written by build_index.py')
+    parser.add_argument('--name', type = str, default = None, help = 'fetch the QIDs with this label or alias')
+    parser.add_argument('--rel', type = str, default = None, help = 'fetch the QIDs with this relationship to --entity')
+    parser.add_argument('--entity', type = str, default = None, help = 'entity value of --rel')
+    parser.add_argument('--qid', type = str, default = None, help = 'fetch the rows of this QID')
+    parser.add_argument('--tables', type = str, default = None, help = 'comma separated tables to fetch --qid rows from (defaults to all indexed tables)')
+    return parser
+
+
+class WikidataIndex:
+    """ Memory maps the arrays of an index directory and answers name, relation and QID lookups """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, INDEX_META_FILE), 'r', encoding='utf8') as in_f:
+            self.meta = json.load(in_f)
+        self.processed_dir = self.meta['processed_dir']
+        self.files = self.meta['files']
+        self.arrays = {}
+        self.columnar_files = {}
+
+    def get_array(self, name, array):
+        if (name, array) not in self.arrays:
+            self.arrays[(name, array)] = np.load(get_index_path(self.index_dir, name, array), mmap_mode='r')
+        return self.arrays[(name, array)]
+
+    def get_qids_with_name(self, name):
+        """ Returns the QIDs which have name as a label or alias """
+        hashes = self.get_array('names', 'hashes')
+        name_hash = hash_names([name])[0]
+        st, end = np.searchsorted(hashes, name_hash, side='left'), np.searchsorted(hashes, name_hash, side='right')
+        # a QID with the name as both label and alias appears twice
+        return decode_entity_ids(np.unique(self.get_array('names', 'qids')[st:end]))
+
+    def get_qids_with_rel_value(self, property_id, value):
+        """ Returns the QIDs with an entity_rels statement property_id -> value """
+        assert self.meta['rels'], f"entity_rels was not indexed in {self.index_dir}"
+        props = self.get_array('rels', 'props')
+        prop_code = encode_entity_id(property_id)
+        st, end = np.searchsorted(props, prop_code, side='left'), np.searchsorted(props, prop_code, side='right')
+        values = self.get_array('rels', 'values')[st:end]
+        value_code = encode_entity_id(value)
+        value_st, value_end = np.searchsorted(values, value_code, side='left'), np.searchsorted(values, value_code, side='right')
+        return decode_entity_ids(np.unique(self.get_array('rels', 'qids')[st + value_st:st + value_end]))
+
+    def read_row(self, file_id, offset):
+        fname = os.path.join(self.processed_dir, self.files[file_id])
+        if fname.endswith(f".{COLUMNAR_ENDING}"):
+            if fname not in self.columnar_files:
+                self.columnar_files[fname] = read_columnar_file(fname)
+            columns = self.columnar_files[fname]
+            return {name: decode_entity_id(int(col[offset])) if isinstance(col, np.ndarray) else col[offset]
+                    for name, col in columns.items()}
+        with open(fname, 'rb') as in_f:
+            in_f.seek(offset)
+            return json.loads(in_f.readline())
+
+    def get_rows(self, table, qid):
+        """ Returns the rows of table belonging to qid (for qualifiers, the qualifiers of qid's claims) """
+        assert table in self.meta['tables'], f"{table} was not indexed in {self.index_dir}"
+        keys = self.get_array(f"rows_{table}", 'keys')
+        code = encode_entity_id(qid)
+        st, end = np.searchsorted(keys, code, side='left'), np.searchsorted(keys, code, side='right')
+        file_ids = self.get_array(f"rows_{table}", 'file_ids')[st:end].tolist()
+        offsets = self.get_array(f"rows_{table}", 'offsets')[st:end].tolist()
+        return [self.read_row(file_id, offset) for file_id, offset in zip(file_ids, offsets)]
+
+    def get_name_rows(self, name):
+        """ Returns the label and alias rows equal to name """
+        rows = []
+        for qid in self.get_qids_with_name(name):
+            for table in self.meta['name_tables']:
+                if table in self.meta['tables']:
+                    rows.extend(row for row in self.get_rows(table, qid) if row[NAME_COLUMNS[table]] == name)
+        return rows
+
+
+def main():
+    args = get_arg_parser().parse_args()
+    index = WikidataIndex(args.index_dir)
+    start = time.time()
+    if args.name is not None:
+        qids = index.get_qids_with_name(args.name)
+        print(f"QIDs with name {args.name}: {qids}")
+    if args.rel is not None:
+        qids = index.get_qids_with_rel_value(args.rel, args.entity)
+        print(f"QIDs with {args.rel} {args.entity}: {qids}")
+    if args.qid is not None:
+        tables = args.tables.split(',') if args.tables is not None else index.meta['tables']
+        for table in tables:
+            rows = index.get_rows(table, args.qid)
+            print(f"{table}: {len(rows)} rows")
+            for row in rows:
+                print(f"    {row}")
+    print(f"Answered in {(time.time() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
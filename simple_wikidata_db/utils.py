@@ -1,10 +1,43 @@
 """Assortment of useful utility functions 
 """
 
+import bz2
+import gzip
+import io
+import mmap
 import os
+import struct
+import time
+import zlib
+from array import array
 import ujson as json
 import multiprocessing as mp
 
+import numpy as np
+
+# columns of every processed table; 'id' columns hold integer encoded QIDs/PIDs and 'str' columns live in the string heap
+TABLE_COLUMNS = {
+    'labels': [('qid', 'id'), ('label', 'str')],
+    'descriptions': [('qid', 'id'), ('description', 'str')],
+    'aliases': [('qid', 'id'), ('alias', 'str')],
+    'wikipedia_links': [('qid', 'id'), ('wiki_title', 'str')],
+    'entity_rels': [('claim_id', 'str'), ('qid', 'id'), ('property_id', 'id'), ('value', 'id')],
+    'external_ids': [('claim_id', 'str'), ('qid', 'id'), ('property_id', 'id'), ('value', 'str')],
+    'entity_values': [('claim_id', 'str'), ('qid', 'id'), ('property_id', 'id'), ('value', 'str')],
+    'qualifiers': [('qualifier_id', 'str'), ('claim_id', 'str'), ('property_id', 'id'), ('value', 'str')],
+    'property_labels': [('qid', 'id'), ('name', 'str'), ('name_type', 'str')],
+}
+# column each table is hash-partitioned by when writing with num_buckets > 0. Qualifiers are partitioned by the
+# QID their claim id starts with, so every table keeps an entity's rows in the same bucket.
+BUCKET_KEYS = {table: 'qid' for table in TABLE_COLUMNS}
+BUCKET_KEYS['qualifiers'] = 'claim_id'
+BUCKET_FILE_PREFIX = 'bucket'
+COLUMNAR_ENDING = 'cols'
+COLUMNAR_MAGIC = b'SWDBCOL1'
+# the id prefix is stored in the two low bits of the integer id
+ENTITY_ID_PREFIXES = ['Q', 'P', 'L']
+ENTITY_ID_PREFIX_CODES = {prefix: code for code, prefix in enumerate(ENTITY_ID_PREFIXES)}
+
 def jsonl_generator(fname):
     """ Returns generator for jsonl file """
     for line in open(fname, 'r', encoding="utf-8"):
@@ -17,25 +50,80 @@ def jsonl_generator(fname):
             d= json.loads(line)
         yield d
 
-def batch_line_generator(fname, batch_size):
-    """ Returns generator for jsonl file with batched lines """
+def table_generator(fname, property_ids=None):
+    """ Returns generator over the rows of a table file in either jsonl or columnar format.
+    If property_ids is given, only rows with one of these property ids are returned. """
+    if fname.endswith(f".{COLUMNAR_ENDING}"):
+        return columnar_generator(fname, property_ids)
+    if property_ids is None:
+        return jsonl_generator(fname)
+    return (row for row in jsonl_generator(fname) if row['property_id'] in property_ids)
+
+def clean_dump_line(line):
+    """ Strips whitespace and the trailing comma from a line of the json dump """
+    line = line.strip()
+    if len(line) < 3:
+        return ''
+    elif line[len(line) - 1] == ',':
+        return line[:len(line) - 1]
+    return line
+
+def batch_generator(lines, batch_size):
+    """ Groups an iterator of lines into (batch_id, lines) batches """
     res = []
     batch_id = 0
-    for line in open(fname, 'r', encoding="utf-8"):
-        line = line.strip()
-        if len(line) < 3:
-            d = ''
-        elif line[len(line) - 1] == ',':
-            d = line[:len(line) - 1]
-        else:
-            d = line
-        res.append(d)
+    for line in lines:
+        res.append(line)
         if len(res) >= batch_size:
             yield batch_id, res
             batch_id += 1
             res = []
     yield batch_id, res
 
+def open_dump_file(fname):
+    """ Opens the dump for reading text, decompressing bz2/gz files on the fly """
+    if fname.endswith('.bz2'):
+        return bz2.open(fname, 'rt', encoding="utf-8")
+    if fname.endswith('.gz'):
+        return gzip.open(fname, 'rt', encoding="utf-8")
+    return open(fname, 'r', encoding="utf-8")
+
+def batch_line_generator(fname, batch_size):
+    """ Returns generator for jsonl file with batched lines """
+    lines = (clean_dump_line(line) for line in open_dump_file(fname))
+    return batch_generator(lines, batch_size)
+
+def get_byte_ranges(fname, range_size):
+    """ Splits fname into (range_id, start, end) byte ranges of roughly range_size bytes.
+    Every boundary is moved forward to the start of the next line so no line is split across ranges. """
+    file_size = os.path.getsize(fname)
+    num_ranges = max(1, -(-file_size // range_size))
+    boundaries = [0]
+    with open(fname, 'rb') as in_f:
+        for i in range(1, num_ranges):
+            offset = max(boundaries[-1], i * range_size)
+            if offset >= file_size:
+                break
+            # readline from the byte before the offset so a boundary already on a line start is kept
+            in_f.seek(offset - 1)
+            in_f.readline()
+            boundaries.append(min(in_f.tell(), file_size))
+    boundaries.append(file_size)
+    starts_ends = [(st, end) for st, end in zip(boundaries[:-1], boundaries[1:]) if st < end]
+    return [(range_id, st, end) for range_id, (st, end) in enumerate(starts_ends)]
+
+def byte_range_line_generator(fname, start, end):
+    """ Returns generator over the lines of fname that start inside the byte range [start, end) """
+    with open(fname, 'rb') as in_f:
+        in_f.seek(start)
+        pos = start
+        while pos < end:
+            line = in_f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield clean_dump_line(line.decode('utf-8'))
+
 def append_to_jsonl_file(data, file):
     """ Appends json dictionary as new line to file """
     with open(file, 'a+', encoding='utf8') as out_file:
@@ -43,6 +131,359 @@ def append_to_jsonl_file(data, file):
             out_file.write(json.dumps(x, ensure_ascii=False)+"\n")
 
 
+def encode_entity_id(entity_id):
+    """ Encodes an id like Q42 or P31 as a single integer """
+    return (int(entity_id[1:]) << 2) | ENTITY_ID_PREFIX_CODES[entity_id[0]]
+
+def decode_entity_id(code):
+    """ Decodes an integer from encode_entity_id back to its string id """
+    return f"{ENTITY_ID_PREFIXES[code & 3]}{code >> 2}"
+
+def decode_entity_ids(codes):
+    """ Decodes an array of integer ids back to a list of string ids """
+    return [f"{ENTITY_ID_PREFIXES[code & 3]}{code >> 2}" for code in np.asarray(codes).tolist()]
+
+class StringColumn:
+    """ A string column backed by a slice of the file's utf-8 string heap """
+
+    def __init__(self, heap, offsets):
+        self.heap = heap
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.heap[self.offsets[i]:self.offsets[i+1]], 'utf-8')
+
+    def tolist(self):
+        heap = bytes(self.heap[self.offsets[0]:self.offsets[-1]])
+        offsets = (self.offsets - self.offsets[0]).tolist()
+        return [heap[st:end].decode('utf-8') for st, end in zip(offsets[:-1], offsets[1:])]
+
+    def take(self, indices):
+        """ Returns the strings at the given row indices """
+        starts = self.offsets[indices].tolist()
+        ends = self.offsets[np.asarray(indices) + 1].tolist()
+        return [str(self.heap[st:end], 'utf-8') for st, end in zip(starts, ends)]
+
+class ColumnBuffer:
+    """ Rows of a table appended to typed column buffers: an array('q') of encoded ids per id column, and a utf-8
+    bytearray heap with an array('q') of offsets into it per str column. Rows take about the size they have on disk. """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.num_rows = 0
+        self.ids = {name: array('q') for name, col_type in columns if col_type == 'id'}
+        self.heaps = {name: bytearray() for name, col_type in columns if col_type != 'id'}
+        self.offsets = {name: array('q', [0]) for name in self.heaps}
+
+    def append(self, row):
+        for name, ids in self.ids.items():
+            ids.append(encode_entity_id(row[name]))
+        for name, heap in self.heaps.items():
+            heap += row[name].encode('utf-8')
+            self.offsets[name].append(len(heap))
+        self.num_rows += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def truncate(self, num_rows):
+        """ Drops the rows after the first num_rows """
+        for ids in self.ids.values():
+            del ids[num_rows:]
+        for name, heap in self.heaps.items():
+            del heap[self.offsets[name][num_rows]:]
+            del self.offsets[name][num_rows + 1:]
+        self.num_rows = num_rows
+
+    @property
+    def nbytes(self):
+        return sum(len(ids) * ids.itemsize for ids in self.ids.values()) + \
+            sum(len(heap) + len(self.offsets[name]) * self.offsets[name].itemsize for name, heap in self.heaps.items())
+
+    def write(self, fname):
+        """ Writes the rows to fname as a columnar file.
+
+        Layout: magic, header length, json header, then 8-byte aligned int64 arrays followed by the string heap. An id
+        column is one array of encoded ids, a str column is an array of num_rows+1 offsets into the heap. """
+        arrays = []
+        heap = []
+        heap_size = 0
+        header_columns = []
+        data_offset = 0
+        for name, col_type in self.columns:
+            if col_type == 'id':
+                arr = np.frombuffer(self.ids[name], dtype=np.int64)
+            else:
+                arr = np.frombuffer(self.offsets[name], dtype=np.int64) + heap_size
+                heap.append(self.heaps[name])
+                heap_size += len(self.heaps[name])
+            header_columns.append({'name': name, 'type': col_type, 'offset': data_offset})
+            arrays.append(arr)
+            data_offset += arr.nbytes
+        header = json.dumps({'num_rows': self.num_rows, 'columns': header_columns, 'heap_offset': data_offset, 'heap_size': heap_size}).encode('utf-8')
+        header += b' ' * (-(len(COLUMNAR_MAGIC) + 8 + len(header)) % 8)
+        with open(fname, 'wb') as out_file:
+            out_file.write(COLUMNAR_MAGIC)
+            out_file.write(struct.pack('<Q', len(header)))
+            out_file.write(header)
+            for arr in arrays:
+                out_file.write(arr.astype('<i8', copy=False).tobytes())
+            for chunk in heap:
+                out_file.write(chunk)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+
+def write_columnar_file(fname, columns, rows):
+    """ Writes rows (list of dicts) to fname as a columnar file (see ColumnBuffer.write) """
+    buffer = ColumnBuffer(columns)
+    buffer.extend(rows)
+    buffer.write(fname)
+
+def read_columnar_file(fname, columns=None):
+    """ Memory maps a columnar file and returns {column name: int64 array or StringColumn}.
+    Id columns are returned still encoded; use decode_entity_ids to get string ids back. """
+    with open(fname, 'rb') as in_file:
+        mm = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+    assert mm[:len(COLUMNAR_MAGIC)] == COLUMNAR_MAGIC, f"{fname} is not a columnar table file"
+    header_len = struct.unpack('<Q', mm[len(COLUMNAR_MAGIC):len(COLUMNAR_MAGIC) + 8])[0]
+    data_start = len(COLUMNAR_MAGIC) + 8 + header_len
+    header = json.loads(mm[len(COLUMNAR_MAGIC) + 8:data_start].decode('utf-8'))
+    num_rows = header['num_rows']
+    heap_start = data_start + header['heap_offset']
+    heap = memoryview(mm)[heap_start:heap_start + header['heap_size']]
+    res = {}
+    for col in header['columns']:
+        if columns is not None and col['name'] not in columns:
+            continue
+        if col['type'] == 'id':
+            res[col['name']] = np.frombuffer(mm, dtype='<i8', count=num_rows, offset=data_start + col['offset'])
+        else:
+            offsets = np.frombuffer(mm, dtype='<i8', count=num_rows + 1, offset=data_start + col['offset'])
+            res[col['name']] = StringColumn(heap, offsets)
+    return res
+
+def columnar_generator(fname, property_ids=None):
+    """ Returns generator for a columnar file yielding the same row dicts as jsonl_generator.
+    If property_ids is given, rows are filtered on the encoded property column before anything is decoded. """
+    columns = read_columnar_file(fname)
+    names = list(columns.keys())
+    if property_ids is None:
+        values = [decode_entity_ids(col) if isinstance(col, np.ndarray) else col.tolist() for col in columns.values()]
+    else:
+        # ids that can't be encoded can't appear in the table either
+        codes = [encode_entity_id(pid) for pid in property_ids if pid[0] in ENTITY_ID_PREFIX_CODES and pid[1:].isdigit()]
+        indices = np.nonzero(np.isin(columns['property_id'], codes))[0]
+        values = [decode_entity_ids(col[indices]) if isinstance(col, np.ndarray) else col.take(indices) for col in columns.values()]
+    for row in zip(*values):
+        yield dict(zip(names, row))
+
+class TableWriter:
+    """ Keeps one buffered output handle open per table for the lifetime of a worker.
+
+    Rows are written to <out_dir>/<table>/<prefix>_<part>.jsonl. Once any table file grows past max_file_bytes,
+    all handles are closed and the writer moves on to the next part. With output_format='columnar', rows of the
+    tables in TABLE_COLUMNS are appended to typed column buffers (see ColumnBuffer) instead and written as
+    <prefix>_<part>.cols when the part is closed. The buffers count towards max_file_bytes with their real size.
+
+    With num_buckets > 0, the rows of the tables in BUCKET_KEYS are hash-partitioned by QID and every bucket gets
+    its own file <out_dir>/<table>/bucket<bucket>_<prefix>_<part>.jsonl (see get_bucket and get_bucket_files).
+    The write buffer is then split across the buckets of a table.
+
+    With a manifest_dir, callers call start_task before every task (batch or byte range) and report it through
+    finish_task once it is written, or abort_task if it fails so its rows are dropped. Parts then only
+    roll over between tasks (on size or after checkpoint_secs), and once a part's files are closed and synced a
+    <manifest_dir>/<prefix>_<part>.json marker listing its files and tasks is written atomically. Table files
+    without a marker belong to unfinished tasks. """
+
+    def __init__(self, out_dir, prefix, max_file_bytes, buffer_size, output_format='jsonl', manifest_dir=None, checkpoint_secs=None,
+                 num_buckets=0):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.max_file_bytes = max_file_bytes
+        self.buffer_size = buffer_size
+        self.output_format = output_format
+        self.manifest_dir = manifest_dir
+        self.checkpoint_secs = checkpoint_secs
+        self.num_buckets = num_buckets
+        self.part = 0
+        # handles, buffered rows and sizes are keyed by (table, bucket); bucket is None for unpartitioned files
+        self.handles = {}
+        self.buffered_rows = {}
+        self.bytes_written = {}
+        self.finished_tasks = []
+        self.part_full = False
+        self.part_start = time.time()
+        # where every open table file and column buffer stood when the running task started (see start_task)
+        self.task_start = None
+
+    def get_path(self, table, part, ending='jsonl', bucket=None):
+        if bucket is None:
+            return os.path.join(self.out_dir, table, f"{self.prefix}_{part}.{ending}")
+        return os.path.join(self.out_dir, table, f"{BUCKET_FILE_PREFIX}{bucket}_{self.prefix}_{part}.{ending}")
+
+    def write(self, table, rows):
+        # per language tables are named <table>/<language_id>
+        base_table = table.split('/')[0]
+        if self.num_buckets > 0 and base_table in BUCKET_KEYS:
+            bucket_rows = {}
+            for x in rows:
+                bucket = get_bucket(get_row_bucket_key(base_table, x), self.num_buckets)
+                if bucket not in bucket_rows:
+                    bucket_rows[bucket] = []
+                bucket_rows[bucket].append(x)
+            for bucket, rows_in_bucket in bucket_rows.items():
+                self.write_file(table, bucket, rows_in_bucket)
+        else:
+            self.write_file(table, None, rows)
+
+    def write_file(self, table, bucket, rows):
+        key = (table, bucket)
+        if self.output_format == 'columnar' and table.split('/')[0] in TABLE_COLUMNS:
+            if key not in self.buffered_rows:
+                self.buffered_rows[key] = ColumnBuffer(TABLE_COLUMNS[table.split('/')[0]])
+            self.buffered_rows[key].extend(rows)
+            # the buffers take about the size of the file they are written to
+            self.bytes_written[key] = self.buffered_rows[key].nbytes
+            self.check_size(key)
+            return
+        if key not in self.handles:
+            buffer_size = self.buffer_size if bucket is None else max(io.DEFAULT_BUFFER_SIZE, self.buffer_size // self.num_buckets)
+            self.handles[key] = open(self.get_path(table, self.part, bucket=bucket), 'w', encoding='utf8', buffering=buffer_size)
+            self.bytes_written[key] = 0
+        handle = self.handles[key]
+        for x in rows:
+            line = json.dumps(x, ensure_ascii=False) + "\n"
+            handle.write(line)
+            self.bytes_written[key] += len(line)
+        self.check_size(key)
+
+    def check_size(self, key):
+        if self.bytes_written[key] >= self.max_file_bytes:
+            if self.manifest_dir is None:
+                self.rollover()
+            else:
+                # a part must never hold only some of a task's rows, so wait for the task to finish
+                self.part_full = True
+
+    def start_task(self):
+        """ Remembers where the table files and column buffers stand, so abort_task can drop the rows of the task """
+        self.task_start = {
+            'part': self.part,
+            'handles': {key: handle.tell() for key, handle in self.handles.items()},
+            'buffered_rows': {key: buffer.num_rows for key, buffer in self.buffered_rows.items()},
+            'bytes_written': dict(self.bytes_written),
+        }
+
+    def abort_task(self):
+        """ Drops the rows written since start_task. A failed task must not leave rows in a part that a later task commits. """
+        # without a manifest parts roll over in the middle of tasks and there is nothing to resume, so rows are kept
+        if self.task_start is None or self.task_start['part'] != self.part:
+            self.task_start = None
+            return
+        for key, handle in list(self.handles.items()):
+            if key in self.task_start['handles']:
+                handle.seek(self.task_start['handles'][key])
+                handle.truncate()
+            else:
+                # the file was opened by the failed task
+                handle.close()
+                os.remove(handle.name)
+                del self.handles[key]
+        for key, buffer in list(self.buffered_rows.items()):
+            if key in self.task_start['buffered_rows']:
+                buffer.truncate(self.task_start['buffered_rows'][key])
+            else:
+                del self.buffered_rows[key]
+        self.bytes_written = self.task_start['bytes_written']
+        self.task_start = None
+
+    def finish_task(self, task_id):
+        """ Marks task_id as fully written to the current part """
+        self.task_start = None
+        self.finished_tasks.append(task_id)
+        if self.part_full or (self.checkpoint_secs is not None and time.time() - self.part_start >= self.checkpoint_secs):
+            self.rollover()
+
+    def rollover(self):
+        """ Closes the current part of every table; the next write starts a new part """
+        self.close()
+        self.part += 1
+
+    def close(self):
+        files = []
+        for handle in self.handles.values():
+            if self.manifest_dir is not None:
+                handle.flush()
+                os.fsync(handle.fileno())
+            handle.close()
+            files.append(handle.name)
+        for (table, bucket), buffer in self.buffered_rows.items():
+            path = self.get_path(table, self.part, ending=COLUMNAR_ENDING, bucket=bucket)
+            buffer.write(path)
+            files.append(path)
+        if self.manifest_dir is not None and len(self.finished_tasks) > 0:
+            marker = {'tasks': self.finished_tasks, 'files': [os.path.relpath(f, self.out_dir) for f in files]}
+            write_json_atomic(os.path.join(self.manifest_dir, f"{self.prefix}_{self.part}.json"), marker)
+        self.handles = {}
+        self.buffered_rows = {}
+        self.bytes_written = {}
+        self.finished_tasks = []
+        self.part_full = False
+        self.part_start = time.time()
+
+def get_bucket(qid, num_buckets):
+    """ Returns the bucket of a QID. QIDs are assigned sequentially, so their number modulo num_buckets spreads them evenly. """
+    try:
+        return int(qid[1:]) % num_buckets
+    except ValueError:
+        return zlib.crc32(qid.encode('utf-8')) % num_buckets
+
+def get_row_bucket_key(table, row):
+    """ Returns the QID a row of table is partitioned by """
+    key = row[BUCKET_KEYS[table]]
+    if table == 'qualifiers':
+        # claim ids look like Q42$F0F1... (sometimes with a lowercase q)
+        key = key.split('$', 1)[0].upper()
+    return key
+
+def get_bucket_files(fdir):
+    """ Returns {bucket: list of paths} for a hash-partitioned table directory """
+    res = {}
+    for fname in sorted(os.listdir(fdir)):
+        if not fname.startswith(BUCKET_FILE_PREFIX):
+            continue
+        bucket = int(fname[len(BUCKET_FILE_PREFIX):].split('_', 1)[0])
+        if bucket not in res:
+            res[bucket] = []
+        res[bucket].append(os.path.join(fdir, fname))
+    print(f"Fetched {sum(len(v) for v in res.values())} files in {len(res)} buckets from {fdir}")
+    return res
+
+def write_json_atomic(fname, contents):
+    """ Writes contents to fname through a synced temporary file so readers never see a partial file """
+    with open(fname + '.tmp', 'w', encoding='utf8') as out_f:
+        json.dump(contents, out_f)
+        out_f.flush()
+        os.fsync(out_f.fileno())
+    os.replace(fname + '.tmp', fname)
+
+def load_manifest(manifest_dir):
+    """ Returns the finished task ids and committed file paths (relative to the output directory) of all part markers in manifest_dir """
+    finished_tasks = set()
+    files = set()
+    for fname in os.listdir(manifest_dir):
+        if not fname.endswith('.json') or fname == 'config.json':
+            continue
+        with open(os.path.join(manifest_dir, fname), 'r', encoding='utf8') as in_f:
+            marker = json.load(in_f)
+        finished_tasks.update(marker['tasks'])
+        files.update(marker['files'])
+    return finished_tasks, files
+
 def get_batch_files(fdir):
     """ Returns paths to files in fdir """ 
     filenames = os.listdir(fdir)
@@ -50,6 +491,31 @@ def get_batch_files(fdir):
     print(f"Fetched {len(filenames)} files from {fdir}")
     return filenames
 
+def load_qid_file(fname):
+    """ Loads a json list (or dict keyed by QID) or a text file with one QID per line as a sorted array of encoded ids """
+    if fname.endswith('.json'):
+        with open(fname, 'r', encoding='utf8') as in_f:
+            qids = json.load(in_f)
+    else:
+        with open(fname, 'r', encoding='utf8') as in_f:
+            qids = [line.strip() for line in in_f if len(line.strip()) > 0]
+    return np.unique(np.array([encode_entity_id(qid) for qid in qids], dtype=np.int64))
+
+def sorted_array_contains(arr, value):
+    """ Returns whether value is in the sorted array arr """
+    idx = np.searchsorted(arr, value)
+    return idx < len(arr) and arr[idx] == value
+
+def get_table_files(processed_dir, table, language_id=None):
+    """ Returns paths to the files of table in processed_dir. Tables written with --language_ids keep the rows of each
+    language in <table>/<language_id>/, next to the language neutral files. """
+    fdir = os.path.join(processed_dir, table)
+    filenames = [os.path.join(fdir, f) for f in os.listdir(fdir) if os.path.isfile(os.path.join(fdir, f))]
+    if language_id is not None and os.path.isdir(os.path.join(fdir, language_id)):
+        filenames.extend(os.path.join(fdir, language_id, f) for f in os.listdir(os.path.join(fdir, language_id)))
+    print(f"Fetched {len(filenames)} files from {fdir}")
+    return filenames
+
 def create_dir(out_dir):
     """ Creates new directory if it doesn't already exist """
     if not os.path.exists(out_dir):
@@ -7,6 +7,7 @@ import ujson, os
 from bootleg_data_prep.data_filter import filter_entity_symbols
 from bootleg_data_prep.language import ENSURE_ASCII
 from bootleg_data_prep.utils.classes.entity_symbols import EntitySymbols
+from bootleg_data_prep.utils.data_prep_utils import encode_qid
 
 
 class EntitySymbolsSubclass(EntitySymbols):
@@ -55,7 +56,7 @@ class MyTestCase(unittest.TestCase):
         return
 
     def test_entity_filter(self):
-        list_of_all_qids = [["Q5"]]
+        list_of_all_qids = [{encode_qid("Q5")}]
         qid2title, alias2qids, max_candidates, max_alias_len = filter_entity_symbols(self.args, list_of_all_qids, [], self.entity_symbols)
         resulting_qids = ["Q4", "Q5", "Q6", "Q7"]
         resulting_aliases = ["alias4", "alias8"]
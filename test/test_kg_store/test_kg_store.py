@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import marisa_trie
+import numpy as np
+
+from bootleg_data_prep.utils.classes.kg_store import KGStore, NO_RELATION, build_vocabulary, convert_record_trie
+
+
+class TestKGStore(unittest.TestCase):
+
+    def setUp(self):
+        self.qids = ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6", "Q7"]
+        # Q1 -> Q2 has two relations; Q7 has no edges
+        self.triples = [("Q1", "Q2", 3), ("Q1", "Q2", 1), ("Q1", "Q4", 0), ("Q2", "Q1", 2), ("Q3", "Q6", 4),
+                        ("Q6", "Q5", 0), ("Q5", "Q1", 1), ("Q1", "Q6", 2)]
+        self.vocabulary = build_vocabulary(self.qids)
+        heads = [self.vocabulary[h] for h, _, _ in self.triples]
+        tails = [self.vocabulary[t] for _, t, _ in self.triples]
+        rel_ids = [r for _, _, r in self.triples]
+        self.kg_store = KGStore(vocabulary=self.vocabulary, heads=heads, tails=tails, rel_ids=rel_ids)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def get_relation(self, head, tail):
+        rels = [r for h, t, r in self.triples if h == head and t == tail]
+        return min(rels) if len(rels) > 0 else NO_RELATION
+
+    def check_store(self, kg_store):
+        eids = kg_store.get_eids(self.qids)
+        self.assertEqual(self.qids, [kg_store.get_qid(eid) for eid in eids])
+        for qid, neighbors in zip(self.qids, kg_store.neighbors(eids)):
+            true_neighbors = sorted(set(t for h, t, _ in self.triples if h == qid))
+            self.assertEqual(true_neighbors, sorted(kg_store.get_qid(eid) for eid in neighbors))
+
+        heads = [h for h in self.qids for _ in self.qids]
+        tails = [t for _ in self.qids for t in self.qids]
+        rels = kg_store.relations(kg_store.get_eids(heads), kg_store.get_eids(tails))
+        self.assertEqual([self.get_relation(h, t) for h, t in zip(heads, tails)], rels.tolist())
+
+        matrix = kg_store.pair_relations(eids)
+        self.assertEqual((len(self.qids), len(self.qids)), matrix.shape)
+        for i, head in enumerate(self.qids):
+            for j, tail in enumerate(self.qids):
+                self.assertEqual(self.get_relation(head, tail), matrix[i, j])
+
+        self.assertEqual({1, 3}, kg_store.all_relations(*kg_store.get_eids(["Q1", "Q2"])))
+        self.assertEqual(set(), kg_store.all_relations(*kg_store.get_eids(["Q2", "Q3"])))
+
+    def test_queries(self):
+        self.check_store(self.kg_store)
+
+    def test_unknown_qids(self):
+        eids = self.kg_store.get_eids(["Q1", "Q100"])
+        self.assertEqual(-1, eids[1])
+        self.assertEqual([NO_RELATION, NO_RELATION], self.kg_store.relations(eids, eids[::-1]).tolist())
+        self.assertEqual(0, len(self.kg_store.neighbors([eids[1]])[0]))
+
+    def test_dump_load(self):
+        self.kg_store.dump(self.temp_dir)
+        kg_store = KGStore(load_dir=self.temp_dir)
+        self.assertEqual(len(self.triples), kg_store.num_edges)
+        self.assertEqual(len(self.qids), kg_store.num_entities)
+        self.check_store(kg_store)
+
+    def test_convert_record_trie(self):
+        # the format before the KGStore: one (relation id,) record per relation of every "<head>_<tail>" key
+        trie_file = os.path.join(self.temp_dir, "old.marisa")
+        marisa_trie.RecordTrie("<l", [(f"{h}_{t}", (r,)) for h, t, r in self.triples]).save(trie_file)
+        convert_record_trie(trie_file, "<l", self.temp_dir)
+        kg_store = KGStore(load_dir=self.temp_dir)
+        self.assertEqual(len(self.triples), kg_store.num_edges)
+        heads = [h for h in self.qids for _ in self.qids]
+        tails = [t for _ in self.qids for t in self.qids]
+        rels = kg_store.relations(kg_store.get_eids(heads), kg_store.get_eids(tails))
+        self.assertEqual([self.get_relation(h, t) for h, t in zip(heads, tails)], rels.tolist())
+        self.assertEqual({1, 3}, kg_store.all_relations(*kg_store.get_eids(["Q1", "Q2"])))
+
+    def test_empty(self):
+        kg_store = KGStore(vocabulary=self.vocabulary, heads=[], tails=[], rel_ids=[])
+        eids = kg_store.get_eids(self.qids)
+        self.assertTrue(np.all(kg_store.pair_relations(eids) == NO_RELATION))
+
+
+if __name__ == '__main__':
+    unittest.main()
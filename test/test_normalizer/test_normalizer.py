@@ -0,0 +1,35 @@
+import unittest
+
+from langs.normalizer import LnrmNormalizer, reference_lnrm
+
+
+class TestNormalizer(unittest.TestCase):
+
+    def setUp(self):
+        self.strings = ["Big Small\t business", "  the  alias    is here ", "", " ", "Q&A", "AT&T Inc.", "Café Müller",
+                        "Ångström (unit)", "ﬁnal ﬁ ligature", "Ｆｕｌｌｗｉｄｔｈ", "İstanbul", "ΟΔΟΣ", "北京 大学",
+                        "משרד החוץ\t פרסם", "naïve – résumé", "x́̂y", "a\nb", "private \ue000 use", "12-34", "Café Müller"]
+
+    def test_get_lnrm(self):
+        for form in ['NFD', 'NFKD']:
+            normalizer = LnrmNormalizer(normalization_form=form)
+            for strip in [True, False]:
+                for lower in [True, False]:
+                    for s in self.strings:
+                        self.assertEqual(reference_lnrm(s, strip, lower, form), normalizer.get_lnrm(s, strip, lower))
+
+    def test_get_lnrms(self):
+        for form in ['NFD', 'NFKD']:
+            normalizer = LnrmNormalizer(normalization_form=form)
+            for strip in [True, False]:
+                for lower in [True, False]:
+                    true_lnrms = [reference_lnrm(s, strip, lower, form) for s in self.strings]
+                    self.assertEqual(true_lnrms, normalizer.get_lnrms(self.strings, strip, lower))
+                    ascii_strings = [s for s in self.strings if s.isascii()]
+                    self.assertEqual([reference_lnrm(s, strip, lower, form) for s in ascii_strings],
+                                     normalizer.get_lnrms(ascii_strings, strip, lower))
+            self.assertEqual([], normalizer.get_lnrms([], True, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import html
+import random
+import unittest
+from urllib.parse import quote
+
+from bootleg_data_prep.process_extracted_wikipedia import extract_mention_tags, reference_extract_mention_tags
+
+WORDS = ["alpha", "beta", "Café", "naïve", "東京", "x < y", "a > b", "AT&amp;T", "&quot;quoted&quot;", "5 &lt; 6", "&", "<br>",
+         "<ref>note</ref>", "<!-- comment -->", "\n", "\n\n\n", "end."]
+TITLES = ["Apple", "AT&T", "Tom & Jerry", "Café de Flore", "東京", "C++", "100% (song)", "Foo#History", "Bar_(band)", " Spaced "]
+
+
+def make_anchor(rand):
+    title = rand.choice(TITLES)
+    href = quote(title) if rand.random() < 0.8 else html.escape(title)
+    alias = rand.choice(["apple", "AT&amp;T", "Café", "東京", "two\nlines", "<b>bold</b> text", title, ""])
+    quote_char = rand.choice(['"', "'"])
+    if rand.random() < 0.1:
+        return f"<a>{alias}</a>"
+    if rand.random() < 0.1:
+        return f'<a title={quote_char}t > 1{quote_char} href={quote_char}{href}{quote_char}>{alias}</a>'
+    return f"<a href={quote_char}{href}{quote_char}>{alias}</a>"
+
+
+def make_page(rand, num_tokens):
+    """ A WikiExtractor --links style page text, after the html.unescape of process_extracted_wikipedia.subprocess """
+    tokens = [make_anchor(rand) if rand.random() < 0.2 else rand.choice(WORDS) for _ in range(num_tokens)]
+    return html.unescape(" ".join(tokens))
+
+
+class TestExtractMentionTags(unittest.TestCase):
+
+    def check_page(self, raw_text):
+        page_text, entity_data = extract_mention_tags(raw_text)
+        self.assertEqual(reference_extract_mention_tags(raw_text), (page_text, entity_data), raw_text)
+        for (span_l, span_r), ent_dict in entity_data.items():
+            self.assertEqual(ent_dict["alias"], page_text[span_l:span_r])
+
+    def test_examples(self):
+        page_text, entity_data = extract_mention_tags('The <a href="AT%26T%23History">AT&amp;T</a> building\n\n is in '
+                                                     '<a href="New%20York%20City">New York</a>.')
+        self.assertEqual("The AT&T building\n is in New York.", page_text)
+        self.assertEqual({(4, 8): {"alias": "AT&T", "title": "AT&T", "char_span": [4, 8]},
+                          (25, 33): {"alias": "New York", "title": "New York City", "char_span": [25, 33]}}, entity_data)
+        for raw_text in ['nested <a href="B"><b>bold</b> text</a> end', '<a href="X"></a> empty and <a>no href</a>',
+                         'attr <a href="a>b">ab</a>.', '<abbr>x</abbr> <a href=NoQuote>nq</a>', 'no anchors < here', '']:
+            self.check_page(raw_text)
+
+    def test_golden(self):
+        rand = random.Random(0)
+        for _ in range(300):
+            self.check_page(make_page(rand, rand.randint(0, 400)))
+
+
+if __name__ == "__main__":
+    unittest.main()
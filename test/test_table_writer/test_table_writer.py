@@ -0,0 +1,171 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import ujson as json
+
+from simple_wikidata_db import preprocess_dump
+from simple_wikidata_db.utils import TABLE_COLUMNS, ColumnBuffer, TableWriter, decode_entity_ids, get_bucket_files, get_byte_ranges, \
+    get_table_files, read_columnar_file, table_generator, write_columnar_file
+
+TABLES = ['entity_rels', 'aliases/en', 'aliases/de', 'qualifiers']
+
+
+def make_rows(rand, table, num_rows):
+    rows = []
+    for i in range(num_rows):
+        qid = f"Q{rand.randint(1, 500)}"
+        if table == 'entity_rels':
+            rows.append({'claim_id': f"{qid}${i}", 'qid': qid, 'property_id': rand.choice(['P31', 'P279', 'P17']),
+                         'value': rand.choice([f"Q{rand.randint(1, 500)}", f"L{rand.randint(1, 9)}"])})
+        elif table == 'qualifiers':
+            rows.append({'qualifier_id': f"h{i}", 'claim_id': f"{qid.lower()}${i}", 'property_id': 'P580', 'value': f"+20{i % 10}0"})
+        else:
+            rows.append({'qid': qid, 'alias': rand.choice(["Café", "東京", "", "AT&T", f"alias {i}"])})
+    return rows
+
+
+def read_table(out_dir, table, language_id=None):
+    return sorted((tuple(sorted(row.items())) for fname in get_table_files(out_dir, table, language_id) for row in table_generator(fname)))
+
+
+class TestColumnarFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        rand = random.Random(0)
+        self.rows = {table: make_rows(rand, table.split('/')[0], 300) for table in TABLES}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_file_round_trip(self):
+        fname = os.path.join(self.temp_dir, "entity_rels.cols")
+        rows = self.rows['entity_rels']
+        write_columnar_file(fname, TABLE_COLUMNS['entity_rels'], rows)
+        self.assertEqual(rows, list(table_generator(fname)))
+        self.assertEqual([row for row in rows if row['property_id'] in {'P31', 'P999'}], list(table_generator(fname, {'P31', 'P999'})))
+        columns = read_columnar_file(fname, ['qid', 'claim_id'])
+        self.assertEqual(['claim_id', 'qid'], sorted(columns))
+        self.assertEqual([row['qid'] for row in rows], decode_entity_ids(columns['qid']))
+        self.assertEqual([row['claim_id'] for row in rows], columns['claim_id'].tolist())
+        self.assertEqual([rows[i]['claim_id'] for i in [5, 0, 7]], columns['claim_id'].take(np.array([5, 0, 7])))
+
+    def test_buffer_truncate(self):
+        rows = self.rows['aliases/en']
+        buffer = ColumnBuffer(TABLE_COLUMNS['aliases'])
+        buffer.extend(rows[:100])
+        nbytes = buffer.nbytes
+        buffer.extend(rows[100:])
+        buffer.truncate(100)
+        self.assertEqual(nbytes, buffer.nbytes)
+        buffer.extend(rows[100:])
+        fname = os.path.join(self.temp_dir, "aliases.cols")
+        buffer.write(fname)
+        self.assertEqual(rows, list(table_generator(fname)))
+
+    def write_tables(self, out_dir, output_format, num_buckets):
+        for table in TABLES:
+            os.makedirs(os.path.join(out_dir, table), exist_ok=True)
+        # a small max_file_bytes so the tables roll over to several parts
+        writer = TableWriter(out_dir, prefix="run_0", max_file_bytes=2000, buffer_size=1024, output_format=output_format,
+                             num_buckets=num_buckets)
+        for start in range(0, 300, 50):
+            for table in TABLES:
+                writer.write(table, self.rows[table][start:start + 50])
+        writer.close()
+
+    def test_writer_matches_jsonl(self):
+        for num_buckets in [0, 4]:
+            jsonl_dir = os.path.join(self.temp_dir, f"jsonl_{num_buckets}")
+            columnar_dir = os.path.join(self.temp_dir, f"columnar_{num_buckets}")
+            self.write_tables(jsonl_dir, 'jsonl', num_buckets)
+            self.write_tables(columnar_dir, 'columnar', num_buckets)
+            self.assertTrue(all(f.endswith('.cols') for f in get_table_files(columnar_dir, 'aliases', 'en')))
+            self.assertGreater(len(get_table_files(columnar_dir, 'entity_rels')), 1)
+            for table, language_id in [('entity_rels', None), ('aliases', 'en'), ('aliases', 'de'), ('qualifiers', None)]:
+                jsonl_rows = read_table(jsonl_dir, table, language_id)
+                self.assertEqual(jsonl_rows, read_table(columnar_dir, table, language_id))
+                expected = self.rows[table if language_id is None else f"{table}/{language_id}"]
+                self.assertEqual(sorted(tuple(sorted(row.items())) for row in expected), jsonl_rows)
+            if num_buckets > 0:
+                bucket_files = get_bucket_files(os.path.join(columnar_dir, 'aliases', 'en'))
+                self.assertEqual(set(range(num_buckets)), set(bucket_files))
+                for bucket, fnames in bucket_files.items():
+                    for fname in fnames:
+                        self.assertTrue(all(int(row['qid'][1:]) % num_buckets == bucket for row in table_generator(fname)))
+
+
+class TestFailedTask(unittest.TestCase):
+    """ A byte range that fails partway must not leave rows that a later task of the same worker commits """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.temp_dir, "dump.json")
+        with open(self.input_file, "w") as out_f:
+            out_f.write("[\n")
+            for i in range(1, 301):
+                entity = {"type": "item", "id": f"Q{i}", "labels": {"en": {"value": f"label {i}"}}, "descriptions": {},
+                          "aliases": {"en": [{"value": f"alias {i}"}]}, "sitelinks": {}, "claims": {}}
+                out_f.write(json.dumps(entity) + ",\n")
+            out_f.write("]\n")
+        self.get_range_lines = preprocess_dump.get_range_lines
+
+    def tearDown(self):
+        preprocess_dump.get_range_lines = self.get_range_lines
+        shutil.rmtree(self.temp_dir)
+
+    def get_args(self, output_format, resume):
+        out_dir = os.path.join(self.temp_dir, output_format)
+        cmd = ["--input_file", self.input_file, "--out_dir", out_dir, "--parallel_read", "--range_size_mb", "1", "--batch_size", "10",
+               "--output_format", output_format]
+        args = preprocess_dump.get_arg_parser().parse_args(cmd + (["--resume"] if resume else []))
+        args.language_subdirs = False
+        args.language_ids = [args.language_id]
+        args.filter_entities = False
+        return args
+
+    def run_ranges(self, args, run_id, byte_ranges, failing_range=None):
+        def get_range_lines(start, end):
+            for i, line in enumerate(self.get_range_lines(start, end)):
+                # fail after the first batches were written
+                if (start, end) == failing_range and i == 50:
+                    raise IOError("Failed reading the range")
+                yield line
+        preprocess_dump.get_range_lines = get_range_lines
+        preprocess_dump.init_func(args, None, run_id, None)
+        for byte_range in byte_ranges:
+            if byte_range[1:] == failing_range:
+                self.assertRaises(IOError, preprocess_dump.process_byte_range, byte_range)
+            else:
+                preprocess_dump.process_byte_range(byte_range)
+        preprocess_dump.writer_global.close()
+
+    def test_resume_after_failure(self):
+        for output_format in ['jsonl', 'columnar']:
+            args = self.get_args(output_format, resume=False)
+            manifest_dir = os.path.join(args.out_dir, preprocess_dump.MANIFEST_DIR)
+            os.makedirs(args.out_dir)
+            preprocess_dump.setup_output_dirs(args, manifest_dir)
+            # three ranges of about 100 entities
+            byte_ranges = get_byte_ranges(self.input_file, os.path.getsize(self.input_file) // 3)
+            self.assertEqual(3, len(byte_ranges))
+            self.run_ranges(args, "run0", byte_ranges, failing_range=byte_ranges[1][1:])
+
+            args = self.get_args(output_format, resume=True)
+            finished_tasks = preprocess_dump.resume_output_dirs(args, manifest_dir)
+            self.assertEqual({byte_ranges[0][0], byte_ranges[2][0]}, finished_tasks)
+            self.run_ranges(args, "run1", [r for r in byte_ranges if r[0] not in finished_tasks])
+
+            labels = [row['label'] for fname in get_table_files(args.out_dir, 'labels') for row in table_generator(fname)]
+            self.assertEqual(sorted(f"label {i}" for i in range(1, 301)), sorted(labels))
+            # labels are aliases too
+            aliases = [row['alias'] for fname in get_table_files(args.out_dir, 'aliases') for row in table_generator(fname)]
+            self.assertEqual(sorted(f"{name} {i}" for i in range(1, 301) for name in ['label', 'alias']), sorted(aliases))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from html import escape, unescape
+
+import jsonlines
+
+from bootleg_data_prep.utils.classes.title_index import TitleIndex, get_title_index, get_title_index_dir
+from bootleg_data_prep.utils.data_prep_utils import NO_QID, encode_qid, load_qid_title_map
+
+
+def write_title_file(filename, num_qids, seed=0):
+    """ Writes a title_to_all_ids.jsonl with redirects, HTML escaped titles and redirects shared by several QIDs """
+    rand = random.Random(seed)
+    with jsonlines.open(filename, 'w') as out_f:
+        for i in range(num_qids):
+            qid = f"Q{i + 1}"
+            wikipedia_title = rand.choice([f"Page {i}", f"AT&T {i}", f"AT&amp;T {i}", f"<Page> {i}"])
+            rows = [wikipedia_title] + [f"Redirect {rand.randint(0, num_qids)}" for _ in range(rand.randint(0, 3))]
+            for title in rows:
+                out_f.write({"qid": qid, "title": title, "id": str(i), "wikidata_title": f"page {i}", "wikipedia_title": wikipedia_title})
+        out_f.write({"qid": "-1", "title": "No QID", "id": "-1", "wikidata_title": "No QID", "wikipedia_title": "No QID"})
+
+
+class TestTitleIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.title_file = os.path.join(self.temp_dir, "title_to_all_ids.jsonl")
+        write_title_file(self.title_file, num_qids=300)
+        self.title_to_qid, self.qid_to_all_titles, self.wpid_to_qid, self.qid_to_title = load_qid_title_map(self.title_file, encode_qids=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def resolve_with_dict(self, title_raw):
+        """ How the steps looked titles up before the index """
+        title = title_raw
+        if title not in self.title_to_qid:
+            title = unescape(title_raw)
+        if title not in self.title_to_qid:
+            title = escape(title_raw)
+        return title, self.title_to_qid.get(title, NO_QID)
+
+    def check_index(self, title_index):
+        queries = list(self.title_to_qid) + [escape(t) for t in self.title_to_qid] + [unescape(t) for t in self.title_to_qid] + \
+                  ["AT&#38;T 3", "No QID", "Missing & title", ""]
+        for title in queries:
+            self.assertEqual(self.resolve_with_dict(title), title_index.resolve(title), title)
+        for qid, titles in self.qid_to_all_titles.items():
+            self.assertEqual(self.qid_to_title[qid], title_index.get_title(qid))
+            self.assertEqual(titles, title_index.get_all_titles(qid))
+        self.assertEqual(dict(self.qid_to_all_titles), dict(title_index.qid_titles()))
+        self.assertIsNone(title_index.get_title(encode_qid("Q100000")))
+        self.assertEqual(NO_QID, title_index.get_qid("No QID"))
+        for title, qid in self.title_to_qid.items():
+            self.assertEqual(qid, title_index.get_title_qid(title))
+        self.assertEqual(NO_QID, title_index.get_title_qid("AT&#38;T 3"))
+        for wpid, qid in self.wpid_to_qid.items():
+            self.assertEqual(qid, title_index.get_wpid_qid(wpid))
+            self.assertEqual(qid, title_index.get_wpid_qid(int(wpid)))
+        self.assertEqual(NO_QID, title_index.get_wpid_qid("-1"))
+
+    def test_build(self):
+        self.check_index(TitleIndex(title_file=self.title_file))
+
+    def test_dump_load(self):
+        title_index = get_title_index(self.title_file)
+        self.assertTrue(os.path.exists(get_title_index_dir(self.title_file)))
+        self.check_index(title_index)
+        self.check_index(TitleIndex(load_dir=get_title_index_dir(self.title_file)))
+
+
+if __name__ == "__main__":
+    unittest.main()
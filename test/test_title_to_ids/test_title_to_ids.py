@@ -0,0 +1,119 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from bootleg_data_prep.wikidata.get_title_to_ids import add_redirects, flatten_redirects, get_page_byte_ranges, item_to_dict, \
+    merge_title_mappings, read_in_redirects, read_in_saved_title_file, resolve_redirect_chains
+
+
+def write_synthetic_xml(filename, num_pages, seed=0):
+    """ Writes a pages-articles style XML with redirect pages, multi line text and non ASCII titles """
+    rand = random.Random(seed)
+    with open(filename, "w", encoding="utf-8") as out_f:
+        out_f.write('<mediawiki xml:lang="en">\n  <siteinfo>\n    <sitename>Wikipedia</sitename>\n  </siteinfo>\n')
+        for i in range(num_pages):
+            out_f.write("  <page>\n")
+            out_f.write(f"    <title>Page {i} é &amp; ü</title>\n    <ns>0</ns>\n    <id>{i}</id>\n")
+            is_redirect = rand.random() < 0.5
+            if is_redirect:
+                out_f.write(f'    <redirect title="Page {rand.randint(0, num_pages // 10)} é &amp; ü" />\n')
+            out_f.write(f"    <revision>\n      <id>{1000 + i}</id>\n")
+            out_f.write(f"      <timestamp>20{rand.randint(10, 20)}-0{rand.randint(1, 9)}-1{rand.randint(0, 9)}T10:00:00Z</timestamp>\n")
+            text = "#REDIRECT [[Target]]" if is_redirect else "\n".join("text <page> line " * rand.randint(0, 5) for _ in range(rand.randint(1, 6)))
+            out_f.write(f'      <text bytes="{len(text)}" xml:space="preserve">{text}</text>\n    </revision>\n')
+            out_f.write("  </page>\n")
+        out_f.write("</mediawiki>\n")
+
+
+class TestReadInRedirects(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.xml_file = os.path.join(self.temp_dir, "pages.xml")
+        write_synthetic_xml(self.xml_file, num_pages=500)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_byte_ranges(self):
+        byte_ranges = get_page_byte_ranges(self.xml_file, 16)
+        self.assertGreater(len(byte_ranges), 1)
+        self.assertEqual(0, byte_ranges[0][0])
+        self.assertEqual(os.path.getsize(self.xml_file), byte_ranges[-1][1])
+        with open(self.xml_file, "rb") as in_f:
+            for (start, end), (next_start, _) in zip(byte_ranges, byte_ranges[1:]):
+                self.assertEqual(end, next_start)
+                in_f.seek(start)
+                if start > 0:
+                    self.assertTrue(in_f.readline().strip().startswith(b"<page>"))
+
+    def test_parallel_matches_serial(self):
+        serial = read_in_redirects(self.xml_file, total_lines=None, processes=1)
+        self.assertGreater(len(serial), 1)
+        for processes in [2, 3]:
+            parallel = read_in_redirects(self.xml_file, total_lines=None, processes=processes)
+            self.assertEqual(set(serial), set(parallel))
+            for title in serial:
+                self.assertEqual(len(serial[title]), len(parallel[title]))
+                self.assertEqual(set(serial[title]), set(parallel[title]))
+
+
+class TestAddRedirects(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_add_redirects(self):
+        raw_file = os.path.join(self.temp_dir, "title_to_all_ids_raw.jsonl")
+        wikipedia_titles_to_qid = {"Apple": {"Q1"}, "AT&T": {"Q2"}, "Banana": {"Q3"}}
+        qid_to_wikidata = {"Q1": {"apple"}, "Q3": {"banana", "banana fruit"}}
+        wikititle2item = merge_title_mappings(raw_file, qid_to_wikidata, wikipedia_titles_to_qid, {"Apple": "10"})
+        self.assertEqual(wikititle2item, read_in_saved_title_file(raw_file))
+        title_map = {"Apple": [(1, "Apples"), (2, "Apples"), (3, "Pomme")], "AT%26T": [(1, "ATT")], "Cherry": [(1, "Cherries")],
+                     "Banana": [(1, "Bananas")]}
+        add_redirects(title_map, wikititle2item)
+        items = [item_to_dict(item) for items in wikititle2item.values() for item in items]
+        redirect_items = [item for item in items if item["title"] != item["wikipedia_title"]]
+        self.assertEqual(4, len(redirect_items))
+        self.assertIn({"qid": "Q1", "id": "10", "title": "Apples", "wikidata_title": "apple", "wikipedia_title": "Apple"}, redirect_items)
+        self.assertIn({"qid": "Q1", "id": "10", "title": "Pomme", "wikidata_title": "apple", "wikipedia_title": "Apple"}, redirect_items)
+        # found through the unquoted title
+        self.assertIn({"qid": "Q2", "id": "-1", "title": "ATT", "wikidata_title": "at&t", "wikipedia_title": "AT&T"}, redirect_items)
+        # one item is copied per redirect, even if the wikipedia title has several
+        self.assertEqual(1, len([item for item in redirect_items if item["title"] == "Bananas"]))
+        self.assertEqual(4 + len(redirect_items), len(items))
+
+
+class TestRedirectChains(unittest.TestCase):
+
+    def setUp(self):
+        # A -> B -> C, D -> B, Old -> Apple (the latest revision points to Pear), X -> Y -> Z -> X, Self -> Self, W -> X
+        self.title_map = {"": [(1, "C"), (1, "Pear"), (1, "Apple")], "B": [(1, "A"), (1, "D")], "C": [(1, "B")],
+                          "Apple": [(1, "Old"), (1, "Apple")], "Pear": [(2, "Old")], "Y": [(1, "X")], "Z": [(1, "Y")],
+                          "X": [(1, "Z"), (1, "W")], "Self": [(1, "Self")], "Missing": [(1, "Dangling")]}
+        self.page_titles = {"C", "Pear", "Apple"}
+
+    def test_resolve(self):
+        canonical, cycles = resolve_redirect_chains(self.title_map, lambda title: title in self.page_titles)
+        self.assertEqual({"A": "C", "B": "C", "D": "C", "Old": "Pear", "Dangling": "Missing",
+                          "X": None, "Y": None, "Z": None, "W": None, "Self": None}, canonical)
+        self.assertEqual([{"X", "Y", "Z"}, {"Self"}], sorted([set(cycle) for cycle in cycles], key=len, reverse=True))
+
+    def test_flatten_and_add(self):
+        canonical, _ = resolve_redirect_chains(self.title_map, lambda title: title in self.page_titles)
+        flat_title_map = flatten_redirects(self.title_map, canonical)
+        self.assertEqual({(1, "A"), (1, "D"), (1, "B")}, set(flat_title_map["C"]))
+        self.assertNotIn("", flat_title_map)
+        self.assertFalse(any(title in flat_title_map for title in ["X", "Y", "Z", "Self"]))
+        wikititle2item = {"C": {("Q3", "3", "C", "c", "C"): None}}
+        add_redirects(flat_title_map, wikititle2item)
+        self.assertEqual({"C", "A", "B", "D"}, set(item[2] for item in wikititle2item["C"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import shutil
+import tempfile
+import unittest
+
+from bootleg_data_prep.utils.classes.type_hierarchy import TypeHierarchy
+
+
+class TestTypeHierarchy(unittest.TestCase):
+
+    def setUp(self):
+        # T1 <- T2 <- T3 and T2 <- T4; T5 <-> T6 is a cycle below T1; T7 is unused by entities
+        self.subclass_edges = [("T2", "T1"), ("T3", "T2"), ("T4", "T2"), ("T5", "T6"), ("T6", "T5"), ("T6", "T1"),
+                               ("T8", "T7"), ("T3", "T3")]
+        self.entity_types = {"Q1": ["T3"], "Q2": ["T4", "T5"], "Q3": ["T1"], "Q4": ["T9"], "Q5": ["T5"]}
+        self.true_ancestors = {"T1": {"T1"}, "T2": {"T1", "T2"}, "T3": {"T1", "T2", "T3"}, "T4": {"T1", "T2", "T4"},
+                               "T5": {"T1", "T5", "T6"}, "T6": {"T1", "T5", "T6"}, "T9": {"T9"}}
+        self.type_hierarchy = TypeHierarchy(subclass_edges=self.subclass_edges, entity_types=self.entity_types)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def check_hierarchy(self, type_hierarchy):
+        self.assertEqual(set(self.true_ancestors), set(type_hierarchy.get_type_qid(t) for t in range(type_hierarchy.num_types)))
+        for type_qid, ancestors in self.true_ancestors.items():
+            type_id = type_hierarchy.get_type_ids([type_qid])[0]
+            self.assertEqual(ancestors, set(type_hierarchy.get_type_qid(t) for t in type_hierarchy.get_ancestors(type_id)))
+
+        qids = list(self.entity_types) + ["Q100"]
+        eids = type_hierarchy.get_eids(qids)
+        for type_qid in self.true_ancestors:
+            type_id = type_hierarchy.get_type_ids([type_qid])[0]
+            true_is_a = [any(type_qid in self.true_ancestors[t] for t in self.entity_types.get(qid, [])) for qid in qids]
+            self.assertEqual(true_is_a, type_hierarchy.is_a(eids, type_id).tolist())
+        # types outside the hierarchy
+        self.assertEqual([False] * len(qids), type_hierarchy.is_a(eids, type_hierarchy.get_type_ids(["T7"])[0]).tolist())
+
+    def test_closure(self):
+        self.check_hierarchy(self.type_hierarchy)
+
+    def test_dump_load(self):
+        self.type_hierarchy.dump(self.temp_dir)
+        self.check_hierarchy(TypeHierarchy(load_dir=self.temp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()